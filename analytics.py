@@ -0,0 +1,95 @@
+"""
+Time-series helpers for the dashboard.
+
+Series are aggregated per day/week/month in SQL (`db.get_period_series`);
+anything still longer than the chart budget is downsampled here with
+Largest-Triangle-Three-Buckets, which keeps peaks and dips visible while
+sending only a few hundred points per trace to the browser.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+import database as db
+
+SERIES = {
+    "sales": "Sales",
+    "expenses": "Expenses",
+    "gst_collected": "GST Collected",
+    "itc": "ITC Available",
+    "net_payable": "Net GST Payable",
+}
+
+# Finest grain that stays readable for a range of this many days
+AUTO_GRAIN = [(120, "day"), (900, "week")]
+
+
+def pick_grain(start, end):
+    """'day' for a few months, 'week' up to ~2.5 years, 'month' beyond."""
+    if not start or not end:
+        return "month"
+    days = (end - start).days
+    for limit, grain in AUTO_GRAIN:
+        if days <= limit:
+            return grain
+    return "month"
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    `x` and `y` are equal-length numeric arrays sorted by x. The first and
+    last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    # Bucket edges over the interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket)
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df, column, max_points=300):
+    """(periods, values) for one series of a period DataFrame, at most `max_points` long."""
+    periods = df["period"].to_numpy()
+    values = df[column].to_numpy(dtype=float)
+    if len(df) <= max_points:
+        return periods, values
+    x = np.array([date.fromisoformat(p).toordinal() for p in periods], dtype=float)
+    keep = lttb(x, values, max_points)
+    return periods[keep], values[keep]
+
+
+def dashboard_series(grain=None, start=None, end=None, columns=tuple(SERIES), max_points=300):
+    """
+    {"grain", "points", "series": {column: (periods, values)}} ready for plotting.
+    `points` is the number of aggregated periods before downsampling.
+    """
+    grain = grain or pick_grain(start, end)
+    df = db.get_period_series(grain, start, end)
+    return {
+        "grain": grain,
+        "points": len(df),
+        "series": {col: downsample(df, col, max_points) for col in columns},
+    }
+
+
+def range_start(years, today=None):
+    """First day of the window covering the last `years` years (None for all time)."""
+    if not years:
+        return None
+    today = today or date.today()
+    return today - timedelta(days=int(365.25 * years))
@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
+import plotly.graph_objects as go
+from datetime import date
 import database as db
+import analytics
+import gstin
+import entity_selector
 
 st.set_page_config(page_title="AI-Accountant", page_icon="📊", layout="wide")
 
@@ -26,20 +31,60 @@ if st.button("Logout"):
     st.session_state['authentication_status'] = False
     st.rerun()
 
+entity = entity_selector.sidebar()
+
+with st.sidebar.expander("🏢 Business Profile"):
+    business_gstin = st.text_input("Your GSTIN", value=entity["gstin"] or "", key=f"gstin_{entity['id']}",
+                                   help="Decides intra- vs inter-state tax from each party's GSTIN.")
+    business_name = st.text_input("Business Name", value=entity["name"], key=f"name_{entity['id']}")
+    business_address = st.text_input("Address", value=entity["address"] or "", key=f"address_{entity['id']}",
+                                     help="Printed on invoice PDFs and e-invoices.")
+    c1, c2 = st.columns(2)
+    business_city = c1.text_input("City", value=entity["city"] or "", key=f"city_{entity['id']}")
+    business_pin = c2.text_input("PIN Code", value=entity["pin"] or "", key=f"pin_{entity['id']}")
+    if st.button("Save Profile"):
+        check = gstin.validate(business_gstin)
+        if not business_name.strip():
+            st.error("Business Name is required.")
+        elif check["valid"]:
+            db.update_entity(entity["id"], gstin=check["gstin"], name=business_name.strip(),
+                             address=business_address.strip(), city=business_city.strip(), pin=business_pin.strip())
+            st.success(f"Saved ({check['state']}).")
+        else:
+            st.error(f"GSTIN looks wrong: {check['error']}.")
+    if entity["shard"]:
+        st.caption(f"🗄️ Books kept in `{entity['shard']}`")
+    elif st.button("Move to own database file", help="Separate file: no lock contention with other businesses, "
+                                                      "and it can be backed up on its own."):
+        db.move_entity_to_shard(entity["id"])
+        st.rerun()
+
+with st.sidebar.expander("➕ Add Business"):
+    new_name = st.text_input("Business Name", key="new_entity_name")
+    new_gstin = st.text_input("GSTIN", key="new_entity_gstin")
+    new_sharded = st.checkbox("Keep in its own database file", value=True, key="new_entity_sharded")
+    if st.button("Add Business"):
+        check = gstin.validate(new_gstin)
+        if not new_name.strip():
+            st.error("Business Name is required.")
+        elif new_gstin and not check["valid"]:
+            st.error(f"GSTIN looks wrong: {check['error']}.")
+        else:
+            st.session_state.entity_id = db.add_entity(new_name.strip(), check["gstin"] or None, sharded=new_sharded)
+            st.rerun()
+
 st.title("📊 AI-Accountant for Startups")
 
-# Fetch data
-invoices = db.get_invoices()
-expenses = db.get_expenses()
+# Totals are aggregated in SQL; only the five most recent rows are loaded
+totals = db.get_gst_totals()
+invoices = db.get_invoices(limit=5)
+expenses = db.get_expenses(limit=5)
 
 # Metrics
-total_sales = invoices['total_amount'].sum() if not invoices.empty else 0
-total_gst_collected = (invoices['igst'].sum() + invoices['cgst'].sum() + invoices['sgst'].sum()) if not invoices.empty else 0
-
-total_expenses = expenses['total_amount'].sum() if not expenses.empty else 0
-total_itc_available = (expenses['igst'].sum() + expenses['cgst'].sum() + expenses['sgst'].sum()) if not invoices.empty else 0
-
-net_tax_payable = max(0, total_gst_collected - total_itc_available)
+total_sales = totals["sales_total"]
+total_gst_collected = totals["gst_collected"]
+total_expenses = totals["expenses_total"]
+net_tax_payable = totals["net_payable"]
 
 # Dashboard Columns
 col1, col2, col3, col4 = st.columns(4)
@@ -53,6 +98,60 @@ with col3:
 with col4:
     st.metric(label="Net GST Payable", value=f"₹ {net_tax_payable:,.2f}", delta_color="inverse")
 
+# Every business at a glance; each database file is queried in parallel
+if len(db.get_entities()) > 1:
+    with st.expander("🏢 All Businesses"):
+        overview = db.get_entity_overview()
+        st.dataframe(overview.drop(columns=["id"]), hide_index=True, use_container_width=True)
+
+st.markdown("---")
+
+# Trends
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_trends(grain, start, entity_id, generation):
+    # `entity_id` and `generation` are only part of the cache key: the query reads the current entity,
+    # and any ledger write invalidates the series
+    return analytics.dashboard_series(grain=grain, start=start, end=date.today())
+
+st.subheader("📈 Trends")
+t1, t2 = st.columns(2)
+with t1:
+    window = st.selectbox("Range", ["Last 12 months", "Last 3 years", "Last 5 years", "All time"], index=0)
+with t2:
+    grain_choice = st.selectbox("Group by", ["Auto", "Month", "Week", "Day"], index=0)
+
+years = {"Last 12 months": 1, "Last 3 years": 3, "Last 5 years": 5, "All time": None}[window]
+grain = None if grain_choice == "Auto" else grain_choice.lower()
+trends = load_trends(grain, analytics.range_start(years), entity['id'], db.get_write_generation())
+
+def trend_chart(columns, kind="line"):
+    fig = go.Figure()
+    for col in columns:
+        periods, values = trends["series"][col]
+        label = analytics.SERIES[col]
+        if kind == "bar":
+            fig.add_trace(go.Bar(x=periods, y=values, name=label))
+        else:
+            fig.add_trace(go.Scatter(x=periods, y=values, name=label, mode="lines"))
+    fig.update_layout(height=320, margin=dict(l=10, r=10, t=30, b=10), hovermode="x unified",
+                      legend=dict(orientation="h", y=1.12), yaxis_tickprefix="₹ ")
+    st.plotly_chart(fig, use_container_width=True)
+
+if trends["points"]:
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("**Sales vs Expenses**")
+        trend_chart(["sales", "expenses"])
+    with c2:
+        st.markdown("**GST Liability vs ITC**")
+        trend_chart(["gst_collected", "itc"], kind="bar")
+    st.markdown("**Net GST Payable**")
+    trend_chart(["net_payable"])
+    unit = {"day": "daily", "week": "weekly", "month": "monthly"}[trends["grain"]]
+    st.caption(f"{trends['points']:,} {unit} periods, downsampled to at most 300 points per line.")
+else:
+    st.info("No transactions in this range yet.")
+
 st.markdown("---")
 
 # Recent Activity
@@ -61,14 +160,14 @@ c1, c2 = st.columns(2)
 with c1:
     st.subheader("Recent Invoices")
     if not invoices.empty:
-        st.dataframe(invoices[['date', 'customer_name', 'total_amount', 'invoice_no']].head(5))
+        st.dataframe(invoices[['date', 'customer_name', 'total_amount', 'invoice_no']])
     else:
         st.info("No invoices added yet.")
 
 with c2:
     st.subheader("Recent Expenses")
     if not expenses.empty:
-        st.dataframe(expenses[['date', 'vendor_name', 'total_amount', 'category']].head(5))
+        st.dataframe(expenses[['date', 'vendor_name', 'total_amount', 'category']])
     else:
         st.info("No expenses added yet.")
 
@@ -0,0 +1,47 @@
+"""
+Financial-year archival for AI-Accountant
+=========================================
+Moves a closed financial year's invoices (with items and payment
+allocations) and expenses out of the live tables into a gzip-compressed
+SQLite file under `archives/`, keeping the year's totals in the live
+database. Dashboard totals read those totals; date-range reports and the
+assistant attach an archive only when their range reaches into that year.
+
+Usage:
+    python archive.py 2023-24              # Archive FY 2023-24 of the default business
+    python archive.py 2023-24 --entity 3   # ... of business 3
+    python archive.py --list               # List archived years
+"""
+
+import argparse
+import re
+import sys
+
+import database as db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive closed financial years.", epilog=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fy", nargs="?", help="Financial year to archive (e.g. 2023-24)")
+    parser.add_argument("--entity", type=int, default=db.DEFAULT_ENTITY, help="Business (entity) id")
+    parser.add_argument("--list", action="store_true", help="List archived years")
+    args = parser.parse_args()
+
+    db.init_db()
+    db.set_current_entity(args.entity)
+    if args.list:
+        years = db.get_archived_years()
+        if years.empty:
+            print("No archived years.")
+        for row in years.itertuples():
+            print(f"  FY {row.fy}  |  {row.invoice_count} invoices, {row.expense_count} expenses  |  {row.path}")
+    elif args.fy and re.fullmatch(r"\d{4}-\d{2}", args.fy):
+        try:
+            path = db.archive_year(args.fy)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"🗃️ Archived FY {args.fy} for entity {args.entity} → {path}")
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,78 @@
+"""
+In-memory ring buffer for screenshots and other bot artifacts.
+
+Each bot session keeps its recent artifacts in memory under a byte budget
+(oldest evicted first), so the Autopilot chat can render them inline
+without touching disk. Optionally every artifact is also written to a
+per-run directory by a background thread, off the automation's path.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS_DIR = os.path.join(PROJECT_DIR, "artifacts")
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "text/html": "html"}
+
+
+class ArtifactStore:
+    def __init__(self, max_bytes=16 * 1024 * 1024, persist=False, run_dir=None):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items = OrderedDict()  # id -> artifact dict, oldest first
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.run_dir = None
+        self._writer = None
+        if persist:
+            self.run_dir = run_dir or os.path.join(ARTIFACTS_DIR, datetime.now().strftime("%Y%m%d_%H%M%S"))
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer")
+
+    def add(self, data, label="screenshot", mime="image/jpeg"):
+        """Store bytes and return the artifact's id. Evicts the oldest artifacts over budget."""
+        with self._lock:
+            artifact_id = self._next_id
+            self._next_id += 1
+            artifact = {"id": artifact_id, "label": label, "mime": mime, "data": data,
+                        "size": len(data), "time": datetime.now()}
+            self._items[artifact_id] = artifact
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self._items) > 1:
+                _, old = self._items.popitem(last=False)
+                self.total_bytes -= old["size"]
+        if self._writer:
+            self._writer.submit(self._write, artifact)
+        return artifact_id
+
+    def get(self, artifact_id):
+        """The artifact dict, or None if it has been evicted."""
+        with self._lock:
+            return self._items.get(artifact_id)
+
+    def latest(self, label=None):
+        with self._lock:
+            for artifact in reversed(self._items.values()):
+                if label is None or artifact["label"] == label:
+                    return artifact
+        return None
+
+    def __len__(self):
+        return len(self._items)
+
+    def _write(self, artifact):
+        os.makedirs(self.run_dir, exist_ok=True)
+        ext = EXTENSIONS.get(artifact["mime"], "bin")
+        safe_label = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in artifact["label"])
+        path = os.path.join(self.run_dir, f"{artifact['id']:04d}_{safe_label}.{ext}")
+        with open(path, "wb") as f:
+            f.write(artifact["data"])
+
+    def close(self):
+        """Finish pending disk writes."""
+        if self._writer:
+            self._writer.shutdown(wait=True)
+            self._writer = None
@@ -0,0 +1,139 @@
+"""
+Chat log and agent state machine for the GST Autopilot page.
+
+`ChatLog` keeps only the most recent messages in memory (a ring buffer, so
+every rerun renders a constant amount) and writes every message to the
+`autopilot_events` table, from where older pages are loaded on demand.
+
+`AgentStateMachine` replaces ad-hoc state juggling in the page: every
+worker event or user action is a named transition, and the action awaiting
+the user's "yes" is carried explicitly instead of being guessed from the
+text of recent messages.
+"""
+
+import uuid
+from collections import deque
+
+import database as db
+
+
+class ChatLog:
+    def __init__(self, session_id=None, capacity=100, page_size=50):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.messages = deque(maxlen=capacity)
+        self.page_size = page_size
+        self.older_pages = []  # pages loaded from the DB, most recent page first
+
+    def append(self, role, content, artifact_id=None):
+        self.extend([(role, content, artifact_id)])
+
+    def extend(self, entries):
+        """Persist [(role, content, artifact_id), ...] in one transaction and buffer them."""
+        if not entries:
+            return
+        ids = db.add_autopilot_events(self.session_id, entries)
+        for event_id, (role, content, artifact_id) in zip(ids, entries):
+            self.messages.append({"id": event_id, "role": role, "content": content, "artifact_id": artifact_id})
+
+    def _oldest_id(self):
+        if self.older_pages:
+            return self.older_pages[-1][0]["id"] if self.older_pages[-1] else None
+        return self.messages[0]["id"] if self.messages else None
+
+    def load_older(self):
+        """Fetch the page of messages before everything shown so far. Returns False at the start."""
+        oldest = self._oldest_id()
+        if oldest is None:
+            return False
+        page = db.get_autopilot_events(self.session_id, before_id=oldest, limit=self.page_size)
+        if not page:
+            return False
+        self.older_pages.append(page)
+        return True
+
+    def forget_older(self):
+        self.older_pages = []
+
+    def visible(self):
+        """Messages to render, oldest first: any paged-in history, then the ring buffer."""
+        for page in reversed(self.older_pages):
+            yield from page
+        yield from self.messages
+
+
+# What a "yes" does after each command's confirmation question
+CONFIRM_ACTIONS = {
+    "file_gstr1": "submit_gstr1",
+    "file_gstr3b": "submit_gstr3b",
+    "make_payment": None,  # the user completes payment in the browser
+}
+# Commands whose question is an OTP prompt
+OTP_COMMANDS = {"submit_gstr1", "submit_gstr3b"}
+
+
+class AgentStateMachine:
+    """
+    States: idle → working → logging_in → active ⇄ working → waiting_confirm / waiting_otp.
+
+    `transition(event)` applies an event if the table allows it from the
+    current state and returns True when the state changed.
+    """
+
+    TRANSITIONS = {
+        # event: ({allowed source states} or None for any, target state)
+        "launch": ({"idle"}, "working"),
+        "login_page_ready": ({"working"}, "logging_in"),
+        "logged_in": ({"logging_in", "working"}, "active"),
+        "send": ({"logging_in", "active", "waiting_confirm", "waiting_otp"}, "working"),
+        "ask_confirm": ({"working"}, "waiting_confirm"),
+        "ask_otp": ({"working"}, "waiting_otp"),
+        "done": ({"working"}, "active"),
+        "failed": ({"working", "waiting_confirm", "waiting_otp"}, "active"),
+        "cancel": ({"waiting_confirm"}, "active"),
+        "stopping": (None, "working"),
+        "stopped": (None, "idle"),
+    }
+
+    def __init__(self):
+        self.state = "idle"
+        self.current_command = None  # command whose result we are waiting for
+        self.pending_action = None   # command to run when the user confirms
+
+    def transition(self, event):
+        sources, target = self.TRANSITIONS[event]
+        if sources is not None and self.state not in sources:
+            return False
+        changed = self.state != target
+        self.state = target
+        if target in ("active", "idle"):
+            self.current_command = None
+        if target != "waiting_confirm":
+            self.pending_action = None
+        return changed
+
+    def send(self, command):
+        """A command was queued on the worker."""
+        self.current_command = command
+        return self.transition("send")
+
+    def on_question(self, command):
+        if command in OTP_COMMANDS:
+            return self.transition("ask_otp")
+        changed = self.transition("ask_confirm")
+        self.pending_action = CONFIRM_ACTIONS.get(command)
+        return changed
+
+    def on_result(self, command):
+        """A command finished without asking anything."""
+        if command == self.current_command and self.state == "working":
+            return self.transition("done")
+        return False
+
+    def confirm(self):
+        """User said yes: returns the command to run next (or None) and leaves the confirm state."""
+        action = self.pending_action
+        if action:
+            self.send(action)
+        else:
+            self.transition("cancel")
+        return action
@@ -3,11 +3,15 @@ Version Recovery System for AI-Accountant
 ==========================================
 Run this script to create a timestamped backup of all working code files.
 Each backup is stored in the `backups/` directory with a version number.
+Data backups copy the main database, every entity shard and the archived
+years (or just one entity's files) into `backups/data_<timestamp>/`.
 
 Usage:
     python backup.py              # Create a new backup
     python backup.py --list       # List all available backups
     python backup.py --restore 3  # Restore backup version 3
+    python backup.py --data       # Back up the main database and all shards
+    python backup.py --data 12    # Back up only entity 12's database file
 """
 
 import shutil
@@ -25,6 +29,23 @@ INCLUDE_FILES = [
     "app.py",
     "database.py",
     "gst_automation.py",
+    "bot_worker.py",
+    "portal_network.py",
+    "selector_registry.py",
+    "bot_policy.py",
+    "artifact_store.py",
+    "autopilot_state.py",
+    "query_engine.py",
+    "analytics.py",
+    "tax_engine.py",
+    "reconciliation.py",
+    "gstin.py",
+    "bank_import.py",
+    "invoice_pdf.py",
+    "einvoice.py",
+    "entity_selector.py",
+    "archive.py",
+    "retrieval.py",
     "requirements.txt",
 ]
 INCLUDE_DIRS = [
@@ -36,6 +57,10 @@ EXCLUDE = [
     "backups",
     ".git",
     "bookkeeper.db",
+    ".portal_cache",
+    "invoice_pdfs",
+    "shards",
+    "archives",
 ]
 
 
@@ -90,6 +115,37 @@ def create_backup():
     return version_num
 
 
+def backup_data(entity_id=None):
+    import database as db
+
+    backup_path = os.path.join(BACKUP_DIR, f"data_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(backup_path, exist_ok=True)
+    entities = db.get_entities()
+    if entity_id is not None:
+        entities = entities[entities["id"] == entity_id]
+        if entities.empty:
+            print(f"❌ Entity {entity_id} not found.")
+            return
+        targets = {entity_id: db.db_path(entity_id)}
+    else:
+        # The main file, then each shard; entities without a shard live in the main file
+        targets = {None: db.DB_NAME, **{row.id: db.db_path(row.id) for row in entities.itertuples()
+                                        if db.db_path(row.id) != db.DB_NAME}}
+    for target_id, path in targets.items():
+        dest = os.path.join(backup_path, os.path.basename(path))
+        db.backup_database(dest, target_id)
+        print(f"  ✅ Backed up: {path}")
+    # Archived years are immutable compressed files; copy them as they are
+    if os.path.isdir(db.ARCHIVE_DIR):
+        prefix = f"entity_{entity_id}_" if entity_id is not None else "entity_"
+        for name in sorted(os.listdir(db.ARCHIVE_DIR)):
+            if name.startswith(prefix) and name.endswith(".db.gz"):
+                os.makedirs(os.path.join(backup_path, db.ARCHIVE_DIR), exist_ok=True)
+                shutil.copy2(os.path.join(db.ARCHIVE_DIR, name), os.path.join(backup_path, db.ARCHIVE_DIR))
+                print(f"  ✅ Backed up: {db.ARCHIVE_DIR}/{name}")
+    print(f"\n🎉 Data backup created: {backup_path}")
+
+
 def list_backups():
     versions = load_versions()
     if not versions["versions"]:
@@ -156,6 +212,12 @@ if __name__ == "__main__":
     if len(sys.argv) == 1:
         print("\n📸 Creating backup...")
         create_backup()
+    elif sys.argv[1] == "--data":
+        if len(sys.argv) == 3 and not sys.argv[2].isdigit():
+            print("Please provide a valid entity id.")
+        else:
+            print("\n🗄️ Backing up data...")
+            backup_data(int(sys.argv[2]) if len(sys.argv) == 3 else None)
     elif sys.argv[1] == "--list":
         list_backups()
     elif sys.argv[1] == "--restore" and len(sys.argv) == 3:
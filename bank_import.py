@@ -0,0 +1,284 @@
+"""
+Bank statement import and auto-matching.
+
+Statements (CSV or OFX) are read as a stream of transactions and stored in
+chunks, so a file with tens of thousands of lines never sits in memory as
+a whole. Each statement line gets a fingerprint, so importing the same
+statement twice adds nothing.
+
+Matching is done in memory per pass:
+  * credits against open invoices (by outstanding balance), and
+  * debits against expenses not yet matched (by total amount).
+Candidates come from a hash index keyed by amount in paise. Each
+candidate is then kept only if its date falls in the window, and scored
+on how well the party name (and invoice number) appear in the bank
+narration. A clear winner is matched directly; a credit matched to an
+invoice is booked as a payment. Anything ambiguous goes to the review
+queue with its candidates.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import database as db
+
+CHUNK_SIZE = 5000
+
+# Days a match may sit from the bank date: (before, after) the ledger date
+DATE_WINDOWS = {"credit": (-3, 120), "debit": (-10, 45)}
+AUTO_MATCH_SCORE = 0.6  # minimum score for the best candidate
+AUTO_MATCH_MARGIN = 0.3  # ...and its lead over the runner-up
+
+# Narration words that say nothing about the counterparty
+NOISE_WORDS = {
+    "NEFT", "RTGS", "IMPS", "UPI", "TRF", "TRANSFER", "TO", "FROM", "BY", "CR", "DR", "INB", "IB", "ACH", "NACH",
+    "ECS", "CHQ", "CHEQUE", "CLG", "DEP", "PAYMENT", "PVT", "PRIVATE", "LTD", "LIMITED", "LLP", "CO", "AND",
+    "THE", "INDIA", "M/S", "MS", "REF", "BANK",
+}
+
+# Header names seen in Indian bank CSV exports, by field
+CSV_FIELDS = {
+    "date": ("date", "txn date", "transaction date", "value date", "posting date", "tran date"),
+    "description": ("description", "narration", "particulars", "remarks", "details", "transaction details"),
+    "reference": ("reference", "ref no", "chq/ref no", "chq / ref no.", "cheque no", "ref no./cheque no.", "utr"),
+    "debit": ("debit", "withdrawal", "withdrawal amt", "withdrawal amount", "debit amount", "dr"),
+    "credit": ("credit", "deposit", "deposit amt", "deposit amount", "credit amount", "cr"),
+    "amount": ("amount", "transaction amount", "txn amount"),
+    "type": ("type", "dr/cr", "cr/dr", "transaction type"),
+}
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y", "%d-%b-%Y", "%d %b %Y", "%d-%b-%y",
+                "%d.%m.%Y")
+
+
+# ── Parsing ──────────────────────────────────────────────────────
+
+def _parse_date(value):
+    value = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_amount(value):
+    value = str(value or "").replace(",", "").replace("₹", "").strip()
+    if value in ("", "-"):
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def _header_map(header):
+    normalized = {name.strip().lower().rstrip(".").strip(): name for name in header if name}
+    mapping = {}
+    for field, names in CSV_FIELDS.items():
+        for name in names:
+            if name in normalized:
+                mapping[field] = normalized[name]
+                break
+    return mapping
+
+
+def read_csv(lines):
+    """Yield transactions from CSV text lines. Leading bank banner rows before the header are skipped."""
+    reader = csv.reader(lines)
+    mapping, header = None, None
+    for row in reader:
+        if mapping is None:
+            candidate = _header_map(row)
+            if "date" in candidate and ("amount" in candidate or "debit" in candidate or "credit" in candidate):
+                mapping, header = candidate, row
+            continue
+        record = dict(zip(header, row))
+        txn_date = _parse_date(record.get(mapping["date"]))
+        if not txn_date:
+            continue  # totals, blank and footer rows
+        if "amount" in mapping:
+            amount = _parse_amount(record.get(mapping["amount"]))
+            kind = str(record.get(mapping.get("type"), "")).strip().upper()
+            credit = kind.startswith("CR") if kind else amount > 0
+            amount = abs(amount)
+        else:
+            debit = _parse_amount(record.get(mapping.get("debit")))
+            credit_amount = _parse_amount(record.get(mapping.get("credit")))
+            credit, amount = (credit_amount > 0), (credit_amount or debit)
+        if not amount:
+            continue
+        yield {
+            "date": txn_date,
+            "description": str(record.get(mapping.get("description"), "")).strip(),
+            "reference": str(record.get(mapping.get("reference"), "")).strip() or None,
+            "amount": round(amount, 2),
+            "direction": "credit" if credit else "debit",
+        }
+
+
+OFX_TAG = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+def read_ofx(lines):
+    """Yield transactions from OFX (SGML 1.x or XML 2.x) text lines."""
+    current = None
+    for line in lines:
+        for tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                current = {}
+            elif current is not None:
+                current[tag] = value.strip()
+        if current is not None and "</STMTTRN>" in line.upper():
+            yield _ofx_transaction(current)
+            current = None
+    if current:
+        yield _ofx_transaction(current)
+
+
+def _ofx_transaction(fields):
+    amount = _parse_amount(fields.get("TRNAMT"))
+    posted = fields.get("DTPOSTED", "")[:8]
+    return {
+        "date": f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) == 8 else None,
+        "description": " ".join(filter(None, (fields.get("NAME"), fields.get("MEMO")))),
+        "reference": fields.get("CHECKNUM") or fields.get("REFNUM") or None,
+        "amount": round(abs(amount), 2),
+        "direction": "credit" if amount > 0 else "debit",
+        "fitid": fields.get("FITID"),
+    }
+
+
+def _text_lines(stream):
+    """Text lines from a path, bytes, or binary/text file object."""
+    if isinstance(stream, bytes):
+        stream = io.BytesIO(stream)
+    if isinstance(stream, str):
+        stream = open(stream, "rb")
+    if isinstance(stream, io.TextIOBase):
+        yield from stream
+        return
+    with io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="") as text:
+        yield from text
+
+
+def read_statement(stream, filename=""):
+    """Stream transactions from a CSV or OFX statement."""
+    lines = _text_lines(stream)
+    if filename.lower().endswith((".ofx", ".qfx")):
+        return read_ofx(lines)
+    return read_csv(lines)
+
+
+def import_statement(stream, filename="", account="Bank"):
+    """
+    Store a statement's transactions in chunks. Returns (read, added);
+    lines already imported earlier are skipped by fingerprint.
+    """
+    read = added = 0
+    entity_id = db.current_entity()
+    seen = defaultdict(int)
+    chunk = []
+    for txn in read_statement(stream, filename):
+        if not txn["date"] or not txn["amount"]:
+            continue
+        read += 1
+        if txn.get("fitid"):
+            key = f"{entity_id}|{account}|{txn['fitid']}"
+        else:
+            # Identical lines on the same day are told apart by their position among equals
+            base = f"{entity_id}|{account}|{txn['date']}|{txn['direction']}|{txn['amount']:.2f}|{txn['description']}|{txn['reference']}"
+            seen[base] += 1
+            key = f"{base}|{seen[base]}"
+        chunk.append(dict(txn, account=account, fingerprint=hashlib.sha1(key.encode()).hexdigest()))
+        if len(chunk) >= CHUNK_SIZE:
+            added += db.add_bank_transactions(chunk)
+            chunk = []
+    if chunk:
+        added += db.add_bank_transactions(chunk)
+    return read, added
+
+
+# ── Matching ─────────────────────────────────────────────────────
+
+def _words(text):
+    return [w for w in re.findall(r"[A-Z0-9]+", str(text or "").upper()) if w not in NOISE_WORDS and len(w) > 1]
+
+
+def name_score(party, narration):
+    """Share of the party's name words found in the narration (also inside run-together text)."""
+    words = _words(party)
+    if not words:
+        return 0.0
+    squashed = re.sub(r"[^A-Z0-9]", "", str(narration or "").upper())
+    found = sum(1 for w in words if w in squashed)
+    return found / len(words)
+
+
+class AmountIndex:
+    """Ledger rows bucketed by amount in paise, each bucket sorted by date."""
+
+    def __init__(self, rows, amount_key):
+        self.buckets = defaultdict(list)
+        for row in rows:
+            self.buckets[round(row[amount_key] * 100)].append(row)
+        for bucket in self.buckets.values():
+            bucket.sort(key=lambda r: r["date"])
+
+    def candidates(self, amount, txn_date, window):
+        before, after = window
+        lo = (txn_date - timedelta(days=after)).isoformat()
+        hi = (txn_date - timedelta(days=before)).isoformat()
+        return [r for r in self.buckets.get(round(amount * 100), ()) if lo <= r["date"] <= hi and not r.get("_used")]
+
+
+def _score(txn, row, party_key):
+    score = name_score(row[party_key], txn["description"])
+    ref = re.sub(r"[^A-Z0-9]", "", str(row.get("invoice_no") or "").upper())
+    if len(ref) >= 3 and ref in re.sub(r"[^A-Z0-9]", "", f"{txn['description']}{txn['reference'] or ''}".upper()):
+        score += 1.0  # the invoice number in the narration is the strongest signal
+    return round(score, 3)
+
+
+def match_pending():
+    """
+    Match every 'Unmatched' statement line. Returns {"matched", "review", "unmatched"} counts.
+    """
+    pending = db.get_bank_transactions(status="Unmatched")
+    if pending.empty:
+        return {"matched": 0, "review": 0, "unmatched": 0}
+
+    invoices = db.get_open_invoices()
+    expenses = db.get_unreconciled_expenses()
+    indexes = {
+        "credit": ("invoice", "customer_name", AmountIndex(invoices.to_dict("records"), "balance")),
+        "debit": ("expense", "vendor_name", AmountIndex(expenses.to_dict("records"), "total_amount")),
+    }
+
+    matches, reviews = [], []
+    for txn in pending.to_dict("records"):
+        match_type, party_key, index = indexes[txn["direction"]]
+        found = index.candidates(txn["amount"], date.fromisoformat(txn["date"]), DATE_WINDOWS[txn["direction"]])
+        if not found:
+            continue
+        scored = sorted(((_score(txn, row, party_key), row) for row in found), key=lambda s: s[0], reverse=True)
+        best_score, best = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if best_score >= AUTO_MATCH_SCORE and best_score - runner_up >= AUTO_MATCH_MARGIN:
+            best["_used"] = True  # one bank line per invoice/expense
+            matches.append((txn["id"], match_type, best["id"], best_score))
+        else:
+            reviews.append((txn["id"], json.dumps([
+                {"type": match_type, "id": row["id"], "score": score, "date": row["date"],
+                 "party": row[party_key], "ref": row.get("invoice_no")}
+                for score, row in scored[:5]
+            ])))
+
+    db.save_bank_matches(matches, reviews)
+    return {"matched": len(matches), "review": len(reviews), "unmatched": len(pending) - len(matches) - len(reviews)}
@@ -0,0 +1,223 @@
+"""
+Retry, time-budget and circuit-breaker policy for GSTBot steps.
+
+Every portal step (click SEARCH, fill OTP, ...) runs through
+`PolicyEngine.run`, which:
+  * retries failed attempts with exponential backoff and jitter,
+  * shrinks the step timeout to what is left of the current flow's budget,
+  * trips a circuit breaker when most recent steps are failing, so a
+    degraded portal aborts the flow in seconds instead of burning every
+    timeout in it.
+
+Required steps (selecting the FY, saving an invoice, ...) raise
+`StepFailed` instead of returning False, so a flow cannot carry on and
+submit a half-filled return.
+"""
+
+import functools
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class FlowAborted(Exception):
+    """The current flow cannot continue."""
+
+
+class StepFailed(FlowAborted):
+    pass
+
+
+class BudgetExhausted(FlowAborted):
+    pass
+
+
+class CircuitOpen(FlowAborted):
+    pass
+
+
+class StepPolicy:
+    def __init__(self, retries=2, timeout=10000, base_delay=1.0, max_delay=8.0, required=False):
+        self.retries = retries
+        self.timeout = timeout  # ms, upper bound per attempt
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.required = required
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(cap / 2, cap)
+
+
+DEFAULT_POLICY = StepPolicy()
+
+# Per-step overrides; keys are selector-registry actions or step names used by GSTBot
+STEP_POLICIES = {
+    "select_fy": StepPolicy(retries=2, timeout=8000, required=True),
+    "select_period": StepPolicy(retries=2, timeout=8000, required=True),
+    "search": StepPolicy(retries=2, required=True),
+    "prepare_online": StepPolicy(retries=1),  # caller falls back to the direct URL
+    "b2b_section": StepPolicy(retries=2, required=True),
+    "b2c_section": StepPolicy(retries=2, required=True),
+    "add_details": StepPolicy(retries=2, required=True),
+    "save": StepPolicy(retries=1),  # the filing journal decides what a failed SAVE means
+    "preview": StepPolicy(retries=2, required=True),
+    "confirm": StepPolicy(retries=2, required=True),
+    "submit": StepPolicy(retries=1, timeout=15000, required=True),
+    "file_with_evc": StepPolicy(retries=1, timeout=15000, required=True),
+    "otp_input": StepPolicy(retries=1, required=True),
+    "verify": StepPolicy(retries=0, timeout=15000, required=True),
+    "captcha": StepPolicy(retries=0, timeout=5000),
+}
+
+# Overall time budget per flow, seconds
+FLOW_BUDGETS = {
+    "login": 120,
+    "get_notifications": 120,
+    "file_gstr1": 3600,
+    "submit_gstr1": 180,
+    "file_gstr3b": 600,
+    "submit_gstr3b": 180,
+    "confirm_otp": 120,
+    "make_payment": 300,
+}
+
+
+class CircuitBreaker:
+    """Opens when the recent step failure rate is high; half-opens after a cool-down."""
+
+    def __init__(self, window=10, min_samples=5, failure_ratio=0.6, consecutive_limit=4, cooldown=60):
+        self.outcomes = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.failure_ratio = failure_ratio
+        self.consecutive_limit = consecutive_limit
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        if time.time() - self.opened_at >= self.cooldown:
+            # Half-open: let the next step through as a trial
+            return False
+        return True
+
+    def record(self, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            return
+        self.consecutive_failures += 1
+        failures = self.outcomes.count(False)
+        if (self.consecutive_failures >= self.consecutive_limit or
+                (len(self.outcomes) >= self.min_samples and
+                 failures / len(self.outcomes) >= self.failure_ratio)):
+            self.opened_at = time.time()
+
+    def half_open(self):
+        """End the cool-down early: the next step goes through as a trial, and a failure reopens."""
+        if self.opened_at is not None:
+            self.opened_at = time.time() - self.cooldown
+
+    def reset(self):
+        self.outcomes.clear()
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+
+class PolicyEngine:
+    def __init__(self, policies=None, budgets=None, breaker=None, log=None, min_timeout=1000):
+        self.policies = STEP_POLICIES if policies is None else policies
+        self.budgets = FLOW_BUDGETS if budgets is None else budgets
+        self.breaker = breaker or CircuitBreaker()
+        self.log = log or (lambda message: None)
+        self.min_timeout = min_timeout
+        self.flow_name = None
+        self.deadline = None
+
+    @contextmanager
+    def flow(self, name, budget=None):
+        """Run a block under the time budget for flow `name`."""
+        budget = budget if budget is not None else self.budgets.get(name)
+        if self.flow_name is None:
+            # A new top-level flow (often the user's retry) gets a trial step instead of
+            # failing at once on the breaker left open by the previous flow
+            self.breaker.half_open()
+        outer = (self.flow_name, self.deadline)
+        self.flow_name = name
+        if budget:
+            # A nested flow never extends the outer flow's deadline
+            deadline = time.time() + budget
+            self.deadline = min(deadline, self.deadline) if self.deadline else deadline
+        try:
+            yield self
+        finally:
+            self.flow_name, self.deadline = outer
+
+    def remaining(self):
+        """Seconds left in the current flow budget (None when no flow is running)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def step_timeout(self, policy, timeout=None):
+        """Per-attempt timeout in ms, shrunk so the remaining attempts fit in the budget."""
+        timeout = timeout or policy.timeout
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise BudgetExhausted(f"{self.flow_name} ran out of its time budget")
+        share = remaining * 1000 / (policy.retries + 1)
+        return int(max(self.min_timeout, min(timeout, share)))
+
+    def run(self, step, attempt, timeout=None, required=None):
+        """
+        Call `attempt(timeout_ms)` until it returns truthy or the retries run out.
+        Returns the attempt's result, or False. Raises FlowAborted subclasses when
+        the circuit is open, the budget is spent, or a required step failed.
+        """
+        policy = self.policies.get(step, DEFAULT_POLICY)
+        required = policy.required if required is None else required
+        last_error = None
+
+        for n in range(policy.retries + 1):
+            if self.breaker.is_open:
+                raise CircuitOpen(f"Portal looks degraded (too many failed steps); stopped at `{step}`")
+            if n:
+                delay = policy.backoff(n)
+                remaining = self.remaining()
+                if remaining is not None and remaining <= delay:
+                    break
+                self.log(f"🔁 Retrying `{step}` in {delay:.1f}s (attempt {n + 1}/{policy.retries + 1})...")
+                time.sleep(delay)
+            try:
+                result = attempt(self.step_timeout(policy, timeout))
+            except FlowAborted:
+                raise
+            except Exception as e:
+                result, last_error = False, e
+            self.breaker.record(bool(result))
+            if result:
+                return result
+
+        if required:
+            detail = f": {last_error}" if last_error else ""
+            raise StepFailed(f"Required step `{step}` failed after {policy.retries + 1} attempts{detail}")
+        return False
+
+
+def policed_flow(name):
+    """Method decorator: run the method under the flow budget `name` of `self.policy`."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.policy.flow(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,130 @@
+"""
+Background worker for GSTBot.
+
+Playwright's sync API must be driven from the thread that started it, so the
+worker owns the GSTBot on a dedicated thread. The UI sends commands over a
+queue and reads back a stream of events:
+
+    {"type": "log",      "command": ..., "content": "<chat message>"}
+    {"type": "progress", "command": ..., "content": {"label", "done", "total"}}
+    {"type": "question", "command": ..., "content": "<question text>"}
+    {"type": "artifact", "command": ..., "content": {"id", "label"}}  (bytes stay in `artifacts`)
+    {"type": "result",   "command": ..., "content": <return value>}
+    {"type": "error",    "command": ..., "content": "<error text>"}
+    {"type": "stopped",  "command": None, "content": None}
+"""
+
+import contextvars
+import queue
+import threading
+import time
+
+from gst_automation import GSTBot
+from artifact_store import ArtifactStore
+
+_STOP = "__stop__"
+
+
+class BotWorker:
+    def __init__(self, headless=False, artifact_store=None, **bot_options):
+        self.headless = headless
+        # Shared with the bot so the UI can render screenshots straight from memory
+        self.artifacts = artifact_store if artifact_store is not None else ArtifactStore()
+        # Extra GSTBot keyword arguments (e.g. network_policy)
+        self.bot_options = bot_options
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.current_command = None
+        self.last_progress = None
+        # Handed to the bot; an interrupt applies to every command submitted before it
+        self.interrupt_event = threading.Event()
+        self._submitted = 0
+        self._interrupted_upto = 0
+        self._bot = None
+        self._thread = threading.Thread(target=self._run, name="gst-bot-worker", daemon=True)
+
+    # ── UI side ─────────────────────────────────────────────────────
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, command, *args, **kwargs):
+        """Queue a GSTBot method call, e.g. submit("file_gstr1", fy, period, df).
+        It runs in a copy of the caller's context, so it uses the caller's current entity."""
+        self._submitted += 1
+        self.commands.put((self._submitted, command, args, kwargs, contextvars.copy_context()))
+
+    def interrupt(self):
+        """Cut the running or an already queued wait short (currently `wait_for_login`)."""
+        self._interrupted_upto = self._submitted
+        self.interrupt_event.set()
+
+    def stop(self):
+        """Close the browser and end the worker thread after the current command."""
+        self.interrupt()
+        self._submitted += 1
+        self.commands.put((self._submitted, _STOP, (), {}, None))
+
+    def drain_events(self, max_events=500):
+        """Return all events emitted since the last call (non-blocking)."""
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    @property
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    @property
+    def is_busy(self):
+        return self.current_command is not None or not self.commands.empty()
+
+    # ── Worker thread ───────────────────────────────────────────────
+
+    def _emit(self, type, content=None):
+        self.events.put({"type": type, "command": self.current_command,
+                         "content": content, "time": time.time()})
+
+    def _on_message(self, role, message):
+        self._emit("log", message)
+
+    def _on_artifact(self, artifact_id, label):
+        self._emit("artifact", {"id": artifact_id, "label": label})
+
+    def _on_progress(self, label, done, total):
+        self.last_progress = {"label": label, "done": done, "total": total}
+        self._emit("progress", self.last_progress)
+
+    def _run(self):
+        self._bot = GSTBot(headless=self.headless, message_callback=self._on_message,
+                           progress_callback=self._on_progress, artifact_store=self.artifacts,
+                           artifact_callback=self._on_artifact, **self.bot_options)
+        self._bot.interrupt_event = self.interrupt_event
+        while True:
+            seq, command, args, kwargs, context = self.commands.get()
+            # Cleared here rather than inside the wait, so an interrupt sent while an earlier
+            # command ran still ends the wait; commands submitted after it start clean
+            if seq > self._interrupted_upto:
+                self.interrupt_event.clear()
+            if command == _STOP:
+                try:
+                    self._bot.close()
+                finally:
+                    self._emit("stopped")
+                break
+
+            self.current_command = command
+            self.last_progress = None
+            try:
+                result = context.run(getattr(self._bot, command), *args, **kwargs)
+                if self._bot.is_waiting:
+                    self._emit("question", self._bot._pending_question)
+                self._emit("result", result)
+            except Exception as e:
+                self._emit("error", f"❌ {command} failed: {e}")
+            finally:
+                self.current_command = None
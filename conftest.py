@@ -0,0 +1,22 @@
+"""
+Test setup. database.py creates and migrates `bookkeeper.db` (and the `shards/`
+and `archives/` folders) relative to the working directory as soon as it is
+imported, so tests run from a throwaway directory and never touch the tracked
+database. Being at the repo root, this file also puts the modules on sys.path.
+"""
+
+import os
+import shutil
+import tempfile
+
+_workdir = None
+
+
+def pytest_configure(config):
+    global _workdir
+    _workdir = tempfile.mkdtemp(prefix="bookkeeper-tests-")
+    os.chdir(_workdir)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_workdir, ignore_errors=True)
@@ -1,15 +1,230 @@
 import sqlite3
 import pandas as pd
 import datetime
+import calendar
+import contextvars
+import gzip
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-DB_NAME = "bookkeeper.db"
+DB_NAME = "bookkeeper.db"  # the catalog (entities, settings) and the books of entities without a shard
+SHARD_DIR = "shards"
+ARCHIVE_DIR = "archives"
+# Tables whose changes bump the write generation
+LEDGER_TABLES = ("invoices", "expenses", "notifications")
+# Columns that identify or describe a ledger row (what search matches on); see _create_edit_triggers
+_DESCRIPTIVE_COLUMNS = {
+    "invoices": ("entity_id", "date", "invoice_no", "customer_name", "gstin", "status"),
+    "expenses": ("entity_id", "date", "vendor_name", "gstin", "category", "description"),
+    "notifications": ("entity_id", "date", "type", "description", "action_required", "status"),
+}
+# Tables partitioned by business (entity); every query on them is scoped to the current entity
+ENTITY_TABLES = LEDGER_TABLES + ("payments", "bank_transactions", "gstr2b_lines", "filing_runs")
+
+DEFAULT_ENTITY = 1
+# The business being worked on; each Streamlit session (and the bot worker) sets its own
+_current_entity = contextvars.ContextVar("current_entity", default=DEFAULT_ENTITY)
+
+# entity_id -> its own database file, for entities moved to a shard; refreshed from the catalog
+_shards = {}
+
+def db_path(entity_id=None):
+    """File holding the books of `entity_id` (default: the current entity)."""
+    return _shards.get(entity_id or current_entity(), DB_NAME)
 
 def get_connection():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    """Connection to the current entity's database (its shard, or the main file)."""
+    conn = sqlite3.connect(db_path(), check_same_thread=False)
     return conn
 
-def init_db():
-    conn = get_connection()
+def _catalog_connection():
+    return sqlite3.connect(DB_NAME, check_same_thread=False)
+
+def _load_shards(rows):
+    global _shards
+    # Swapped in whole, so concurrent readers never see a half-filled map
+    _shards = {int(entity_id): shard for entity_id, shard in rows if isinstance(shard, str) and shard}
+
+def set_current_entity(entity_id):
+    _current_entity.set(int(entity_id))
+
+def current_entity():
+    return _current_entity.get()
+
+ITEM_COLUMNS = ("hsn_code", "description", "quantity", "unit", "rate", "taxable_value",
+                "gst_rate", "igst", "cgst", "sgst", "total_amount")
+
+# Add (sign=1) or remove (sign=-1) one item row's amounts in the HSN summary for `period_sql`
+_HSN_DELTA = '''
+    INSERT INTO hsn_summary (entity_id, period, hsn_code, gst_rate, unit, quantity, taxable_value, igst, cgst, sgst,
+                             total_value, item_count)
+    SELECT {entity_sql}, {period_sql}, COALESCE({row}.hsn_code, ''), COALESCE({row}.gst_rate, 0), COALESCE({row}.unit, 'OTH'),
+           {sign} * COALESCE({row}.quantity, 0), {sign} * COALESCE({row}.taxable_value, 0),
+           {sign} * COALESCE({row}.igst, 0), {sign} * COALESCE({row}.cgst, 0), {sign} * COALESCE({row}.sgst, 0),
+           {sign} * COALESCE({row}.total_amount, 0), {sign}
+    FROM {source}
+    ON CONFLICT (entity_id, period, hsn_code, gst_rate, unit) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        taxable_value = taxable_value + excluded.taxable_value,
+        igst = igst + excluded.igst,
+        cgst = cgst + excluded.cgst,
+        sgst = sgst + excluded.sgst,
+        total_value = total_value + excluded.total_value,
+        item_count = item_count + excluded.item_count;
+'''
+
+def _hsn_delta(row, sign):
+    """Delta for an invoice_items row (NEW/OLD), bucketed by its invoice's current date."""
+    return _HSN_DELTA.format(row=row, sign=sign, entity_sql="inv.entity_id", period_sql="strftime('%Y-%m', inv.date)",
+                             source=f"invoices inv WHERE inv.id = {row}.invoice_id")
+
+# Invoice header totals recomputed from its items
+_HEADER_FROM_ITEMS = '''
+    UPDATE invoices SET
+        taxable_value = (SELECT COALESCE(SUM(taxable_value), 0) FROM invoice_items WHERE invoice_id = {ref}),
+        igst = (SELECT COALESCE(SUM(igst), 0) FROM invoice_items WHERE invoice_id = {ref}),
+        cgst = (SELECT COALESCE(SUM(cgst), 0) FROM invoice_items WHERE invoice_id = {ref}),
+        sgst = (SELECT COALESCE(SUM(sgst), 0) FROM invoice_items WHERE invoice_id = {ref}),
+        total_amount = (SELECT COALESCE(SUM(total_amount), 0) FROM invoice_items WHERE invoice_id = {ref}),
+        -- One rate when all items share it; NULL for mixed-rate invoices
+        gst_rate = (SELECT CASE WHEN MIN(gst_rate) = MAX(gst_rate) THEN MIN(gst_rate) END
+                    FROM invoice_items WHERE invoice_id = {ref})
+    WHERE id = {ref};
+'''
+
+def _create_item_triggers(c):
+    """Keep invoice headers and the HSN summary in step with invoice_items, row by row."""
+    triggers = {
+        "trg_invoice_items_insert": ("AFTER INSERT ON invoice_items",
+                                     _hsn_delta("NEW", 1) + _HEADER_FROM_ITEMS.format(ref="NEW.invoice_id")),
+        "trg_invoice_items_delete": ("AFTER DELETE ON invoice_items",
+                                     _hsn_delta("OLD", -1) + _HEADER_FROM_ITEMS.format(ref="OLD.invoice_id")),
+        "trg_invoice_items_update": ("AFTER UPDATE ON invoice_items",
+                                     _hsn_delta("OLD", -1) + _hsn_delta("NEW", 1) +
+                                     _HEADER_FROM_ITEMS.format(ref="OLD.invoice_id") +
+                                     _HEADER_FROM_ITEMS.format(ref="NEW.invoice_id")),
+        # Redating an invoice moves its items to the new period
+        "trg_invoices_redate_hsn": ("AFTER UPDATE OF date ON invoices WHEN OLD.date IS NOT NEW.date",
+                                    _HSN_DELTA.format(row="it", sign=-1, entity_sql="NEW.entity_id", period_sql="strftime('%Y-%m', OLD.date)",
+                                                      source="invoice_items it WHERE it.invoice_id = NEW.id") +
+                                    _HSN_DELTA.format(row="it", sign=1, entity_sql="NEW.entity_id", period_sql="strftime('%Y-%m', NEW.date)",
+                                                      source="invoice_items it WHERE it.invoice_id = NEW.id")),
+        # Items go first, while the invoice (and its date) still exists
+        "trg_invoices_delete_items": ("BEFORE DELETE ON invoices",
+                                      "DELETE FROM invoice_items WHERE invoice_id = OLD.id;"),
+    }
+    for name, (when, body) in triggers.items():
+        # Recreated on every start, so a changed body replaces the stored one
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+        c.execute(f"CREATE TRIGGER {name} {when} BEGIN {body} END")
+
+# True when `date` of `entity` falls in a period filed with one of `types`
+_FILED_PERIOD = '''
+    EXISTS (SELECT 1 FROM filed_returns f WHERE f.entity_id = {entity} AND f.return_type IN ({types})
+            AND {date} BETWEEN f.period_start AND f.period_end)
+'''
+# Archiving moves a year's rows out (deleting items rewrites their invoice's totals on the way)
+# without changing what was filed, so rows of an archived year may be updated and deleted
+_NOT_ARCHIVED = '''
+    NOT EXISTS (SELECT 1 FROM archived_years a WHERE a.entity_id = {entity} AND {date} BETWEEN a.start_date AND a.end_date)
+'''
+# Both returns report sales; only GSTR-3B reports purchases (ITC)
+_LOCKING_RETURNS = {"invoices": "'GSTR-1', 'GSTR-3B'", "expenses": "'GSTR-3B'"}
+# Columns whose change would alter a filed return; payments and IRN acknowledgements still update
+_LOCKED_COLUMNS = {
+    "invoices": "date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount",
+    "expenses": "date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, invoice_no",
+}
+
+def _filed(table, row, via_invoice=False, archivable=False):
+    """
+    WHEN condition: `row` (NEW/OLD) of `table`, or the invoice it belongs to, is in a filed
+    period (and, when archivable, not in an archived year).
+    """
+    if via_invoice:
+        return f"EXISTS (SELECT 1 FROM invoices i WHERE i.id = {row}.invoice_id AND {_filed('invoices', 'i', archivable=archivable)})"
+    entity, date = ("i.entity_id", "i.date") if row == "i" else (f"{row}.entity_id", f"{row}.date")
+    condition = _FILED_PERIOD.format(entity=entity, date=date, types=_LOCKING_RETURNS[table])
+    return condition + (" AND " + _NOT_ARCHIVED.format(entity=entity, date=date) if archivable else "")
+
+def _create_lock_triggers(c):
+    """Reject inserts, edits and deletes that would change a filed return (sqlite3.IntegrityError)."""
+    abort = "SELECT RAISE(ABORT, 'This date falls in a filed return period, which is locked');"
+    triggers = {}
+    for table in ("invoices", "expenses"):
+        triggers[f"trg_lock_{table}_insert"] = f"BEFORE INSERT ON {table} WHEN {_filed(table, 'NEW')}"
+        triggers[f"trg_lock_{table}_update"] = (f"BEFORE UPDATE OF {_LOCKED_COLUMNS[table]} ON {table} WHEN "
+                                                f"({_filed(table, 'OLD', archivable=True)}) OR ({_filed(table, 'NEW', archivable=True)})")
+        triggers[f"trg_lock_{table}_delete"] = f"BEFORE DELETE ON {table} WHEN {_filed(table, 'OLD', archivable=True)}"
+    triggers["trg_lock_invoice_items_insert"] = (f"BEFORE INSERT ON invoice_items "
+                                                 f"WHEN {_filed('invoices', 'NEW', via_invoice=True)}")
+    triggers["trg_lock_invoice_items_update"] = (f"BEFORE UPDATE ON invoice_items "
+                                                 f"WHEN {_filed('invoices', 'OLD', via_invoice=True)} "
+                                                 f"OR {_filed('invoices', 'NEW', via_invoice=True)}")
+    triggers["trg_lock_invoice_items_delete"] = (f"BEFORE DELETE ON invoice_items "
+                                                 f"WHEN {_filed('invoices', 'OLD', via_invoice=True, archivable=True)}")
+    for name, when in triggers.items():
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+        c.execute(f"CREATE TRIGGER {name} {when} BEGIN {abort} END")
+
+# Outstanding balance and payment status of one invoice, from its total and amount paid
+_INVOICE_BALANCE = '''
+    UPDATE invoices SET
+        balance = ROUND(COALESCE(total_amount, 0) - COALESCE(amount_paid, 0), 2),
+        status = CASE
+            WHEN COALESCE(amount_paid, 0) > 0 AND COALESCE(total_amount, 0) - amount_paid <= 0.005 THEN 'Paid'
+            WHEN COALESCE(amount_paid, 0) > 0 THEN 'Partially Paid'
+            ELSE 'Unpaid'
+        END
+    WHERE id = {ref};
+'''
+
+def _create_receivable_triggers(c):
+    """Maintain invoices.amount_paid / balance / status as allocations and totals change."""
+    triggers = {
+        "trg_allocations_insert": ("AFTER INSERT ON payment_allocations",
+                                   "UPDATE invoices SET amount_paid = COALESCE(amount_paid, 0) + NEW.amount "
+                                   "WHERE id = NEW.invoice_id;" + _INVOICE_BALANCE.format(ref="NEW.invoice_id")),
+        "trg_allocations_delete": ("AFTER DELETE ON payment_allocations",
+                                   "UPDATE invoices SET amount_paid = COALESCE(amount_paid, 0) - OLD.amount "
+                                   "WHERE id = OLD.invoice_id;" + _INVOICE_BALANCE.format(ref="OLD.invoice_id")),
+        "trg_invoices_insert_balance": ("AFTER INSERT ON invoices", _INVOICE_BALANCE.format(ref="NEW.id")),
+        "trg_invoices_total_balance": ("AFTER UPDATE OF total_amount ON invoices",
+                                       _INVOICE_BALANCE.format(ref="NEW.id")),
+        # Money allocated to a deleted invoice goes back to its payment as unallocated
+        "trg_invoices_delete_allocations": ("BEFORE DELETE ON invoices", '''
+            UPDATE payments SET unallocated = unallocated + (
+                SELECT SUM(amount) FROM payment_allocations pa
+                WHERE pa.invoice_id = OLD.id AND pa.payment_id = payments.id)
+            WHERE id IN (SELECT payment_id FROM payment_allocations WHERE invoice_id = OLD.id);
+            DELETE FROM payment_allocations WHERE invoice_id = OLD.id;
+        '''),
+    }
+    for name, (when, body) in triggers.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {body} END")
+
+def _create_edit_triggers(c):
+    """
+    Bump write_generation.edits when an existing row is deleted or its descriptive columns change,
+    so readers keeping their own copy of the rows (the retrieval index) can tell appends from edits.
+    Totals and balances rewritten by the receivable/item triggers after an insert do not count.
+    """
+    _add_column(c, "write_generation", "edits", "INTEGER NOT NULL DEFAULT 0")
+    bump = "UPDATE write_generation SET edits = edits + 1 WHERE id = 1;"
+    for table, columns in _DESCRIPTIVE_COLUMNS.items():
+        changed = " OR ".join(f"OLD.{col} IS NOT NEW.{col}" for col in columns)
+        # Recreated on every start, so a changed column list replaces the stored one
+        c.execute(f"DROP TRIGGER IF EXISTS trg_{table}_update_edits")
+        c.execute(f"CREATE TRIGGER trg_{table}_update_edits AFTER UPDATE OF {', '.join(columns)} ON {table} "
+                  f"WHEN {changed} BEGIN {bump} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_edits AFTER DELETE ON {table} BEGIN {bump} END")
+
+def init_db(path=DB_NAME):
+    """Create or upgrade the schema of the main file, then of every shard listed in its catalog."""
+    conn = sqlite3.connect(path)
     c = conn.cursor()
     
     # Invoices Table (Money In)
@@ -48,6 +263,127 @@ def init_db():
         )
     ''')
 
+    # Line items of an invoice; the header's amounts are maintained from these by triggers
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER REFERENCES invoices(id),
+            hsn_code TEXT, -- HSN for goods, SAC for services
+            description TEXT,
+            quantity REAL,
+            unit TEXT, -- UQC, e.g. 'NOS', 'KGS', 'OTH'
+            rate REAL,
+            taxable_value REAL,
+            gst_rate REAL,
+            igst REAL,
+            cgst REAL,
+            sgst REAL,
+            total_amount REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id)")
+
+    # HSN-wise summary for GSTR-1 (Table 12), kept current by the invoice_items triggers.
+    # Summaries from before entities are derived data: dropped here and rebuilt below.
+    hsn_columns = {row[1] for row in c.execute("PRAGMA table_info(hsn_summary)")}
+    rebuild_hsn = bool(hsn_columns) and "entity_id" not in hsn_columns
+    if rebuild_hsn:
+        c.execute("DROP TABLE hsn_summary")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS hsn_summary (
+            entity_id INTEGER,
+            period TEXT, -- 'YYYY-MM' of the invoice date
+            hsn_code TEXT,
+            gst_rate REAL,
+            unit TEXT,
+            quantity REAL DEFAULT 0,
+            taxable_value REAL DEFAULT 0,
+            igst REAL DEFAULT 0,
+            cgst REAL DEFAULT 0,
+            sgst REAL DEFAULT 0,
+            total_value REAL DEFAULT 0,
+            item_count INTEGER DEFAULT 0,
+            PRIMARY KEY (entity_id, period, hsn_code, gst_rate, unit)
+        )
+    ''')
+
+    # Businesses (GSTINs) whose books are kept here; ledger rows carry their entity_id
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS entities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            gstin TEXT,
+            address TEXT,
+            city TEXT,
+            pin TEXT,
+            created_at TEXT
+        )
+    ''')
+
+    # Columns added after the first release
+    _add_column(c, "expenses", "invoice_no", "TEXT")  # supplier's invoice number, for GSTR-2B matching
+    _add_column(c, "invoices", "amount_paid", "REAL DEFAULT 0")
+    _add_column(c, "invoices", "balance", "REAL")  # total_amount - amount_paid, maintained by triggers
+    # Buyer address and IRP acknowledgement, for e-invoicing
+    _add_column(c, "invoices", "customer_address", "TEXT")
+    _add_column(c, "invoices", "customer_city", "TEXT")
+    _add_column(c, "invoices", "customer_pin", "TEXT")
+    _add_column(c, "invoices", "irn", "TEXT")
+    _add_column(c, "invoices", "irn_ack_no", "TEXT")
+    _add_column(c, "invoices", "irn_ack_date", "TEXT")
+    c.execute('''
+        UPDATE invoices SET amount_paid = COALESCE(amount_paid, 0),
+                            balance = ROUND(COALESCE(total_amount, 0) - COALESCE(amount_paid, 0), 2)
+        WHERE balance IS NULL
+    ''')
+
+    # Receipts from customers, allocated to invoices (partially or fully)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            customer_name TEXT,
+            amount REAL,
+            mode TEXT, -- 'Bank Transfer', 'UPI', 'Cheque', 'Cash'
+            reference TEXT,
+            unallocated REAL DEFAULT 0, -- advance not yet applied to an invoice
+            created_at TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS payment_allocations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payment_id INTEGER REFERENCES payments(id),
+            invoice_id INTEGER REFERENCES invoices(id),
+            amount REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payment_allocations_payment ON payment_allocations (payment_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payment_allocations_invoice ON payment_allocations (invoice_id)")
+    _create_receivable_triggers(c)
+
+    # Bank statement lines and what each was matched to
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bank_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account TEXT,
+            date TEXT,
+            description TEXT,
+            reference TEXT,
+            amount REAL, -- always positive; see direction
+            direction TEXT, -- 'credit' (money in) or 'debit' (money out)
+            fingerprint TEXT UNIQUE, -- de-duplicates re-imported statements
+            status TEXT DEFAULT 'Unmatched', -- 'Unmatched', 'Matched', 'Review', 'Ignored'
+            match_type TEXT, -- 'invoice' or 'expense'
+            match_id INTEGER,
+            match_score REAL,
+            candidates TEXT, -- JSON list of possible matches while in review
+            payment_id INTEGER REFERENCES payments(id),
+            imported_at TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bank_transactions_match ON bank_transactions (match_type, match_id)")
+
     # Notifications & Tasks Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS notifications (
@@ -59,67 +395,1425 @@ def init_db():
             status TEXT DEFAULT 'Pending' -- 'Pending', 'Acknowledged', 'Paid'
         )
     ''')
-    
+
+
+    # Write generation: bumped by triggers on every ledger change, used as a cache key
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS write_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute("INSERT OR IGNORE INTO write_generation (id, generation) VALUES (1, 0)")
+    for table in LEDGER_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_generation
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+                END
+            ''')
+
+    # Filing Run Journal (one row per GSTBot filing attempt)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS filing_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            return_type TEXT, -- 'GSTR-1', 'GSTR-3B'
+            fy TEXT,
+            period TEXT,
+            status TEXT DEFAULT 'In Progress', -- 'In Progress', 'Interrupted', 'Prepared', 'Filed', 'Cancelled'
+            started_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+    # Per-invoice submission status within a filing run
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS filing_run_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER REFERENCES filing_runs(id),
+            item_key TEXT, -- 'B2B:<invoice id>' or 'B2C:SUMMARY'
+            invoice_no TEXT,
+            status TEXT DEFAULT 'Pending', -- 'Pending', 'Saved', 'Failed'
+            error TEXT,
+            updated_at TEXT,
+            UNIQUE (run_id, item_key)
+        )
+    ''')
+
+    # Autopilot chat/event log (paged back from the UI's in-memory ring buffer)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS autopilot_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            role TEXT, -- 'user', 'assistant'
+            content TEXT,
+            artifact_id INTEGER,
+            created_at TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_autopilot_events_session ON autopilot_events (session_id, id)")
+
+    # Business profile and other key/value settings
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # GSTR-2B lines imported from the portal's JSON download (what suppliers actually filed)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS gstr2b_lines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            return_period TEXT, -- 'YYYY-MM'
+            supplier_gstin TEXT,
+            supplier_name TEXT,
+            invoice_no TEXT,
+            invoice_date TEXT,
+            taxable_value REAL,
+            igst REAL,
+            cgst REAL,
+            sgst REAL,
+            cess REAL,
+            invoice_value REAL,
+            itc_available TEXT, -- 'Y' / 'N' as reported in 2B
+            source_file TEXT,
+            imported_at TEXT
+        )
+    ''')
+
+    # Closed financial years moved to compressed archive files, with their totals kept here
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archived_years (
+            entity_id INTEGER NOT NULL,
+            fy TEXT NOT NULL, -- '2023-24'
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            path TEXT NOT NULL, -- gzip-compressed SQLite file
+            invoice_count INTEGER,
+            expense_count INTEGER,
+            sales_taxable REAL,
+            sales_total REAL,
+            out_igst REAL,
+            out_cgst REAL,
+            out_sgst REAL,
+            expenses_total REAL,
+            in_igst REAL,
+            in_cgst REAL,
+            in_sgst REAL,
+            archived_at TEXT,
+            PRIMARY KEY (entity_id, fy)
+        )
+    ''')
+
+    # What was filed per return and period, exactly as submitted; filed periods are locked against edits
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS filed_returns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity_id INTEGER NOT NULL,
+            return_type TEXT NOT NULL, -- 'GSTR-1' / 'GSTR-3B'
+            fy TEXT,
+            period TEXT, -- as selected on the portal, e.g. 'January'
+            period_start TEXT NOT NULL,
+            period_end TEXT NOT NULL,
+            figures TEXT, -- JSON: sales_taxable, output_tax, input_tax, ...
+            payload TEXT, -- JSON: the invoices / section values entered on the portal
+            filing_run_id INTEGER,
+            filed_at TEXT,
+            UNIQUE (entity_id, return_type, period_start)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_filed_returns_entity_period ON filed_returns (entity_id, period_start)")
+
+    # Multi-entity: the existing books become the default entity, with the old business profile settings
+    _add_column(c, "entities", "shard", "TEXT")  # own database file, when the entity is sharded
+    if path == DB_NAME and c.execute("SELECT COUNT(*) FROM entities").fetchone()[0] == 0:
+        profile = dict(c.execute("SELECT key, value FROM settings WHERE key LIKE 'business_%'").fetchall())
+        c.execute('''
+            INSERT INTO entities (id, name, gstin, address, city, pin, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (DEFAULT_ENTITY, profile.get("business_name") or "My Business", profile.get("business_gstin"),
+              profile.get("business_address"), profile.get("business_city"), profile.get("business_pin"), _now()))
+    for table in ENTITY_TABLES:
+        _add_column(c, table, "entity_id", f"INTEGER NOT NULL DEFAULT {DEFAULT_ENTITY}")
+    # Every query filters on entity_id first, so indexes lead with it
+    for old in ("idx_invoices_date", "idx_expenses_date", "idx_notifications_status_date", "idx_invoices_open",
+                "idx_bank_transactions_status", "idx_gstr2b_lines_period", "idx_filing_runs_period"):
+        c.execute(f"DROP INDEX IF EXISTS {old}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_entity_date ON invoices (entity_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_entity_date ON expenses (entity_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notifications_entity_status ON notifications (entity_id, status, date)")
+    # Open invoices only: aging and customer balances never touch settled ones
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_invoices_entity_open ON invoices (entity_id, customer_name, date)
+        WHERE balance > 0.005
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_entity_date ON payments (entity_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bank_transactions_entity_status ON bank_transactions (entity_id, status, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gstr2b_lines_entity_period ON gstr2b_lines (entity_id, return_period)")
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_filing_runs_entity_period
+        ON filing_runs (entity_id, return_type, fy, period, status)
+    ''')
+    _normalize_notification_dates(c)
+    _create_edit_triggers(c)
+    _create_item_triggers(c)
+    _create_lock_triggers(c)
+    if rebuild_hsn:
+        _rebuild_hsn_summary(c)
+
     conn.commit()
+    if path == DB_NAME:
+        _load_shards(c.execute("SELECT id, shard FROM entities").fetchall())
     conn.close()
+    if path == DB_NAME:
+        for shard in set(_shards.values()):
+            init_db(shard)
 
-def add_invoice(date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount):
+def _add_column(c, table, column, decl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    columns = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def get_write_generation():
+    """Counter that changes whenever a ledger table is written; cached results compare against it."""
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        INSERT INTO invoices (date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount))
+    c.execute("SELECT generation FROM write_generation WHERE id = 1")
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def get_edit_count():
+    """Counter that changes only when a ledger row is deleted or its descriptive columns are edited."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT edits FROM write_generation WHERE id = 1")
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def get_setting(key, default=None):
+    conn = _catalog_connection()
+    c = conn.cursor()
+    c.execute("SELECT value FROM settings WHERE key = ?", (key,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else default
+
+def set_setting(key, value):
+    conn = _catalog_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+              (key, value))
+    conn.commit()
+    conn.close()
+
+# ── Entities ─────────────────────────────────────────────────────
+
+ENTITY_FIELDS = ("name", "gstin", "address", "city", "pin")
+
+def get_entities():
+    conn = _catalog_connection()
+    df = pd.read_sql("SELECT * FROM entities ORDER BY name", conn)
+    conn.close()
+    _load_shards(zip(df["id"], df["shard"]))
+    return df
+
+def get_entity(entity_id=None):
+    """The entity as a dict (the current one by default), or None."""
+    conn = _catalog_connection()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM entities WHERE id = ?", (entity_id or current_entity(),)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def add_entity(name, gstin=None, address=None, city=None, pin=None, sharded=False):
+    """Register a business; with `sharded` its books go in a database file of their own from the start."""
+    conn = _catalog_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO entities (name, gstin, address, city, pin, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+              (name, gstin, address, city, pin, _now()))
+    entity_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    if sharded:
+        move_entity_to_shard(entity_id)
+    return entity_id
+
+def update_entity(entity_id, **fields):
+    fields = {k: v for k, v in fields.items() if k in ENTITY_FIELDS}
+    if not fields:
+        return
+    conn = _catalog_connection()
+    c = conn.cursor()
+    c.execute(f"UPDATE entities SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+              [*fields.values(), entity_id])
     conn.commit()
     conn.close()
 
-def get_invoices():
+def add_invoice(date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount):
+    conn = get_connection()
+    c = conn.cursor()
+    try:  # a filed (locked) period aborts the insert; closing rolls it back
+        c.execute('''
+            INSERT INTO invoices (date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount,
+                                  entity_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount, current_entity()))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_invoices(limit=None):
     conn = get_connection()
-    df = pd.read_sql("SELECT * FROM invoices ORDER BY date DESC", conn)
+    query = '''
+        SELECT inv.*, (SELECT COUNT(*) FROM invoice_items it WHERE it.invoice_id = inv.id) AS item_count
+        FROM invoices inv WHERE inv.entity_id = ? ORDER BY date DESC
+    '''
+    if limit:
+        df = pd.read_sql(query + " LIMIT ?", conn, params=(current_entity(), int(limit)))
+    else:
+        df = pd.read_sql(query, conn, params=(current_entity(),))
     conn.close()
     return df
 
-def add_expense(date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description):
+def add_invoice_with_items(date, invoice_no, customer_name, gstin, items, customer_address=None, customer_city=None,
+                           customer_pin=None):
+    """
+    Insert an invoice and its line items (dicts keyed by ITEM_COLUMNS) in one transaction.
+    The header totals are filled in from the items by trigger. Returns the invoice id.
+    """
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        INSERT INTO expenses (date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description))
+    try:  # a filed (locked) period aborts the insert; closing rolls it back
+        c.execute('''
+            INSERT INTO invoices (date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount,
+                                  customer_address, customer_city, customer_pin, entity_id)
+            VALUES (?, ?, ?, ?, 0, NULL, 0, 0, 0, 0, ?, ?, ?, ?)
+        ''', (str(date), invoice_no, customer_name, gstin, customer_address, customer_city, customer_pin, current_entity()))
+        invoice_id = c.lastrowid
+        c.executemany(f'''
+            INSERT INTO invoice_items (invoice_id, {", ".join(ITEM_COLUMNS)})
+            VALUES (?, {", ".join("?" * len(ITEM_COLUMNS))})
+        ''', [(invoice_id, *(item.get(col) for col in ITEM_COLUMNS)) for item in items])
+        conn.commit()
+    finally:
+        conn.close()
+    return invoice_id
+
+def get_invoice_items(invoice_id):
+    conn = get_connection()
+    df = pd.read_sql('''
+        SELECT * FROM invoice_items
+        WHERE invoice_id = (SELECT id FROM invoices WHERE id = ? AND entity_id = ?) ORDER BY id
+    ''', conn, params=(invoice_id, current_entity()))
+    conn.close()
+    return df
+
+def get_invoices_between(start, end):
+    """Invoices dated start..end inclusive (ISO dates), including archived years."""
+    conn, source = ledger_connection(start, end)
+    df = pd.read_sql(f"SELECT * FROM {source['invoices']} WHERE entity_id = ? AND date >= ? AND date <= ? "
+                     "ORDER BY date, id", conn, params=(current_entity(), str(start), str(end)))
+    conn.close()
+    return df
+
+def get_invoices_by_ids(ids):
+    conn = get_connection()
+    ids = [int(i) for i in ids]
+    frames = [pd.read_sql(f"SELECT * FROM invoices WHERE entity_id = ? AND id IN ({','.join('?' * len(chunk))})",
+                          conn, params=[current_entity(), *chunk])
+              for chunk in (ids[i:i + _MAX_IN_PARAMS] for i in range(0, len(ids), _MAX_IN_PARAMS))]
+    conn.close()
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def set_invoice_irns(acks):
+    """Store IRP acknowledgements: iterable of (invoice_id, irn, ack_no, ack_date)."""
+    conn = get_connection()
+    c = conn.cursor()
+    entity_id = current_entity()
+    c.executemany("UPDATE invoices SET irn = ?, irn_ack_no = ?, irn_ack_date = ? WHERE id = ? AND entity_id = ?",
+                  [(irn, ack_no, ack_date, invoice_id, entity_id) for invoice_id, irn, ack_no, ack_date in acks])
     conn.commit()
     conn.close()
 
-def get_expenses():
+def get_invoice_irns():
+    """Every IRN already stored on the current entity's invoices."""
     conn = get_connection()
-    df = pd.read_sql("SELECT * FROM expenses ORDER BY date DESC", conn)
+    c = conn.cursor()
+    c.execute("SELECT irn FROM invoices WHERE entity_id = ? AND irn IS NOT NULL", (current_entity(),))
+    irns = {row[0] for row in c.fetchall()}
+    conn.close()
+    return irns
+
+def get_items_for_invoices(ids):
+    """Line items of many invoices at once, ordered by invoice and entry."""
+    conn = get_connection()
+    ids = [int(i) for i in ids]
+    frames = [pd.read_sql(f"SELECT * FROM invoice_items WHERE invoice_id IN "
+                          f"(SELECT id FROM invoices WHERE entity_id = ? AND id IN ({','.join('?' * len(chunk))}))",
+                          conn, params=[current_entity(), *chunk])
+              for chunk in (ids[i:i + _MAX_IN_PARAMS] for i in range(0, len(ids), _MAX_IN_PARAMS))]
+    conn.close()
+    if not frames:
+        return pd.DataFrame(columns=["invoice_id"])
+    return pd.concat(frames, ignore_index=True).sort_values(["invoice_id", "id"])
+
+def get_hsn_summary(start_period, end_period=None):
+    """HSN-wise totals for 'YYYY-MM' periods start..end, read from the maintained summary table."""
+    conn = get_connection()
+    end_period = end_period or start_period
+    schemas = _attach_archives(conn, f"{start_period}-01", f"{end_period}-31")
+    df = pd.read_sql(f'''
+        SELECT hsn_code, unit, gst_rate,
+               ROUND(SUM(quantity), 3) AS quantity, ROUND(SUM(total_value), 2) AS total_value,
+               ROUND(SUM(taxable_value), 2) AS taxable_value, ROUND(SUM(igst), 2) AS igst,
+               ROUND(SUM(cgst), 2) AS cgst, ROUND(SUM(sgst), 2) AS sgst
+        FROM {_ledger_from(conn, "hsn_summary", schemas)}
+        WHERE entity_id = ? AND period >= ? AND period <= ? AND item_count > 0
+        GROUP BY hsn_code, unit, gst_rate
+        ORDER BY hsn_code, gst_rate
+    ''', conn, params=(current_entity(), start_period, end_period))
     conn.close()
     return df
 
+def rebuild_hsn_summary():
+    """Recompute the current database's HSN summary from all items (backfill / repair); normal writes keep it current."""
+    conn = get_connection()
+    _rebuild_hsn_summary(conn.cursor())
+    conn.commit()
+    conn.close()
+
+def _rebuild_hsn_summary(c):
+    c.execute("DELETE FROM hsn_summary")
+    c.execute('''
+        INSERT INTO hsn_summary (entity_id, period, hsn_code, gst_rate, unit, quantity, taxable_value, igst, cgst, sgst,
+                                 total_value, item_count)
+        SELECT inv.entity_id, strftime('%Y-%m', inv.date), COALESCE(it.hsn_code, ''), COALESCE(it.gst_rate, 0),
+               COALESCE(it.unit, 'OTH'), SUM(COALESCE(it.quantity, 0)), SUM(COALESCE(it.taxable_value, 0)),
+               SUM(COALESCE(it.igst, 0)), SUM(COALESCE(it.cgst, 0)), SUM(COALESCE(it.sgst, 0)),
+               SUM(COALESCE(it.total_amount, 0)), COUNT(*)
+        FROM invoice_items it JOIN invoices inv ON inv.id = it.invoice_id
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+
+def get_gst_totals(start=None, end=None):
+    """Aggregate sales/GST/ITC totals in SQL, without loading the ledger tables: all-time, or for dates start..end."""
+    where, params = "entity_id = ?", [current_entity()]
+    if start or end:
+        conn, source = ledger_connection(start, end)
+        where += " AND date >= ? AND date <= ?"
+        params += [str(start or "0000"), str(end or "9999")]
+    else:
+        conn, source = get_connection(), {"invoices": "invoices", "expenses": "expenses"}
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT COALESCE(SUM(taxable_value), 0), COALESCE(SUM(igst), 0),
+               COALESCE(SUM(cgst), 0), COALESCE(SUM(sgst), 0), COALESCE(SUM(total_amount), 0)
+        FROM {source['invoices']} WHERE {where}
+    ''', params)
+    sales_taxable, out_igst, out_cgst, out_sgst, sales_total = c.fetchone()
+    c.execute(f'''
+        SELECT COALESCE(SUM(igst), 0), COALESCE(SUM(cgst), 0), COALESCE(SUM(sgst), 0),
+               COALESCE(SUM(total_amount), 0)
+        FROM {source['expenses']} WHERE {where}
+    ''', params)
+    in_igst, in_cgst, in_sgst, expenses_total = c.fetchone()
+    # All-time totals count archived years through their stored totals, without opening the archives
+    archived = (0,) * 9
+    if not (start or end):
+        c.execute('''
+            SELECT COALESCE(SUM(sales_taxable), 0), COALESCE(SUM(out_igst), 0), COALESCE(SUM(out_cgst), 0),
+                   COALESCE(SUM(out_sgst), 0), COALESCE(SUM(sales_total), 0), COALESCE(SUM(in_igst), 0),
+                   COALESCE(SUM(in_cgst), 0), COALESCE(SUM(in_sgst), 0), COALESCE(SUM(expenses_total), 0)
+            FROM archived_years WHERE entity_id = ?
+        ''', (current_entity(),))
+        archived = c.fetchone()
+    conn.close()
+    sales_taxable, out_igst, out_cgst, out_sgst, sales_total, in_igst, in_cgst, in_sgst, expenses_total = (
+        live + old for live, old in zip((sales_taxable, out_igst, out_cgst, out_sgst, sales_total,
+                                         in_igst, in_cgst, in_sgst, expenses_total), archived))
+    gst_collected = out_igst + out_cgst + out_sgst
+    itc_available = in_igst + in_cgst + in_sgst
+    return {
+        "sales_taxable": sales_taxable,
+        "sales_total": sales_total,
+        "expenses_total": expenses_total,
+        "gst_collected": gst_collected,
+        "itc_available": itc_available,
+        "net_payable": max(0, gst_collected - itc_available),
+        "output_tax": {"igst": out_igst, "cgst": out_cgst, "sgst": out_sgst},
+        "input_tax": {"igst": in_igst, "cgst": in_cgst, "sgst": in_sgst},
+    }
+
+# SQLite expressions mapping an ISO date to the first day of its bucket
+PERIOD_BUCKETS = {
+    "day": "date",
+    "week": "date(date, '-6 days', 'weekday 1')",  # Monday of that week
+    "month": "strftime('%Y-%m-01', date)",
+}
+
+def get_period_series(grain="month", start=None, end=None):
+    """Sales, expenses, GST collected, ITC and net payable per day/week/month, aggregated in SQL."""
+    bucket = PERIOD_BUCKETS[grain]
+    where, params = ["entity_id = ?"], [current_entity()]
+    if start:
+        where.append("date >= ?")
+        params.append(str(start))
+    if end:
+        where.append("date <= ?")
+        params.append(str(end))
+    where = f"WHERE {' AND '.join(where)}"
+    query = f'''
+        WITH ledger AS (
+            SELECT {bucket} AS period, total_amount AS sales, 0 AS expenses,
+                   igst + cgst + sgst AS gst_collected, 0 AS itc
+            FROM {{invoices}} {where}
+            UNION ALL
+            SELECT {bucket}, 0, total_amount, 0, igst + cgst + sgst
+            FROM {{expenses}} {where}
+        )
+        SELECT period, SUM(sales) AS sales, SUM(expenses) AS expenses,
+               SUM(gst_collected) AS gst_collected, SUM(itc) AS itc,
+               MAX(SUM(gst_collected) - SUM(itc), 0) AS net_payable
+        FROM ledger WHERE period IS NOT NULL
+        GROUP BY period ORDER BY period
+    '''
+    conn, source = ledger_connection(start, end)
+    df = pd.read_sql(query.format(**source), conn, params=params * 2)
+    conn.close()
+    return df
+
+def add_expense(date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description,
+                invoice_no=None):
+    conn = get_connection()
+    c = conn.cursor()
+    try:  # a filed (locked) period aborts the insert; closing rolls it back
+        c.execute('''
+            INSERT INTO expenses (date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description, invoice_no,
+                                  entity_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description, invoice_no,
+              current_entity()))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_expenses(limit=None):
+    conn = get_connection()
+    if limit:
+        df = pd.read_sql("SELECT * FROM expenses WHERE entity_id = ? ORDER BY date DESC LIMIT ?", conn,
+                         params=(current_entity(), int(limit)))
+    else:
+        df = pd.read_sql("SELECT * FROM expenses WHERE entity_id = ? ORDER BY date DESC", conn, params=(current_entity(),))
+    conn.close()
+    return df
+
+def get_expenses_between(start, end):
+    """Expenses dated start..end inclusive (ISO dates), including archived years."""
+    conn, source = ledger_connection(start, end)
+    df = pd.read_sql(f"SELECT * FROM {source['expenses']} WHERE entity_id = ? AND date >= ? AND date <= ? "
+                     "ORDER BY date", conn, params=(current_entity(), str(start), str(end)))
+    conn.close()
+    return df
+
+# Date formats seen in portal notices and user input; stored dates are always ISO
+NOTICE_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d-%b-%Y", "%d %b %Y")
+
+def _iso_date(value):
+    """'15/03/2026' (portal format) → '2026-03-15'; unparseable text is returned unchanged."""
+    value = str(value or "").strip()
+    for fmt in NOTICE_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return value
+
+def _normalize_notification_dates(c):
+    """Rewrite notification dates stored in portal format (before they were normalized) as ISO."""
+    rows = c.execute("SELECT id, date FROM notifications "
+                     "WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'").fetchall()
+    updates = [(_iso_date(date), id) for id, date in rows if _iso_date(date) != date]
+    c.executemany("UPDATE notifications SET date = ? WHERE id = ?", updates)
+
 def add_notification(date, type, description, action_required):
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        INSERT INTO notifications (date, type, description, action_required, status)
-        VALUES (?, ?, ?, ?, 'Pending')
-    ''', (date, type, description, action_required))
+        INSERT INTO notifications (date, type, description, action_required, status, entity_id)
+        VALUES (?, ?, ?, ?, 'Pending', ?)
+    ''', (_iso_date(date), type, description, action_required, current_entity()))
     conn.commit()
     conn.close()
 
-def get_notifications(pending_only=False):
+def get_notifications(pending_only=False, type=None):
     conn = get_connection()
-    query = "SELECT * FROM notifications ORDER BY date DESC"
+    clauses, params = ["entity_id = ?"], [current_entity()]
     if pending_only:
-        query = "SELECT * FROM notifications WHERE status='Pending' ORDER BY date DESC"
-    df = pd.read_sql(query, conn)
+        clauses.append("status = 'Pending'")
+    if type:
+        clauses.append("type = ?")
+        params.append(type)
+    df = pd.read_sql(f"SELECT * FROM notifications WHERE {' AND '.join(clauses)} ORDER BY date DESC", conn, params=params)
     conn.close()
     return df
 
+def count_pending_notifications():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM notifications WHERE entity_id = ? AND status = 'Pending'", (current_entity(),))
+    count = c.fetchone()[0]
+    conn.close()
+    return count
+
 def update_notification_status(id, status):
     conn = get_connection()
     c = conn.cursor()
-    c.execute("UPDATE notifications SET status = ? WHERE id = ?", (status, id))
+    c.execute("UPDATE notifications SET status = ? WHERE id = ? AND entity_id = ?", (status, id, current_entity()))
+    conn.commit()
+    conn.close()
+
+# SQLite caps bound parameters per statement (999 on older builds)
+_MAX_IN_PARAMS = 900
+
+def update_notification_status_many(ids, status):
+    """Set `status` on every id in one transaction. Returns the number of rows updated."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    conn = get_connection()
+    c = conn.cursor()
+    updated = 0
+    for start in range(0, len(ids), _MAX_IN_PARAMS):
+        chunk = ids[start:start + _MAX_IN_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        c.execute(f"UPDATE notifications SET status = ? WHERE entity_id = ? AND id IN ({placeholders})",
+                  [status, current_entity()] + chunk)
+        updated += c.rowcount
+    conn.commit()
+    conn.close()
+    return updated
+
+def update_notifications_where(status, current_status="Pending", type=None, exclude_type=None, before_date=None):
+    """Filter-based bulk update, e.g. acknowledge all Pending notices dated before a day.
+    Returns the number of rows updated."""
+    clauses, params = ["entity_id = ?", "status = ?"], [current_entity(), current_status]
+    if type:
+        clauses.append("type = ?")
+        params.append(type)
+    if exclude_type:
+        clauses.append("type != ?")
+        params.append(exclude_type)
+    if before_date:
+        # Stored dates are ISO (see add_notification), so string order is date order
+        clauses.append("date < ?")
+        params.append(_iso_date(before_date))
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"UPDATE notifications SET status = ? WHERE {' AND '.join(clauses)}", [status] + params)
+    updated = c.rowcount
+    conn.commit()
+    conn.close()
+    return updated
+
+# ── Filing Run Journal ──────────────────────────────────────────
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+def create_filing_run(return_type, fy, period, items):
+    """Start a new filing run. `items` is a list of (item_key, invoice_no) tuples."""
+    conn = get_connection()
+    c = conn.cursor()
+    now = _now()
+    c.execute('''
+        INSERT INTO filing_runs (return_type, fy, period, status, started_at, updated_at, entity_id)
+        VALUES (?, ?, ?, 'In Progress', ?, ?, ?)
+    ''', (return_type, fy, period, now, now, current_entity()))
+    run_id = c.lastrowid
+    c.executemany('''
+        INSERT INTO filing_run_items (run_id, item_key, invoice_no, status, updated_at)
+        VALUES (?, ?, ?, 'Pending', ?)
+    ''', [(run_id, key, invoice_no, now) for key, invoice_no in items])
+    conn.commit()
+    conn.close()
+    return run_id
+
+def get_resumable_filing_run(return_type, fy, period):
+    """Latest unfinished run for this return and period, or None."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT id FROM filing_runs
+        WHERE entity_id = ? AND return_type = ? AND fy = ? AND period = ? AND status IN ('In Progress', 'Interrupted')
+        ORDER BY id DESC LIMIT 1
+    ''', (current_entity(), return_type, fy, period))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def add_filing_run_items(run_id, items):
+    """Add items that were not part of the run yet (e.g. invoices created after an interruption)."""
+    conn = get_connection()
+    c = conn.cursor()
+    now = _now()
+    c.executemany('''
+        INSERT OR IGNORE INTO filing_run_items (run_id, item_key, invoice_no, status, updated_at)
+        VALUES (?, ?, ?, 'Pending', ?)
+    ''', [(run_id, key, invoice_no, now) for key, invoice_no in items])
+    conn.commit()
+    conn.close()
+
+def get_filing_run_status(run_id):
+    """Returns {item_key: status} for every item of a run."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT item_key, status FROM filing_run_items WHERE run_id = ?", (run_id,))
+    statuses = dict(c.fetchall())
+    conn.close()
+    return statuses
+
+def get_filing_run_items(run_id):
+    conn = get_connection()
+    df = pd.read_sql("SELECT * FROM filing_run_items WHERE run_id = ? ORDER BY id", conn, params=(run_id,))
+    conn.close()
+    return df
+
+def update_filing_item_status(run_id, item_key, status, error=None):
+    conn = get_connection()
+    c = conn.cursor()
+    now = _now()
+    c.execute('''
+        UPDATE filing_run_items SET status = ?, error = ?, updated_at = ?
+        WHERE run_id = ? AND item_key = ?
+    ''', (status, error, now, run_id, item_key))
+    c.execute("UPDATE filing_runs SET updated_at = ? WHERE id = ?", (now, run_id))
+    conn.commit()
+    conn.close()
+
+def update_filing_run_status(run_id, status):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE filing_runs SET status = ?, updated_at = ? WHERE id = ?", (status, _now(), run_id))
+    conn.commit()
+    conn.close()
+
+# ── Autopilot Event Log ─────────────────────────────────────────
+
+def add_autopilot_events(session_id, events, keep_last=5000):
+    """Append chat events [(role, content, artifact_id), ...]; returns the new row ids.
+    Only the latest `keep_last` events per session are retained."""
+    conn = _catalog_connection()
+    c = conn.cursor()
+    now = _now()
+    ids = []
+    for role, content, artifact_id in events:
+        c.execute('''
+            INSERT INTO autopilot_events (session_id, role, content, artifact_id, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (session_id, role, content, artifact_id, now))
+        ids.append(c.lastrowid)
+    if ids:
+        c.execute('''
+            DELETE FROM autopilot_events
+            WHERE session_id = ? AND id <= (
+                SELECT id FROM autopilot_events WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+        ''', (session_id, session_id, keep_last))
     conn.commit()
     conn.close()
+    return ids
+
+def get_autopilot_events(session_id, before_id=None, limit=50):
+    """One page of events, oldest first, ending just before `before_id` (or at the latest event)."""
+    conn = _catalog_connection()
+    c = conn.cursor()
+    if before_id is None:
+        c.execute('''
+            SELECT id, role, content, artifact_id FROM autopilot_events
+            WHERE session_id = ? ORDER BY id DESC LIMIT ?
+        ''', (session_id, limit))
+    else:
+        c.execute('''
+            SELECT id, role, content, artifact_id FROM autopilot_events
+            WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+        ''', (session_id, before_id, limit))
+    rows = c.fetchall()
+    conn.close()
+    return [{"id": r[0], "role": r[1], "content": r[2], "artifact_id": r[3]} for r in reversed(rows)]
+
+GSTR2B_COLUMNS = ("supplier_gstin", "supplier_name", "invoice_no", "invoice_date", "taxable_value",
+                  "igst", "cgst", "sgst", "cess", "invoice_value", "itc_available")
+
+def replace_gstr2b_lines(return_period, lines, source_file=None):
+    """Replace the stored 2B lines of a period with `lines` (dicts) in one transaction. Returns the count."""
+    now = _now()
+    entity_id = current_entity()
+    rows = [(return_period, *(line.get(col) for col in GSTR2B_COLUMNS), source_file, now, entity_id) for line in lines]
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM gstr2b_lines WHERE entity_id = ? AND return_period = ?", (entity_id, return_period))
+    c.executemany(f'''
+        INSERT INTO gstr2b_lines (return_period, {", ".join(GSTR2B_COLUMNS)}, source_file, imported_at, entity_id)
+        VALUES ({", ".join("?" * (len(GSTR2B_COLUMNS) + 4))})
+    ''', rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+def get_gstr2b_lines(return_period):
+    conn = get_connection()
+    df = pd.read_sql("SELECT * FROM gstr2b_lines WHERE entity_id = ? AND return_period = ? ORDER BY id", conn,
+                     params=(current_entity(), return_period))
+    conn.close()
+    return df
+
+def get_gstr2b_periods():
+    """Imported periods, newest first, with line counts."""
+    conn = get_connection()
+    df = pd.read_sql('''
+        SELECT return_period, COUNT(*) AS lines, MAX(imported_at) AS imported_at
+        FROM gstr2b_lines WHERE entity_id = ? GROUP BY return_period ORDER BY return_period DESC
+    ''', conn, params=(current_entity(),))
+    conn.close()
+    return df
+
+# ── Receivables ───────────────────────────────────────────────────
+
+OPEN_BALANCE = "balance > 0.005"  # must match idx_invoices_entity_open's WHERE clause for the index to be used
+
+def get_open_invoices(customer_name=None):
+    """Invoices with an outstanding balance, oldest first."""
+    conn = get_connection()
+    if customer_name:
+        df = pd.read_sql(f'''
+            SELECT id, date, invoice_no, customer_name, total_amount, amount_paid, balance, status
+            FROM invoices WHERE entity_id = ? AND customer_name = ? AND {OPEN_BALANCE} ORDER BY date, id
+        ''', conn, params=(current_entity(), customer_name))
+    else:
+        df = pd.read_sql(f'''
+            SELECT id, date, invoice_no, customer_name, total_amount, amount_paid, balance, status
+            FROM invoices WHERE entity_id = ? AND {OPEN_BALANCE} ORDER BY date, id
+        ''', conn, params=(current_entity(),))
+    conn.close()
+    return df
+
+def record_payment(date, customer_name, amount, mode="Bank Transfer", reference=None, allocations=None):
+    """
+    Record a receipt and allocate it in one transaction. `allocations` maps
+    invoice id → amount; without it the payment settles the customer's open
+    invoices oldest first. Whatever is left stays on the payment as unallocated.
+    Returns the payment id.
+    """
+    amount = round(float(amount), 2)
+    entity_id = current_entity()
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        if allocations is None:
+            c.execute(f"SELECT id, balance FROM invoices WHERE entity_id = ? AND customer_name = ? AND {OPEN_BALANCE} "
+                      "ORDER BY date, id", (entity_id, customer_name))
+            allocations, left = {}, amount
+            for invoice_id, balance in c.fetchall():
+                if left <= 0:
+                    break
+                allocations[invoice_id] = min(balance, left)
+                left = round(left - allocations[invoice_id], 2)
+        allocations = {int(k): round(float(v), 2) for k, v in allocations.items() if v and float(v) > 0}
+        if sum(allocations.values()) > amount + 0.005:
+            raise ValueError("Allocations exceed the payment amount.")
+        for invoice_id, allocated in allocations.items():
+            c.execute("SELECT balance FROM invoices WHERE id = ? AND entity_id = ?", (invoice_id, entity_id))
+            row = c.fetchone()
+            if row is None or allocated > (row[0] or 0) + 0.005:
+                raise ValueError(f"Allocation of ₹{allocated:,.2f} exceeds the balance of invoice {invoice_id}.")
+        c.execute('''
+            INSERT INTO payments (date, customer_name, amount, mode, reference, unallocated, created_at, entity_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (str(date), customer_name, amount, mode, reference, round(amount - sum(allocations.values()), 2), _now(),
+              entity_id))
+        payment_id = c.lastrowid
+        c.executemany("INSERT INTO payment_allocations (payment_id, invoice_id, amount) VALUES (?, ?, ?)",
+                      [(payment_id, invoice_id, allocated) for invoice_id, allocated in allocations.items()])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return payment_id
+
+def delete_payment(payment_id):
+    """Remove a payment; the allocation triggers restore the invoice balances."""
+    conn = get_connection()
+    c = conn.cursor()
+    entity_id = current_entity()
+    c.execute("DELETE FROM payment_allocations WHERE payment_id = (SELECT id FROM payments WHERE id = ? AND entity_id = ?)",
+              (payment_id, entity_id))
+    c.execute("DELETE FROM payments WHERE id = ? AND entity_id = ?", (payment_id, entity_id))
+    conn.commit()
+    conn.close()
+
+def get_payments(limit=None):
+    conn = get_connection()
+    query = '''
+        SELECT p.*, (SELECT GROUP_CONCAT(inv.invoice_no, ', ')
+                     FROM payment_allocations pa JOIN invoices inv ON inv.id = pa.invoice_id
+                     WHERE pa.payment_id = p.id) AS invoices
+        FROM payments p WHERE p.entity_id = ? ORDER BY p.date DESC, p.id DESC
+    '''
+    if limit:
+        df = pd.read_sql(query + " LIMIT ?", conn, params=(current_entity(), int(limit)))
+    else:
+        df = pd.read_sql(query, conn, params=(current_entity(),))
+    conn.close()
+    return df
+
+AGING_BUCKETS = (("0-30", 0, 30), ("31-60", 31, 60), ("61-90", 61, 90), ("90+", 91, None))
+
+def get_aging(as_of=None):
+    """Outstanding per customer split into age buckets (days since invoice date), from open invoices only."""
+    as_of = str(as_of or datetime.date.today())
+    age = "CAST(julianday(?) - julianday(date) AS INTEGER)"
+    buckets = ",\n".join(
+        f"ROUND(SUM(CASE WHEN {age} >= {lo}" + (f" AND {age} <= {hi}" if hi is not None else "") +
+        f" THEN balance ELSE 0 END), 2) AS \"{label}\""
+        for label, lo, hi in AGING_BUCKETS
+    )
+    params = [as_of for _, _, hi in AGING_BUCKETS for _ in range(1 if hi is None else 2)]
+    conn = get_connection()
+    df = pd.read_sql(f'''
+        SELECT customer_name, COUNT(*) AS open_invoices, ROUND(SUM(balance), 2) AS outstanding,
+               {buckets}, MIN(date) AS oldest_invoice
+        FROM invoices WHERE entity_id = ? AND {OPEN_BALANCE}
+        GROUP BY customer_name ORDER BY outstanding DESC
+    ''', conn, params=params + [current_entity()])
+    conn.close()
+    return df
+
+# ── Bank statements ──────────────────────────────────────────────
+
+BANK_COLUMNS = ("account", "date", "description", "reference", "amount", "direction", "fingerprint")
+
+def add_bank_transactions(rows):
+    """Insert statement lines (dicts keyed by BANK_COLUMNS), skipping fingerprints already stored. Returns the count added."""
+    now = _now()
+    entity_id = current_entity()
+    conn = get_connection()
+    c = conn.cursor()
+    before = conn.total_changes
+    c.executemany(f'''
+        INSERT OR IGNORE INTO bank_transactions ({", ".join(BANK_COLUMNS)}, imported_at, entity_id)
+        VALUES ({", ".join("?" * (len(BANK_COLUMNS) + 2))})
+    ''', [(*(row.get(col) for col in BANK_COLUMNS), now, entity_id) for row in rows])
+    added = conn.total_changes - before
+    conn.commit()
+    conn.close()
+    return added
+
+def get_bank_transactions(status=None, limit=None):
+    conn = get_connection()
+    query = "SELECT * FROM bank_transactions WHERE entity_id = ?"
+    params = [current_entity()]
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    query += " ORDER BY date, id"
+    if limit:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    df = pd.read_sql(query, conn, params=params)
+    conn.close()
+    return df
+
+def count_bank_transactions():
+    """{status: count} over all imported lines."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT status, COUNT(*) FROM bank_transactions WHERE entity_id = ? GROUP BY status", (current_entity(),))
+    counts = dict(c.fetchall())
+    conn.close()
+    return counts
+
+def get_unreconciled_expenses():
+    """Expenses not yet matched to a bank debit."""
+    conn = get_connection()
+    df = pd.read_sql('''
+        SELECT id, date, vendor_name, invoice_no, total_amount FROM expenses
+        WHERE entity_id = ? AND id NOT IN (SELECT match_id FROM bank_transactions
+                                           WHERE match_type = 'expense' AND status = 'Matched' AND match_id IS NOT NULL)
+    ''', conn, params=(current_entity(),))
+    conn.close()
+    return df
+
+def _apply_bank_match(c, txn_id, match_type, match_id, score, now):
+    """Mark a statement line matched; a credit matched to an invoice also records the payment."""
+    payment_id = None
+    if match_type == "invoice":
+        c.execute("SELECT date, amount, reference, entity_id FROM bank_transactions WHERE id = ?", (txn_id,))
+        date, amount, reference, entity_id = c.fetchone()
+        c.execute("SELECT customer_name, balance FROM invoices WHERE id = ?", (match_id,))
+        customer_name, balance = c.fetchone()
+        allocated = round(min(amount, max(balance or 0, 0)), 2)
+        c.execute('''
+            INSERT INTO payments (date, customer_name, amount, mode, reference, unallocated, created_at, entity_id)
+            VALUES (?, ?, ?, 'Bank Transfer', ?, ?, ?, ?)
+        ''', (date, customer_name, amount, reference, round(amount - allocated, 2), now, entity_id))
+        payment_id = c.lastrowid
+        if allocated > 0:
+            c.execute("INSERT INTO payment_allocations (payment_id, invoice_id, amount) VALUES (?, ?, ?)",
+                      (payment_id, match_id, allocated))
+    c.execute('''
+        UPDATE bank_transactions SET status = 'Matched', match_type = ?, match_id = ?, match_score = ?,
+                                     candidates = NULL, payment_id = ?
+        WHERE id = ?
+    ''', (match_type, match_id, score, payment_id, txn_id))
+
+def save_bank_matches(matches, reviews):
+    """
+    Store one matching pass in a single transaction.
+    `matches`: [(txn_id, match_type, match_id, score)]; `reviews`: [(txn_id, candidates_json)].
+    """
+    now = _now()
+    conn = get_connection()
+    c = conn.cursor()
+    for txn_id, match_type, match_id, score in matches:
+        _apply_bank_match(c, txn_id, match_type, match_id, score, now)
+    c.executemany("UPDATE bank_transactions SET status = 'Review', candidates = ? WHERE id = ?",
+                  [(candidates, txn_id) for txn_id, candidates in reviews])
+    conn.commit()
+    conn.close()
+
+def _stale_bank_candidate(c, match_type, match_id):
+    """Why a review candidate can no longer be matched, or None if it still can."""
+    if match_type == "invoice":
+        row = c.execute("SELECT balance FROM invoices WHERE id = ? AND entity_id = ?",
+                        (match_id, current_entity())).fetchone()
+        if row is None:
+            return "This invoice no longer exists."
+        if (row[0] or 0) <= 0.005:
+            return "This invoice is already fully paid."
+        return None
+    if c.execute("SELECT 1 FROM expenses WHERE id = ? AND entity_id = ?", (match_id, current_entity())).fetchone() is None:
+        return "This expense no longer exists."
+    if c.execute("SELECT 1 FROM bank_transactions WHERE entity_id = ? AND match_type = 'expense' AND match_id = ? "
+                 "AND status = 'Matched'", (current_entity(), match_id)).fetchone():
+        return "This expense is already matched to another bank line."
+    return None
+
+def confirm_bank_match(txn_id, match_type, match_id):
+    """
+    Accept one candidate from the review queue. Candidates are snapshots from matching time,
+    so the pick is re-checked first; a stale one is dropped from the line (which goes back to
+    Unmatched when none are left) and ValueError is raised.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        row = c.execute("SELECT status, candidates FROM bank_transactions WHERE id = ? AND entity_id = ?",
+                        (txn_id, current_entity())).fetchone()
+        if row is None or row[0] != "Review":
+            raise ValueError("This bank line is no longer waiting for review.")
+        problem = _stale_bank_candidate(c, match_type, match_id)
+        if problem:
+            remaining = [cand for cand in json.loads(row[1] or "[]")
+                         if (cand["type"], cand["id"]) != (match_type, match_id)]
+            c.execute("UPDATE bank_transactions SET status = ?, candidates = ? WHERE id = ?",
+                      ("Review" if remaining else "Unmatched", json.dumps(remaining) if remaining else None, txn_id))
+            conn.commit()
+            raise ValueError(problem)
+        _apply_bank_match(c, txn_id, match_type, match_id, None, _now())
+        conn.commit()
+    finally:
+        conn.close()
+
+def set_bank_transaction_status(txn_id, status):
+    """'Ignored' to drop a line from the queue, 'Unmatched' to send it back for matching."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE bank_transactions SET status = ?, candidates = NULL WHERE id = ? AND entity_id = ?",
+              (status, txn_id, current_entity()))
+    conn.commit()
+    conn.close()
+
+# ── Shards ───────────────────────────────────────────────────────
+
+# Copy order for moving an entity: parents before children, so the item and allocation triggers
+# rebuild invoice totals, balances and the HSN summary in the shard exactly as they were
+_SHARD_COPY = (
+    ("invoices", "entity_id = :entity", {"amount_paid": "0"}),
+    ("invoice_items", "invoice_id IN (SELECT id FROM src.invoices WHERE entity_id = :entity)", {}),
+    ("expenses", "entity_id = :entity", {}),
+    ("notifications", "entity_id = :entity", {}),
+    ("payments", "entity_id = :entity", {}),
+    ("payment_allocations", "payment_id IN (SELECT id FROM src.payments WHERE entity_id = :entity)", {}),
+    ("bank_transactions", "entity_id = :entity", {}),
+    ("gstr2b_lines", "entity_id = :entity", {}),
+    ("filing_runs", "entity_id = :entity", {}),
+    ("filing_run_items", "run_id IN (SELECT id FROM src.filing_runs WHERE entity_id = :entity)", {}),
+    ("archived_years", "entity_id = :entity", {}),
+    # Last in, first out: the period locks are lifted only once the rows they guard are copied
+    ("filed_returns", "entity_id = :entity", {}),
+)
+
+def _copy_rows(c, table, where, params, overrides=None):
+    """INSERT INTO main.<table> the rows of src.<table> matching `where`, column by column."""
+    columns = [row[1] for row in c.execute(f"PRAGMA main.table_info({table})")]
+    select = ", ".join((overrides or {}).get(col, col) for col in columns)
+    c.execute(f"INSERT INTO main.{table} ({', '.join(columns)}) SELECT {select} FROM src.{table} WHERE {where}", params)
+
+def move_entity_to_shard(entity_id):
+    """
+    Move an entity's books from the main file into shards/entity_<id>.db and
+    route it there. Copy, delete and catalog update commit as one transaction.
+    """
+    entity_id = int(entity_id)
+    if entity_id in _shards:
+        return _shards[entity_id]
+    path = os.path.join(SHARD_DIR, f"entity_{entity_id}.db")
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    init_db(path)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("ATTACH DATABASE ? AS src", (DB_NAME,))
+    params = {"entity": entity_id}
+    try:
+        for table, where, overrides in _SHARD_COPY:
+            _copy_rows(c, table, where, params, overrides)
+        # Children first; deleting an invoice also removes its items and their HSN amounts
+        for table, where, _ in reversed(_SHARD_COPY):
+            if table != "invoice_items":
+                c.execute(f"DELETE FROM src.{table} WHERE {where}", params)
+        c.execute("DELETE FROM src.hsn_summary WHERE entity_id = :entity", params)
+        c.execute("UPDATE src.entities SET shard = ? WHERE id = ?", (path, entity_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _shards[entity_id] = path
+    return path
+
+def for_each_entity(fn, entity_ids=None, max_workers=8):
+    """
+    Run fn() once per entity, in parallel threads, with that entity current.
+    Entities in different shards never share a lock. Returns {entity_id: result}.
+    """
+    entity_ids = list(entity_ids) if entity_ids is not None else get_entities()["id"].tolist()
+
+    def run(entity_id):
+        set_current_entity(entity_id)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(entity_ids)))) as pool:
+        return dict(zip(entity_ids, pool.map(run, entity_ids)))
+
+def _entity_summary():
+    conn = get_connection()
+    c = conn.cursor()
+    entity_id = current_entity()
+    c.execute('''
+        SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(SUM(igst + cgst + sgst), 0),
+               COALESCE(SUM(CASE WHEN balance > 0.005 THEN balance ELSE 0 END), 0)
+        FROM invoices WHERE entity_id = ?
+    ''', (entity_id,))
+    invoice_count, sales, gst_collected, outstanding = c.fetchone()
+    c.execute("SELECT COALESCE(SUM(total_amount), 0), COALESCE(SUM(igst + cgst + sgst), 0) FROM expenses "
+              "WHERE entity_id = ?", (entity_id,))
+    expenses, itc = c.fetchone()
+    c.execute('''
+        SELECT COALESCE(SUM(invoice_count), 0), COALESCE(SUM(sales_total), 0),
+               COALESCE(SUM(out_igst + out_cgst + out_sgst), 0), COALESCE(SUM(expenses_total), 0),
+               COALESCE(SUM(in_igst + in_cgst + in_sgst), 0)
+        FROM archived_years WHERE entity_id = ?
+    ''', (entity_id,))
+    archived = c.fetchone()
+    conn.close()
+    invoice_count, sales, gst_collected, expenses, itc = (
+        live + old for live, old in zip((invoice_count, sales, gst_collected, expenses, itc), archived))
+    return {"invoices": invoice_count, "sales": sales, "expenses": expenses, "gst_collected": gst_collected,
+            "itc": itc, "net_payable": max(0, gst_collected - itc), "outstanding": outstanding}
+
+def get_entity_overview():
+    """Sales, GST and receivables per entity, with every shard queried in parallel."""
+    entities = get_entities()
+    summaries = for_each_entity(_entity_summary, entities["id"])
+    overview = pd.DataFrame([{"id": entity_id, **summary} for entity_id, summary in summaries.items()])
+    if overview.empty:
+        return overview
+    return entities[["id", "name", "gstin", "shard"]].merge(overview, on="id")
+
+def backup_database(dest, entity_id=None):
+    """Consistent online copy of one entity's database file (the main file when None) to `dest`."""
+    source = sqlite3.connect(db_path(entity_id) if entity_id else DB_NAME)
+    target = sqlite3.connect(dest)
+    with target:
+        source.backup(target)
+    target.close()
+    source.close()
+
+# ── Financial-year archives ──────────────────────────────────────
+
+# Decompressed copies of archives, made on first use and attached read-only by queries that need them
+_ARCHIVE_CACHE = os.path.join(ARCHIVE_DIR, ".cache")
+
+# Copy order for archiving a year; allocations go with their invoices so settled balances stay settled
+_ARCHIVE_COPY = (
+    ("invoices", "entity_id = :entity AND date BETWEEN :start AND :end", {"amount_paid": "0"}),
+    ("invoice_items", "invoice_id IN (SELECT id FROM src.invoices WHERE entity_id = :entity "
+                      "AND date BETWEEN :start AND :end)", {}),
+    ("payment_allocations", "invoice_id IN (SELECT id FROM src.invoices WHERE entity_id = :entity "
+                            "AND date BETWEEN :start AND :end)", {}),
+    ("expenses", "entity_id = :entity AND date BETWEEN :start AND :end", {}),
+)
+
+def fy_bounds(fy):
+    """'2023-24' → ('2023-04-01', '2024-03-31')."""
+    first = int(str(fy)[:4])
+    return f"{first}-04-01", f"{first + 1}-03-31"
+
+def get_archived_years():
+    conn = get_connection()
+    df = pd.read_sql("SELECT * FROM archived_years WHERE entity_id = ? ORDER BY start_date", conn,
+                     params=(current_entity(),))
+    conn.close()
+    return df
+
+def archive_year(fy):
+    """
+    Move the current entity's invoices and expenses of a closed financial year into
+    archives/entity_<id>_FY<fy>.db.gz, keeping only the year's totals here.
+    Returns the archive path.
+    """
+    entity_id = current_entity()
+    start, end = fy_bounds(fy)
+    today = datetime.date.today()
+    current_fy_start = datetime.date(today.year if today.month >= 4 else today.year - 1, 4, 1).isoformat()
+    if end >= current_fy_start:
+        raise ValueError(f"FY {fy} is not closed yet.")
+    params = {"entity": entity_id, "start": start, "end": end}
+    conn = get_connection()
+    c = conn.cursor()
+    if c.execute("SELECT 1 FROM archived_years WHERE entity_id = ? AND fy = ?", (entity_id, fy)).fetchone():
+        conn.close()
+        raise ValueError(f"FY {fy} is already archived.")
+    open_count = c.execute("SELECT COUNT(*) FROM invoices WHERE entity_id = :entity AND date BETWEEN :start AND :end "
+                           "AND balance > 0.005", params).fetchone()[0]
+    conn.close()
+    if open_count:
+        raise ValueError(f"FY {fy} still has {open_count} unpaid invoice(s); settle or write them off first.")
+
+    # Build and compress the archive before touching the live books; a crash leaves them intact
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"entity_{entity_id}_FY{fy}.db.gz")
+    staging = path[:-3] + ".tmp"
+    if os.path.exists(staging):
+        os.remove(staging)
+    init_db(staging)
+    conn = sqlite3.connect(staging)
+    c = conn.cursor()
+    c.execute("ATTACH DATABASE ? AS src", (db_path(),))
+    try:
+        for table, where, overrides in _ARCHIVE_COPY:
+            _copy_rows(c, table, where, params, overrides)
+        conn.commit()
+    finally:
+        conn.close()
+    with open(staging, "rb") as raw, gzip.open(path + ".tmp", "wb") as packed:
+        shutil.copyfileobj(raw, packed, 1 << 20)
+    os.replace(path + ".tmp", path)
+    os.remove(staging)
+
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''
+            INSERT INTO archived_years (entity_id, fy, start_date, end_date, path, invoice_count, sales_taxable,
+                                        sales_total, out_igst, out_cgst, out_sgst, expense_count, expenses_total,
+                                        in_igst, in_cgst, in_sgst, archived_at)
+            SELECT :entity, :fy, :start, :end, :path, inv.*, pur.*, :now
+            FROM (SELECT COUNT(*), COALESCE(SUM(taxable_value), 0), COALESCE(SUM(total_amount), 0),
+                         COALESCE(SUM(igst), 0), COALESCE(SUM(cgst), 0), COALESCE(SUM(sgst), 0)
+                  FROM invoices WHERE entity_id = :entity AND date BETWEEN :start AND :end) inv,
+                 (SELECT COUNT(*), COALESCE(SUM(total_amount), 0),
+                         COALESCE(SUM(igst), 0), COALESCE(SUM(cgst), 0), COALESCE(SUM(sgst), 0)
+                  FROM expenses WHERE entity_id = :entity AND date BETWEEN :start AND :end) pur
+        ''', {**params, "fy": fy, "path": path, "now": _now()})
+        # Allocations first, so deleting the invoices does not hand their amounts back to the payments
+        for table, where, _ in reversed(_ARCHIVE_COPY):
+            if table != "invoice_items":
+                c.execute(f"DELETE FROM {table} WHERE {where.replace('src.', '')}", params)
+        c.execute("DELETE FROM hsn_summary WHERE entity_id = :entity AND item_count = 0", params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return path
+
+def _archive_file(path):
+    """Decompressed copy of an archive, refreshed when the archive is newer."""
+    os.makedirs(_ARCHIVE_CACHE, exist_ok=True)
+    cached = os.path.join(_ARCHIVE_CACHE, os.path.basename(path)[:-3])
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+        tmp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(path, "rb") as packed, open(tmp, "wb") as raw:
+            shutil.copyfileobj(packed, raw, 1 << 20)
+        init_db(tmp)  # brings archives written by older versions up to the current schema
+        os.replace(tmp, cached)
+    return cached
+
+def _attach_archives(conn, start=None, end=None):
+    """ATTACH the current entity's archived years overlapping start..end to conn; returns their schema names."""
+    rows = conn.execute('''
+        SELECT path FROM archived_years WHERE entity_id = ? AND end_date >= ? AND start_date <= ? ORDER BY start_date
+    ''', (current_entity(), str(start or "0000"), str(end or "9999"))).fetchall()
+    schemas = []
+    for i, (path,) in enumerate(rows):
+        conn.execute(f"ATTACH DATABASE ? AS fy_{i}", (_archive_file(path),))
+        schemas.append(f"fy_{i}")
+    return schemas
+
+def _ledger_from(conn, table, schemas):
+    """FROM-clause source for `table`: the live table, or it combined with its archived copies."""
+    if not schemas:
+        return table
+    columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+    parts = [f"SELECT {columns} FROM {schema}.{table}" for schema in ("main", *schemas)]
+    return f"({' UNION ALL '.join(parts)}) AS {table}"
+
+def ledger_connection(start=None, end=None):
+    """
+    Connection with the archived years overlapping start..end attached, plus the FROM-clause
+    source to use for invoices and expenses. Without such years both are the live tables.
+    """
+    conn = get_connection()
+    schemas = _attach_archives(conn, start, end)
+    return conn, {table: _ledger_from(conn, table, schemas) for table in ("invoices", "expenses")}
+
+# ── Filed returns ────────────────────────────────────────────────
+
+MONTH_NAMES = list(calendar.month_name)[1:]
+
+def return_period_bounds(fy, period):
+    """First and last ISO date of a monthly return period, e.g. ('2024-25', 'January') → 2025-01-01..2025-01-31."""
+    month = MONTH_NAMES.index(period) + 1
+    year = int(str(fy)[:4]) + (0 if month >= 4 else 1)
+    last_day = calendar.monthrange(year, month)[1]
+    return datetime.date(year, month, 1).isoformat(), datetime.date(year, month, last_day).isoformat()
+
+def record_filed_return(return_type, fy, period, figures, payload, filing_run_id=None):
+    """Snapshot what was filed for a period; from now on its invoices (and, for GSTR-3B, expenses) are locked."""
+    period_start, period_end = return_period_bounds(fy, period)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO filed_returns (entity_id, return_type, fy, period, period_start, period_end, figures, payload,
+                                   filing_run_id, filed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (entity_id, return_type, period_start) DO UPDATE SET
+            figures = excluded.figures, payload = excluded.payload,
+            filing_run_id = excluded.filing_run_id, filed_at = excluded.filed_at
+    ''', (current_entity(), return_type, fy, period, period_start, period_end, json.dumps(figures),
+          json.dumps(payload, default=str), filing_run_id, _now()))
+    conn.commit()
+    conn.close()
+
+def get_filed_returns():
+    conn = get_connection()
+    df = pd.read_sql('''
+        SELECT id, return_type, fy, period, period_start, period_end, figures, filing_run_id, filed_at
+        FROM filed_returns WHERE entity_id = ? ORDER BY period_start DESC, return_type
+    ''', conn, params=(current_entity(),))
+    conn.close()
+    return df
+
+def get_filed_return(return_type, fy, period):
+    """The snapshot of a filed return as a dict (figures and payload decoded), or None if not filed."""
+    period_start, _ = return_period_bounds(fy, period)
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM filed_returns WHERE entity_id = ? AND return_type = ? AND period_start = ?",
+                       (current_entity(), return_type, period_start)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    filed = dict(row)
+    filed["figures"], filed["payload"] = json.loads(filed["figures"]), json.loads(filed["payload"])
+    return filed
+
+def filed_return_for(date, table="invoices"):
+    """Return type whose filed period locks `table` rows dated `date`, or None when the period is open."""
+    conn = get_connection()
+    row = conn.execute(f'''
+        SELECT return_type FROM filed_returns
+        WHERE entity_id = ? AND return_type IN ({_LOCKING_RETURNS[table]}) AND ? BETWEEN period_start AND period_end
+        ORDER BY return_type LIMIT 1
+    ''', (current_entity(), str(date))).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def _return_figures(sales_taxable=0.0, output_tax=None, input_tax=None):
+    output_tax = output_tax or {"igst": 0.0, "cgst": 0.0, "sgst": 0.0}
+    input_tax = input_tax or {"igst": 0.0, "cgst": 0.0, "sgst": 0.0}
+    return {"sales_taxable": sales_taxable, "output_tax": output_tax, "input_tax": input_tax}
+
+def get_return_summary(start_month, end_month):
+    """
+    GSTR-1/3B figures per 'YYYY-MM' month start..end. Months with a filed GSTR-3B are read
+    from its snapshot (a GSTR-1 snapshot supplies the sales side); only open months are
+    aggregated from the ledger, in one grouped query over their date range.
+    """
+    months = pd.period_range(start_month, end_month, freq="M").astype(str).tolist()
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT return_type, period_start, figures FROM filed_returns
+        WHERE entity_id = ? AND period_start >= ? AND period_start <= ?
+    ''', (current_entity(), f"{months[0]}-01", f"{months[-1]}-31")).fetchall()
+    filed = {(period_start[:7], return_type): json.loads(figures) for return_type, period_start, figures in rows}
+    conn.close()
+
+    live = {}
+    open_months = [month for month in months if (month, "GSTR-3B") not in filed]
+    if open_months:
+        start, end = f"{open_months[0]}-01", f"{open_months[-1]}-31"
+        conn, source = ledger_connection(start, end)
+        for table, side in (("invoices", "output_tax"), ("expenses", "input_tax")):
+            for month, taxable, igst, cgst, sgst in conn.execute(f'''
+                SELECT strftime('%Y-%m', date), SUM(taxable_value), SUM(igst), SUM(cgst), SUM(sgst)
+                FROM {source[table]} WHERE entity_id = ? AND date >= ? AND date <= ? GROUP BY 1
+            ''', (current_entity(), start, end)):
+                figures = live.setdefault(month, _return_figures())
+                figures[side] = {"igst": igst or 0.0, "cgst": cgst or 0.0, "sgst": sgst or 0.0}
+                if table == "invoices":
+                    figures["sales_taxable"] = taxable or 0.0
+        conn.close()
+
+    rows = []
+    for month in months:
+        if (month, "GSTR-3B") in filed:
+            figures, status = filed[(month, "GSTR-3B")], "Filed"
+        else:
+            figures, status = live.get(month, _return_figures()), "Open"
+            if (month, "GSTR-1") in filed:
+                gstr1 = filed[(month, "GSTR-1")]
+                figures = {**figures, "sales_taxable": gstr1["sales_taxable"], "output_tax": gstr1["output_tax"]}
+                status = "GSTR-1 Filed"
+        output_tax, input_tax = figures["output_tax"], figures["input_tax"]
+        gst_collected, itc = sum(output_tax.values()), sum(input_tax.values())
+        rows.append({
+            "period": month, "status": status, "sales_taxable": figures["sales_taxable"],
+            **{f"output_{head}": amount for head, amount in output_tax.items()},
+            **{f"input_{head}": amount for head, amount in input_tax.items()},
+            "gst_collected": gst_collected, "itc": itc, "net_payable": max(0, gst_collected - itc),
+        })
+    return pd.DataFrame(rows)
 
-# Initialize DB on import (will create new table if missing)
+# Initialize DB on import (will create new table if missing); last, once every helper is defined
 init_db()
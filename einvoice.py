@@ -0,0 +1,325 @@
+"""
+E-invoice (IRN) payload generation for AI-Accountant
+=====================================================
+Converts stored B2B invoices (with their line items, if any) into the NIC
+e-invoice JSON schema (version 1.1) and validates each payload locally
+before it goes anywhere. The JSON schema is compiled once per process into
+a validator function; large batches are built and validated across a
+process pool.
+
+Submission goes through a `Submitter`. `LocalSubmitter` stands in for the
+IRP during testing: it returns an IRN computed the way the IRP computes it
+(SHA-256 of supplier GSTIN, financial year, document type and number) and
+rejects duplicates, including IRNs already stored on invoices. A real GSP/IRP client is registered the same way:
+
+    einvoice.register_submitter("my_gsp", MyGspSubmitter)
+
+Whether e-invoicing applies depends on the business's aggregate turnover,
+not on the invoice, so every B2B invoice in the period is converted.
+"""
+
+import abc
+import functools
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import fastjsonschema
+
+import database as db
+import gstin as gstin_lib
+
+SCHEMA_VERSION = "1.1"
+INLINE_LIMIT = 1000  # batches this small are built without starting a pool
+TOTAL_TOLERANCE = 1.0  # rupees the invoice value may differ from the sum of its parts (IRP allows rounding)
+
+_AMOUNT = {"type": "number", "minimum": 0, "maximum": 999999999999.99}
+_STATE = {"type": "string", "pattern": "^[0-9]{1,2}$"}
+
+
+def _party(gstin_pattern, buyer=False):
+    party = {
+        "type": "object",
+        "required": ["Gstin", "LglNm", "Addr1", "Loc", "Pin", "Stcd"],
+        "properties": {
+            "Gstin": {"type": "string", "pattern": gstin_pattern},
+            "LglNm": {"type": "string", "minLength": 3, "maxLength": 100},
+            "Addr1": {"type": "string", "minLength": 1, "maxLength": 100},
+            "Loc": {"type": "string", "minLength": 3, "maxLength": 50},
+            "Pin": {"type": "integer", "minimum": 100000, "maximum": 999999},
+            "Stcd": _STATE,
+        },
+    }
+    if buyer:
+        party["required"].append("Pos")  # place of supply
+        party["properties"]["Pos"] = _STATE
+    return party
+
+
+# The parts of the NIC e-invoice schema (v1.1) that our payloads use
+SCHEMA = {
+    "type": "object",
+    "required": ["Version", "TranDtls", "DocDtls", "SellerDtls", "BuyerDtls", "ItemList", "ValDtls"],
+    "properties": {
+        "Version": {"type": "string", "enum": [SCHEMA_VERSION]},
+        "TranDtls": {
+            "type": "object",
+            "required": ["TaxSch", "SupTyp"],
+            "properties": {
+                "TaxSch": {"type": "string", "enum": ["GST"]},
+                "SupTyp": {"type": "string", "enum": ["B2B", "SEZWP", "SEZWOP", "EXPWP", "EXPWOP", "DEXP"]},
+                "RegRev": {"type": "string", "enum": ["Y", "N"]},
+                "IgstOnIntra": {"type": "string", "enum": ["Y", "N"]},
+            },
+        },
+        "DocDtls": {
+            "type": "object",
+            "required": ["Typ", "No", "Dt"],
+            "properties": {
+                "Typ": {"type": "string", "enum": ["INV", "CRN", "DBN"]},
+                "No": {"type": "string", "pattern": "^[a-zA-Z1-9][a-zA-Z0-9/-]{0,15}$"},
+                "Dt": {"type": "string", "pattern": "^[0-3][0-9]/[0-1][0-9]/20[1-9][0-9]$"},
+            },
+        },
+        "SellerDtls": _party("^[0-9]{2}[0-9A-Z]{13}$"),
+        "BuyerDtls": _party("^([0-9]{2}[0-9A-Z]{13}|URP)$", buyer=True),
+        "ItemList": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 1000,
+            "items": {
+                "type": "object",
+                "required": ["SlNo", "IsServc", "HsnCd", "UnitPrice", "TotAmt", "AssAmt", "GstRt", "TotItemVal"],
+                "properties": {
+                    "SlNo": {"type": "string", "minLength": 1, "maxLength": 6},
+                    "PrdDesc": {"type": "string", "maxLength": 300},
+                    "IsServc": {"type": "string", "enum": ["Y", "N"]},
+                    "HsnCd": {"type": "string", "pattern": "^[0-9]{4,8}$"},
+                    "Qty": {"type": "number", "minimum": 0},
+                    "Unit": {"type": "string", "minLength": 3, "maxLength": 8},
+                    "UnitPrice": _AMOUNT,
+                    "TotAmt": _AMOUNT,
+                    "AssAmt": _AMOUNT,
+                    "GstRt": {"type": "number", "enum": [0, 0.1, 0.25, 1, 1.5, 3, 5, 6, 7.5, 12, 18, 28]},
+                    "IgstAmt": _AMOUNT,
+                    "CgstAmt": _AMOUNT,
+                    "SgstAmt": _AMOUNT,
+                    "TotItemVal": _AMOUNT,
+                },
+            },
+        },
+        "ValDtls": {
+            "type": "object",
+            "required": ["AssVal", "TotInvVal"],
+            "properties": {
+                "AssVal": _AMOUNT, "CgstVal": _AMOUNT, "SgstVal": _AMOUNT, "IgstVal": _AMOUNT, "TotInvVal": _AMOUNT,
+            },
+        },
+    },
+}
+
+
+@functools.lru_cache(maxsize=1)
+def validator():
+    """SCHEMA compiled to a validator function; cached so each process compiles it once."""
+    return fastjsonschema.compile(SCHEMA)
+
+
+# ── Payloads ─────────────────────────────────────────────────────
+
+def _r2(value):
+    return round(float(value or 0), 2)
+
+
+def _pin(value):
+    digits = "".join(ch for ch in str(value or "") if ch.isdigit())
+    return int(digits) if digits else None
+
+
+def build_payload(invoice, items, seller):
+    """NIC e-invoice JSON (as a dict) for one invoice dict, its item dicts and the seller profile."""
+    if not items:
+        # Invoices saved before line items: one line from the header
+        items = [{"hsn_code": "", "description": "", "quantity": 1, "unit": "OTH", "rate": invoice["taxable_value"],
+                  "taxable_value": invoice["taxable_value"], "gst_rate": invoice["gst_rate"], "igst": invoice["igst"],
+                  "cgst": invoice["cgst"], "sgst": invoice["sgst"], "total_amount": invoice["total_amount"]}]
+    buyer_gstin = gstin_lib.normalize(invoice["gstin"])
+    buyer_state = buyer_gstin[:2]
+    seller_gstin = gstin_lib.normalize(seller.get("gstin"))
+
+    lines = []
+    for number, item in enumerate(items, start=1):
+        hsn = str(item.get("hsn_code") or "").strip()
+        line = {
+            "SlNo": str(number),
+            "PrdDesc": str(item.get("description") or "")[:300],
+            "IsServc": "Y" if hsn.startswith("99") else "N",
+            "HsnCd": hsn,
+            "Qty": round(float(item.get("quantity") or 0), 3),
+            "UnitPrice": round(float(item.get("rate") or 0), 3),
+            "TotAmt": _r2(item.get("taxable_value")),
+            "AssAmt": _r2(item.get("taxable_value")),
+            "GstRt": float(item.get("gst_rate") or 0),
+            "IgstAmt": _r2(item.get("igst")),
+            "CgstAmt": _r2(item.get("cgst")),
+            "SgstAmt": _r2(item.get("sgst")),
+            "TotItemVal": _r2(item.get("total_amount")),
+        }
+        if line["IsServc"] == "N":
+            line["Unit"] = item.get("unit") or "OTH"
+        lines.append(line)
+
+    return {
+        "Version": SCHEMA_VERSION,
+        "TranDtls": {"TaxSch": "GST", "SupTyp": "B2B", "RegRev": "N", "IgstOnIntra": "N"},
+        "DocDtls": {"Typ": "INV", "No": str(invoice["invoice_no"] or ""),
+                    "Dt": date.fromisoformat(str(invoice["date"])[:10]).strftime("%d/%m/%Y")},
+        "SellerDtls": {"Gstin": seller_gstin, "LglNm": seller.get("name") or "",
+                       "Addr1": seller.get("address") or "", "Loc": seller.get("city") or "",
+                       "Pin": _pin(seller.get("pin")), "Stcd": seller_gstin[:2]},
+        "BuyerDtls": {"Gstin": buyer_gstin, "LglNm": invoice["customer_name"] or "", "Pos": buyer_state,
+                      "Addr1": invoice.get("customer_address") or "", "Loc": invoice.get("customer_city") or "",
+                      "Pin": _pin(invoice.get("customer_pin")), "Stcd": buyer_state},
+        "ItemList": lines,
+        "ValDtls": {"AssVal": _r2(invoice["taxable_value"]), "CgstVal": _r2(invoice["cgst"]),
+                    "SgstVal": _r2(invoice["sgst"]), "IgstVal": _r2(invoice["igst"]),
+                    "TotInvVal": _r2(invoice["total_amount"])},
+    }
+
+
+def validation_error(payload):
+    """Why the payload would be rejected (schema first, then totals), or None if it is valid."""
+    try:
+        validator()(payload)
+    except fastjsonschema.JsonSchemaValueException as e:
+        return e.message.replace("data.", "", 1)
+    values = payload["ValDtls"]
+    if abs(sum(line["AssAmt"] for line in payload["ItemList"]) - values["AssVal"]) > TOTAL_TOLERANCE:
+        return "ValDtls.AssVal doesn't match the sum of item AssAmt"
+    if abs(values["AssVal"] + values["CgstVal"] + values["SgstVal"] + values["IgstVal"]
+           - values["TotInvVal"]) > TOTAL_TOLERANCE:
+        return "ValDtls.TotInvVal doesn't match assessable value plus taxes"
+    return None
+
+
+def _build_job(job):
+    """Worker: build and validate one payload."""
+    invoice, items, seller = job
+    payload = build_payload(invoice, items, seller)
+    return {"invoice_id": invoice["id"], "invoice_no": invoice["invoice_no"], "payload": payload,
+            "error": validation_error(payload)}
+
+
+def seller_profile():
+    entity = db.get_entity() or {}
+    return {key: entity.get(key) or "" for key in ("name", "address", "city", "pin", "gstin")}
+
+
+def _with_items(invoices):
+    """[(invoice dict, item dicts)] for a DataFrame of invoices, with items fetched in one query."""
+    by_invoice = {}
+    for item in db.get_items_for_invoices(invoices["id"].tolist()).to_dict("records"):
+        by_invoice.setdefault(item["invoice_id"], []).append(item)
+    rows = invoices.astype(object).where(invoices.notna(), None).to_dict("records")
+    return [(row, by_invoice.get(row["id"], [])) for row in rows]
+
+
+def generate_period(start, end, workers=None, include_generated=False):
+    """
+    Build and validate e-invoice payloads for the B2B invoices dated start..end.
+    Invoices that already have an IRN are left out unless `include_generated`.
+    Returns a list of {"invoice_id", "invoice_no", "payload", "error"}.
+    """
+    invoices = db.get_invoices_between(start, end)
+    if invoices.empty:
+        return []
+    b2b = gstin_lib.validate_many(invoices["gstin"])["valid"].to_numpy()
+    invoices = invoices[b2b]
+    if not include_generated:
+        invoices = invoices[invoices["irn"].isna()]
+    seller = seller_profile()
+    jobs = [(invoice, items, seller) for invoice, items in _with_items(invoices)]
+
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) <= INLINE_LIMIT or workers == 1:
+        return [_build_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        return list(pool.map(_build_job, jobs, chunksize=chunksize))
+
+
+# ── Submission ───────────────────────────────────────────────────
+
+class SubmissionError(Exception):
+    """The IRP rejected a payload."""
+
+
+class Submitter(abc.ABC):
+    """Sends one payload to an IRP and returns {"Irn", "AckNo", "AckDt"}; raises SubmissionError on rejection."""
+
+    @abc.abstractmethod
+    def submit(self, payload):
+        ...
+
+
+def financial_year(doc_date):
+    """'dd/mm/yyyy' → '2025-26'."""
+    day = datetime.strptime(doc_date, "%d/%m/%Y").date()
+    first = day.year if day.month >= 4 else day.year - 1
+    return f"{first}-{str(first + 1)[2:]}"
+
+
+class LocalSubmitter(Submitter):
+    """Offline stand-in for the IRP: computes the IRN and acknowledgement without any network call."""
+
+    def __init__(self):
+        # IRNs issued in earlier runs are on the invoices, so duplicates are caught across runs too
+        self.issued = db.get_invoice_irns()
+
+    def submit(self, payload):
+        error = validation_error(payload)
+        if error:
+            raise SubmissionError(error)
+        doc = payload["DocDtls"]
+        key = f"{payload['SellerDtls']['Gstin']}{financial_year(doc['Dt'])}{doc['Typ']}{doc['No'].upper()}"
+        irn = hashlib.sha256(key.encode()).hexdigest()
+        if irn in self.issued:
+            raise SubmissionError("2150: Duplicate IRN")
+        self.issued.add(irn)
+        return {"Irn": irn, "AckNo": str(int(irn[:14], 16))[:15],
+                "AckDt": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+
+SUBMITTERS = {"local": LocalSubmitter}
+
+
+def register_submitter(name, factory):
+    """Make a Submitter class (or factory) selectable by name."""
+    SUBMITTERS[name] = factory
+
+
+def get_submitter(name=None):
+    """A new submitter by name; defaults to the 'einvoice_submitter' setting, else the local stub."""
+    return SUBMITTERS[name or db.get_setting("einvoice_submitter", "local")]()
+
+
+def submit_all(results, submitter=None):
+    """
+    Submit every valid payload from `generate_period` and store the IRNs.
+    Returns {"submitted", "failed": [(invoice_no, reason)]}.
+    """
+    submitter = submitter or get_submitter()
+    acks, failed = [], []
+    for result in results:
+        if result["error"]:
+            failed.append((result["invoice_no"], result["error"]))
+            continue
+        try:
+            ack = submitter.submit(result["payload"])
+        except SubmissionError as e:
+            failed.append((result["invoice_no"], str(e)))
+            continue
+        acks.append((result["invoice_id"], ack["Irn"], ack["AckNo"], ack["AckDt"]))
+    db.set_invoice_irns(acks)
+    return {"submitted": len(acks), "failed": failed}
@@ -0,0 +1,30 @@
+"""
+Sidebar business (entity) selector shared by the app and every page.
+
+The choice is kept in the session, so it follows the user across pages,
+and is handed to `database` as the current entity before any query runs.
+Fragment reruns skip the top of the script, so every `@st.fragment` calls
+`apply()` first.
+"""
+
+import streamlit as st
+
+import database as db
+
+
+def sidebar():
+    """Render the selector, make the chosen entity current and return it as a dict."""
+    entities = db.get_entities()
+    labels = {row.id: f"{row.name} ({row.gstin})" if row.gstin else row.name for row in entities.itertuples()}
+    ids = list(labels)
+    current = st.session_state.get("entity_id", db.DEFAULT_ENTITY)
+    entity_id = st.sidebar.selectbox("🏢 Business", ids, index=ids.index(current) if current in ids else 0,
+                                     format_func=labels.get)
+    st.session_state.entity_id = entity_id
+    db.set_current_entity(entity_id)
+    return db.get_entity(entity_id)
+
+
+def apply():
+    """Make the session's entity current again; the first line of every fragment."""
+    db.set_current_entity(st.session_state.get("entity_id", db.DEFAULT_ENTITY))
@@ -1,19 +1,54 @@
 from playwright.sync_api import sync_playwright
 import time
 import os
+import threading
+from collections import deque
 import base64
+import io
+import database as db
+from portal_network import PortalRouter, timed_goto
+from selector_registry import SelectorRegistry
+from bot_policy import PolicyEngine, policed_flow
+from artifact_store import ArtifactStore
+
+# Invoice fields recorded in the GSTR-1 snapshot, as entered on the portal
+GSTR1_FIELDS = ("id", "date", "invoice_no", "customer_name", "gstin", "taxable_value", "gst_rate",
+                "igst", "cgst", "sgst", "total_amount")
+
+# Portal messages that mean a tab's edit was refused because another tab/session is editing
+CONCURRENT_EDIT_ERRORS = r"/another session|concurrent|already in progress|being modified|try again later/i"
+
 
 class GSTBot:
-    def __init__(self, headless=False, message_callback=None):
+    def __init__(self, headless=False, message_callback=None, progress_callback=None, network_policy=None,
+                 artifact_store=None, artifact_callback=None, screenshot_format="jpeg", screenshot_quality=60):
         self.headless = headless
+        # Screenshots go to an in-memory ring buffer, rendered inline by the UI
+        self.artifacts = artifact_store if artifact_store is not None else ArtifactStore()
+        self.artifact_callback = artifact_callback
+        self.screenshot_format = screenshot_format  # "jpeg", "png" or "webp"
+        self.screenshot_quality = screenshot_quality
+        # Request blocking / static-asset caching (see portal_network.NetworkPolicy)
+        self.router = PortalRouter(network_policy)
+        # Learned, persisted ranking of candidate locators per portal action
+        self.selectors = SelectorRegistry()
+        # Retries, per-flow time budgets and circuit breaker for every portal step
+        self.policy = PolicyEngine(log=self.log)
         self.browser = None
         self.page = None
         self.playwright = None
         self.message_callback = message_callback
+        self.progress_callback = progress_callback
         self.logged_in = False
+        # Set from another thread to cut a long wait short (e.g. "I've Logged In")
+        self.interrupt_event = threading.Event()
         # For agent-waiting state (user input via chat)
         self._pending_question = None
         self._user_reply = None
+        # Filing-run journal id of the return currently being prepared
+        self.filing_run_id = None
+        # (return_type, fy, period, figures, payload) of the prepared return, recorded once the OTP is confirmed
+        self.pending_return = None
 
     def log(self, message):
         if self.message_callback:
@@ -21,6 +56,11 @@ class GSTBot:
         else:
             print(message)
 
+    def progress(self, label, done, total):
+        """Report step progress (e.g. invoices entered so far) to the progress callback."""
+        if self.progress_callback:
+            self.progress_callback(label, done, total)
+
     def ask_user(self, question):
         """Log a question and set the agent to waiting state."""
         self.log(f"🙋 **INPUT NEEDED:** {question}")
@@ -38,43 +78,100 @@ class GSTBot:
 
     # ── Robust helpers ──────────────────────────────────────────────
 
-    def _safe_click(self, selector, timeout=10000):
+    # Each helper runs through self.policy: retried with backoff, timeout capped by the
+    # flow budget, and raising FlowAborted for required steps or a degraded portal.
+
+    def _safe_click(self, selector, timeout=None, step=None):
         """Click with retry and wait for element."""
-        try:
-            self.page.wait_for_selector(selector, timeout=timeout)
-            self.page.click(selector)
+        def attempt(timeout_ms):
+            self.page.wait_for_selector(selector, timeout=timeout_ms)
+            self.page.click(selector, timeout=timeout_ms)
             return True
-        except Exception as e:
-            self.log(f"⚠️ Could not click `{selector}`: {e}")
-            return False
+        if self.policy.run(step or selector, attempt, timeout):
+            return True
+        self.log(f"⚠️ Could not click `{selector}`.")
+        return False
 
-    def _safe_fill(self, selector, value, timeout=10000):
+    def _safe_fill(self, selector, value, timeout=None, step=None):
         """Fill input with retry."""
-        try:
-            self.page.wait_for_selector(selector, timeout=timeout)
-            self.page.fill(selector, str(value))
+        def attempt(timeout_ms):
+            self.page.wait_for_selector(selector, timeout=timeout_ms)
+            self.page.fill(selector, str(value), timeout=timeout_ms)
             return True
-        except Exception as e:
-            self.log(f"⚠️ Could not fill `{selector}`: {e}")
-            return False
+        if self.policy.run(step or selector, attempt, timeout):
+            return True
+        self.log(f"⚠️ Could not fill `{selector}`.")
+        return False
 
-    def _wait_and_click(self, text, timeout=10000):
+    def _wait_and_click(self, text, timeout=None, step=None):
         """Click an element by its visible text."""
-        try:
+        def attempt(timeout_ms):
             locator = self.page.get_by_text(text, exact=False).first
-            locator.wait_for(timeout=timeout)
-            locator.click()
+            locator.wait_for(timeout=timeout_ms)
+            locator.click(timeout=timeout_ms)
             return True
-        except Exception as e:
-            self.log(f"⚠️ Could not find text '{text}': {e}")
-            return False
+        if self.policy.run(step or text, attempt, timeout):
+            return True
+        self.log(f"⚠️ Could not find text '{text}'.")
+        return False
+
+    def _select(self, step, selector, label, required=None):
+        """Pick an <option> by label."""
+        def attempt(timeout_ms):
+            return self.page.select_option(selector, label=label, timeout=timeout_ms)
+        return bool(self.policy.run(step, attempt, required=required))
+
+    def _click_action(self, action, timeout=None, page=None):
+        """Click a logical portal action using the learned selector ranking."""
+        def attempt(timeout_ms):
+            candidate, locator = self.selectors.resolve(page or self.page, action, timeout=timeout_ms)
+            if locator is None:
+                return False
+            locator.click(timeout=timeout_ms)
+            return True
+        if self.policy.run(action, attempt, timeout):
+            return True
+        self.log(f"⚠️ Could not find `{action}` on this page.")
+        return False
+
+    def _fill_action(self, action, value, timeout=None, page=None):
+        """Fill a logical portal input using the learned selector ranking."""
+        def attempt(timeout_ms):
+            candidate, locator = self.selectors.resolve(page or self.page, action, timeout=timeout_ms)
+            if locator is None:
+                return False
+            locator.fill(str(value), timeout=timeout_ms)
+            return True
+        if self.policy.run(action, attempt, timeout):
+            return True
+        self.log(f"⚠️ Could not fill input `{action}`.")
+        return False
+
+    def _goto(self, url):
+        """Navigate and wait for network idle, timing page-ready for the network stats."""
+        timed_goto(self.page, url, self.router)
 
-    def take_screenshot(self):
-        """Take a screenshot and return base64 for chat display."""
+    def take_screenshot(self, label="screenshot", clip=None, full_page=False):
+        """Capture the page into the artifact store and return the artifact id for chat display."""
         try:
-            path = os.path.join(os.path.dirname(__file__), "screenshot.png")
-            self.page.screenshot(path=path)
-            return path
+            fmt = self.screenshot_format
+            if fmt == "png":
+                data, mime = self.page.screenshot(type="png", clip=clip, full_page=full_page), "image/png"
+            elif fmt == "webp":
+                # Playwright only encodes PNG/JPEG; transcode with Pillow (installed with streamlit)
+                from PIL import Image
+                png = self.page.screenshot(type="png", clip=clip, full_page=full_page)
+                out = io.BytesIO()
+                Image.open(io.BytesIO(png)).save(out, format="WEBP", quality=self.screenshot_quality)
+                data, mime = out.getvalue(), "image/webp"
+            else:
+                data = self.page.screenshot(type="jpeg", quality=self.screenshot_quality,
+                                            clip=clip, full_page=full_page)
+                mime = "image/jpeg"
+            artifact_id = self.artifacts.add(data, label=label, mime=mime)
+            if self.artifact_callback:
+                self.artifact_callback(artifact_id, label)
+            return artifact_id
         except Exception as e:
             self.log(f"⚠️ Screenshot failed: {e}")
             return None
@@ -88,50 +185,63 @@ class GSTBot:
             args=["--start-maximized"]
         )
         self.context = self.browser.new_context(viewport={"width": 1280, "height": 720})
+        self.router.attach(self.context)
         self.page = self.context.new_page()
         
+    @policed_flow("login")
     def login(self, username, password):
         if not self.page:
             self.start()
         
         try:
             self.log("🌐 Navigating to GST Portal...")
-            self.page.goto("https://services.gst.gov.in/services/login")
-            self.page.wait_for_load_state("networkidle")
+            self._goto("https://services.gst.gov.in/services/login")
             
             self.log("🔑 Filling credentials...")
             self._safe_fill("#username", username)
             self._safe_fill("#user_pass", password)
             
             # Focus on captcha field for user
-            self._safe_click("#captcha")
+            self._safe_click("#captcha", step="captcha")
             
             return "✅ Credentials filled. Please solve the CAPTCHA and click Login. Enter OTP if prompted. I will detect when you reach the Dashboard."
             
         except Exception as e:
             return f"❌ Error during login: {str(e)}"
 
-    def wait_for_login(self, timeout=300):
-        """Polls until dashboard is detected after user completes CAPTCHA/OTP."""
+    def wait_for_login(self, timeout=300, poll_interval=2):
+        """Polls until dashboard is detected after user completes CAPTCHA/OTP.
+
+        Waits in short slices so `interrupt_event` can end the watch early. The event
+        is not cleared here (BotWorker clears it between commands), so an interrupt
+        sent before the wait starts still ends it.
+        """
         self.log("👀 Watching for successful login... (Solve CAPTCHA & OTP in the browser)")
-        try:
-            self.page.wait_for_url("**/auth/**", timeout=timeout * 1000)
-            self.logged_in = True
-            self.log("✅ **Login successful!** I am now in control of the portal.")
-            time.sleep(2)
-            return True
-        except:
+        deadline = time.time() + timeout
+        while time.time() < deadline and not self.interrupt_event.is_set():
+            try:
+                slice_ms = int(min(poll_interval, max(deadline - time.time(), 0.1)) * 1000)
+                self.page.wait_for_url("**/auth/**", timeout=slice_ms)
+                self.logged_in = True
+                self.log("✅ **Login successful!** I am now in control of the portal.")
+                time.sleep(2)
+                return True
+            except Exception:
+                continue
+        if self.interrupt_event.is_set():
+            self.log("⏹️ Stopped watching for login.")
+        else:
             self.log("⏰ Login detection timed out. Please make sure you are logged in.")
-            return False
+        return False
 
     # ── Notifications ───────────────────────────────────────────────
 
+    @policed_flow("get_notifications")
     def get_notifications(self):
         """Scrapes the 'Notices and Orders' tab."""
         try:
             self.log("📬 Navigating to Notices...")
-            self.page.goto("https://services.gst.gov.in/services/auth/viewnotices")
-            self.page.wait_for_load_state("networkidle")
+            self._goto("https://services.gst.gov.in/services/auth/viewnotices")
             time.sleep(2)
             
             notices = []
@@ -155,43 +265,43 @@ class GSTBot:
 
     # ── GSTR-1 Filing ───────────────────────────────────────────────
 
-    def file_gstr1(self, fy, period, invoices_df):
+    @policed_flow("file_gstr1")
+    def file_gstr1(self, fy, period, invoices_df, resume=False, parallel_tabs=1):
         """
         Full GSTR-1 filing workflow.
         Steps: Navigate → Select period → Prepare Online → Add invoices → Preview → Submit
+
+        Every invoice is journaled in `filing_run_items`. With resume=True the latest
+        interrupted run for the same FY/period is reused and invoices already saved
+        on the portal are skipped. parallel_tabs > 1 spreads B2B entry over that many
+        tabs of the same session (see `_fill_b2b_parallel`).
         """
         self.log(f"📤 **Starting GSTR-1 Filing** for {period} {fy}")
+        self.pending_return = None
+        self.filing_run_id = self._open_filing_run("GSTR-1", fy, period, invoices_df, resume)
         
         try:
             # Step 1: Navigate to Returns
             self.log("1️⃣ Navigating to Returns dashboard...")
-            self.page.goto("https://services.gst.gov.in/services/auth/returns")
-            self.page.wait_for_load_state("networkidle")
+            self._goto("https://services.gst.gov.in/services/auth/returns")
             time.sleep(2)
             
-            # Step 2: Select Financial Year
+            # Step 2: Select Financial Year (required: filing the wrong year is worse than stopping)
             self.log(f"2️⃣ Selecting FY: {fy}")
-            try:
-                self.page.select_option("select[id='finYear']", label=fy)
-                time.sleep(1)
-            except:
-                self.log("⚠️ Could not auto-select FY. Please select manually if needed.")
+            self._select("select_fy", "select[id='finYear']", fy)
+            time.sleep(1)
             
             # Step 3: Select Period
             self.log(f"3️⃣ Selecting Period: {period}")
-            try:
-                self.page.select_option("select[id='quarter']", label=period)
+            if self._select("select_period", "select[id='quarter']", period, required=False):
                 time.sleep(1)
-            except:
+            else:
                 self.log("⚠️ Could not auto-select period. Trying alternative selectors...")
-                try:
-                    self._wait_and_click(period)
-                except:
-                    pass
+                self._wait_and_click(period, step="select_period")
             
             # Step 4: Click SEARCH
             self.log("4️⃣ Clicking SEARCH...")
-            clicked = self._wait_and_click("SEARCH") or self._safe_click("button[type='submit']")
+            clicked = self._click_action("search")
             time.sleep(3)
             
             # Step 5: Click GSTR-1 Prepare Online
@@ -199,72 +309,118 @@ class GSTBot:
             time.sleep(2)
             
             # Try clicking Prepare Online under GSTR-1
-            gstr1_clicked = self._wait_and_click("PREPARE ONLINE")
-            if not gstr1_clicked:
-                gstr1_clicked = self._wait_and_click("Prepare Online")
+            gstr1_clicked = self._click_action("prepare_online")
             if not gstr1_clicked:
                 # Try direct navigation
                 self.log("Trying direct GSTR-1 URL...")
-                self.page.goto("https://return.gst.gov.in/returns/auth/gstr1")
-                self.page.wait_for_load_state("networkidle")
+                self._goto("https://return.gst.gov.in/returns/auth/gstr1")
             
             time.sleep(3)
             
             # Step 6: Fill invoice data
             self.log(f"6️⃣ Processing {len(invoices_df)} invoices from your database...")
-            self._fill_gstr1_invoices(invoices_df)
+            self._fill_gstr1_invoices(invoices_df, self.filing_run_id, parallel_tabs)
+            db.update_filing_run_status(self.filing_run_id, "Prepared")
             
             # Step 7: Preview
             self.log("7️⃣ Generating preview...")
-            self._wait_and_click("PREVIEW")
+            self._click_action("preview")
             time.sleep(3)
             
             # Step 8: Take screenshot and ask for confirmation
-            screenshot = self.take_screenshot()
+            self.pending_return = ("GSTR-1", fy, period, *self._gstr1_snapshot(invoices_df))
+            self.take_screenshot("GSTR-1 preview")
             self.log("📸 Preview generated. Check the browser window.")
             self.ask_user("Ready to SUBMIT GSTR-1? Type **yes** to proceed or **no** to cancel.")
             
             return "GSTR-1 prepared. Waiting for your confirmation to submit."
             
         except Exception as e:
+            db.update_filing_run_status(self.filing_run_id, "Interrupted")
             self.log(f"❌ Error during GSTR-1 filing: {str(e)}")
+            self.log("↩️ Progress is saved. Run GSTR-1 again with **Resume** to continue from the first unsaved invoice.")
             return f"Error: {str(e)}"
 
-    def _fill_gstr1_invoices(self, invoices_df):
-        """Fill B2B/B2C invoice sections in GSTR-1."""
+    @classmethod
+    def _gstr1_snapshot(cls, invoices_df):
+        """Figures and payload (the invoice rows entered) of a GSTR-1, for `filed_returns`."""
+        def total(column):
+            return round(float(invoices_df[column].sum()), 2) if column in invoices_df else 0.0
+
+        figures = {
+            "invoice_count": len(invoices_df),
+            "b2b_count": len(cls._split_b2b_b2c(invoices_df)[0]) if "gstin" in invoices_df else 0,
+            "sales_taxable": total("taxable_value"),
+            "sales_total": total("total_amount"),
+            "output_tax": {head: total(head) for head in ("igst", "cgst", "sgst")},
+        }
+        rows = invoices_df[[column for column in GSTR1_FIELDS if column in invoices_df]]
+        return figures, rows.astype(object).where(rows.notna(), None).to_dict("records")
+
+    @staticmethod
+    def _split_b2b_b2c(invoices_df):
+        """Separate B2B (with GSTIN) and B2C (without GSTIN) invoices."""
+        b2b = invoices_df[invoices_df['gstin'].notna() & (invoices_df['gstin'] != '')]
+        b2c = invoices_df[~invoices_df.index.isin(b2b.index)]
+        return b2b, b2c
+
+    @staticmethod
+    def _journal_key(inv):
+        """Stable journal key for a B2B invoice row."""
+        return f"B2B:{inv.get('id', inv.get('invoice_no', ''))}"
+
+    def _open_filing_run(self, return_type, fy, period, invoices_df, resume):
+        """Create (or, when resuming, reopen) the journal for a filing run."""
+        items = []
+        if not invoices_df.empty:
+            b2b, b2c = self._split_b2b_b2c(invoices_df)
+            items = [(self._journal_key(inv), str(inv.get('invoice_no', ''))) for _, inv in b2b.iterrows()]
+            if not b2c.empty:
+                items.append(("B2C:SUMMARY", None))
+
+        run_id = db.get_resumable_filing_run(return_type, fy, period) if resume else None
+        if run_id is None:
+            return db.create_filing_run(return_type, fy, period, items)
+
+        db.add_filing_run_items(run_id, items)
+        db.update_filing_run_status(run_id, "In Progress")
+        saved = sum(1 for s in db.get_filing_run_status(run_id).values() if s == "Saved")
+        self.log(f"↩️ Resuming filing run #{run_id}: {saved} of {len(items)} entries already saved.")
+        return run_id
+
+    def _fill_gstr1_invoices(self, invoices_df, run_id=None, parallel_tabs=1):
+        """Fill B2B/B2C invoice sections in GSTR-1, skipping entries the journal marks as saved."""
         if invoices_df.empty:
             self.log("📋 No invoices found in database to file.")
             return
         
-        # Separate B2B (with GSTIN) and B2C (without GSTIN)
-        b2b = invoices_df[invoices_df['gstin'].notna() & (invoices_df['gstin'] != '')]
-        b2c = invoices_df[~invoices_df.index.isin(b2b.index)]
+        b2b, b2c = self._split_b2b_b2c(invoices_df)
+        journal = db.get_filing_run_status(run_id) if run_id else {}
+        pending_b2b = [inv for _, inv in b2b.iterrows() if journal.get(self._journal_key(inv)) != "Saved"]
         
-        if not b2b.empty:
-            self.log(f"  📄 Adding {len(b2b)} B2B invoices...")
-            self._wait_and_click("B2B Invoices")
+        if pending_b2b:
+            skipped = len(b2b) - len(pending_b2b)
+            if skipped:
+                self.log(f"  ⏭️ Skipping {skipped} B2B invoices already saved in this run.")
+            self.log(f"  📄 Adding {len(pending_b2b)} B2B invoices...")
+            self._click_action("b2b_section")
             time.sleep(2)
             
-            for idx, inv in b2b.iterrows():
+            remaining = pending_b2b
+            if parallel_tabs > 1 and len(pending_b2b) > 1:
+                remaining = self._fill_b2b_parallel(pending_b2b, run_id, parallel_tabs)
+            
+            done_before = len(pending_b2b) - len(remaining)
+            for done, inv in enumerate(remaining, start=done_before + 1):
                 self.log(f"    → Invoice {inv.get('invoice_no', 'N/A')} | ₹{inv.get('total_amount', 0):,.2f}")
-                # Click Add
-                self._wait_and_click("ADD DETAILS")
-                time.sleep(1)
-                
-                # Fill fields
-                self._safe_fill("input[placeholder*='GSTIN']", str(inv.get('gstin', '')))
-                self._safe_fill("input[placeholder*='Invoice']", str(inv.get('invoice_no', '')))
-                self._safe_fill("input[placeholder*='Value']", str(inv.get('taxable_value', 0)))
-                
-                # Save
-                self._wait_and_click("SAVE")
-                time.sleep(1)
+                self._enter_b2b_invoice(inv, run_id)
+                self.progress("B2B invoices", done, len(pending_b2b))
             
             self.log(f"  ✅ B2B invoices added.")
         
-        if not b2c.empty:
+        if not b2c.empty and journal.get("B2C:SUMMARY") != "Saved":
             self.log(f"  📄 Adding {len(b2c)} B2C invoices...")
-            self._wait_and_click("B2C")
+            self._click_action("b2c_section")
             time.sleep(2)
             
             total_b2c = b2c['taxable_value'].sum()
@@ -274,44 +430,225 @@ class GSTBot:
             
             self.log(f"    → B2C Total Taxable: ₹{total_b2c:,.2f} | CGST: ₹{total_cgst:,.2f} | SGST: ₹{total_sgst:,.2f}")
             
-            self._safe_fill("input[placeholder*='Taxable']", str(total_b2c))
-            self._wait_and_click("SAVE")
+            self._fill_action("b2c_taxable", total_b2c)
+            saved = self._click_action("save")
             time.sleep(1)
+            self._journal_save(run_id, "B2C:SUMMARY", saved)
             self.log(f"  ✅ B2C summary added.")
 
+    def _b2b_entry_steps(self, inv, page):
+        """
+        Steps to add one B2B invoice on `page`, as a generator.
+        Yields the seconds to let the portal settle between steps and returns
+        whether SAVE was clicked, so several tabs can be interleaved.
+        """
+        # Click Add
+        self._click_action("add_details", page=page)
+        yield 1
+        
+        # Fill fields
+        self._fill_action("b2b_gstin", inv.get('gstin', ''), page=page)
+        self._fill_action("b2b_invoice_no", inv.get('invoice_no', ''), page=page)
+        self._fill_action("b2b_value", inv.get('taxable_value', 0), page=page)
+        
+        # Save
+        saved = self._click_action("save", page=page)
+        yield 1
+        return saved
+
+    @staticmethod
+    def _finish_steps(steps, ready_at=0.0):
+        """Run an entry generator to completion, waiting between steps; returns whether SAVE was clicked."""
+        wait = ready_at - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        while True:
+            try:
+                time.sleep(next(steps))
+            except StopIteration as finished:
+                return finished.value
+
+    def _enter_b2b_invoice(self, inv, run_id=None):
+        """Add one B2B invoice on the current page and journal the outcome."""
+        saved = self._finish_steps(self._b2b_entry_steps(inv, self.page))
+        self._journal_save(run_id, self._journal_key(inv), saved)
+
+    # ── Parallel B2B entry ──────────────────────────────────────────
+
+    def _open_b2b_tab(self):
+        """Open another tab in the logged-in context, positioned on the GSTR-1 B2B section."""
+        tab = self.context.new_page()
+        try:
+            timed_goto(tab, self.page.url, self.router)
+            if not self._click_action("b2b_section", page=tab):
+                raise RuntimeError("B2B section not found")
+            return tab
+        except Exception as e:
+            self.log(f"⚠️ Could not open extra tab: {e}")
+            tab.close()
+            return None
+
+    def _concurrent_edit_rejected(self, tab):
+        try:
+            return tab.locator(f"text={CONCURRENT_EDIT_ERRORS}").count() > 0
+        except Exception:
+            return False
+
+    def _fill_b2b_parallel(self, invoices, run_id, workers):
+        """
+        Enter B2B invoices across up to `workers` tabs of the same session.
+
+        Playwright's sync API is single-threaded, so tabs are interleaved: while one
+        tab waits for the portal to settle after ADD/SAVE, the next tab works.
+        Invoices are handed out from one queue (each goes to exactly one tab) and
+        journaled as they are saved. Before any failure is raised (or, if the portal
+        refuses concurrent edits, before falling back) the other in-flight tabs are
+        finished and journaled, since they may already be past SAVE. On a concurrent-
+        edit refusal the extra tabs are closed and the unsaved invoices are returned
+        for serial entry.
+        """
+        tabs = [self.page]
+        for _ in range(workers - 1):
+            tab = self._open_b2b_tab()
+            if tab is None:
+                break
+            tabs.append(tab)
+        if len(tabs) == 1:
+            self.log("  ↪️ Parallel entry unavailable, continuing serially.")
+            return invoices
+        self.log(f"  🗂️ Entering B2B invoices across {len(tabs)} tabs...")
+
+        todo = deque(invoices)
+        in_flight = {}  # tab index -> [steps, invoice, ready_at]
+        per_tab_done = [0] * len(tabs)
+        done = 0
+
+        def record(i):
+            nonlocal done
+            done += 1
+            per_tab_done[i] += 1
+            self.progress(f"B2B invoices (tab {i + 1}: {per_tab_done[i]})", done, len(invoices))
+
+        try:
+            while todo or in_flight:
+                for i in range(len(tabs)):
+                    if i not in in_flight and todo:
+                        inv = todo.popleft()
+                        self.log(f"    → [Tab {i + 1}] Invoice {inv.get('invoice_no', 'N/A')} | ₹{inv.get('total_amount', 0):,.2f}")
+                        in_flight[i] = [self._b2b_entry_steps(inv, tabs[i]), inv, 0.0]
+
+                # Advance whichever tab is ready soonest
+                i = min(in_flight, key=lambda k: in_flight[k][2])
+                steps, inv, ready_at = in_flight[i]
+                wait = ready_at - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    in_flight[i][2] = time.time() + next(steps)
+                    continue
+                except StopIteration as finished:
+                    saved = finished.value
+                    del in_flight[i]
+                except Exception:
+                    del in_flight[i]
+                    self._drain_in_flight(in_flight, tabs, run_id, record)
+                    raise
+
+                if not saved and self._concurrent_edit_rejected(tabs[i]):
+                    self.log("  ⚠️ Portal rejected concurrent edits. Falling back to serial entry.")
+                    return [inv] + self._drain_in_flight(in_flight, tabs, run_id, record) + list(todo)
+                if not saved:
+                    self._drain_in_flight(in_flight, tabs, run_id, record)
+
+                self._journal_save(run_id, self._journal_key(inv), saved)
+                record(i)
+            return []
+        finally:
+            for tab in tabs[1:]:
+                try:
+                    tab.close()
+                except Exception:
+                    pass
+
+    def _drain_in_flight(self, in_flight, tabs, run_id, record):
+        """
+        Finish every in-flight tab and journal the ones whose SAVE went through, so a
+        resumed run does not enter them again. Returns the invoices that were not saved.
+        """
+        unsaved = []
+        for j, (steps, inv, ready_at) in list(in_flight.items()):
+            try:
+                saved = self._finish_steps(steps, ready_at) and not self._concurrent_edit_rejected(tabs[j])
+            except Exception as e:
+                self.log(f"⚠️ [Tab {j + 1}] {e}")
+                saved = False
+            if saved:
+                self._journal_save(run_id, self._journal_key(inv), True)
+                record(j)
+            else:
+                unsaved.append(inv)
+        in_flight.clear()
+        return unsaved
+
+    def _journal_save(self, run_id, item_key, saved):
+        """Record an entry's save result; an unconfirmed save stops the run so it can be resumed."""
+        if not run_id:
+            return
+        if saved:
+            db.update_filing_item_status(run_id, item_key, "Saved")
+        else:
+            db.update_filing_item_status(run_id, item_key, "Failed", error="SAVE not confirmed")
+            raise RuntimeError(f"Could not save {item_key}; stopping so the run can be resumed")
+
+    @policed_flow("submit_gstr1")
     def submit_gstr1(self):
         """Submit GSTR-1 after user confirmation."""
         self.log("📤 Submitting GSTR-1...")
-        self._wait_and_click("SUBMIT")
+        self._click_action("submit")
         time.sleep(3)
         
         # EVC / DSC
         self.log("🔐 Selecting EVC (Electronic Verification Code)...")
-        self._wait_and_click("FILE WITH EVC")
+        self._click_action("file_with_evc")
         time.sleep(2)
         
         self.ask_user("Enter the **OTP** sent to your registered mobile/email:")
         return "Waiting for OTP..."
 
+    @policed_flow("confirm_otp")
     def confirm_otp(self, otp):
         """Enter OTP for EVC verification."""
         self.log(f"🔐 Entering OTP...")
-        self._safe_fill("input[type='text'][placeholder*='OTP']", otp)
-        self._safe_fill("input[id*='otp']", otp)
-        self._wait_and_click("VERIFY")
+        self._fill_action("otp_input", otp)
+        self._click_action("verify")
         time.sleep(3)
         
-        self.log("✅ **GSTR-1 filed successfully!**")
-        return "GSTR-1 Filed Successfully!"
+        return_type = "GSTR-1"
+        if self.pending_return:
+            return_type, fy, period, figures, payload = self.pending_return
+            db.record_filed_return(return_type, fy, period, figures, payload, self.filing_run_id)
+            self.pending_return = None
+        if self.filing_run_id:
+            db.update_filing_run_status(self.filing_run_id, "Filed")
+            self.filing_run_id = None
+        self.log(f"✅ **{return_type} filed successfully!**")
+        return f"{return_type} Filed Successfully!"
 
     # ── GSTR-3B Filing ──────────────────────────────────────────────
 
-    def file_gstr3b(self, fy, period, sales_total, gst_collected, itc_available):
+    @policed_flow("file_gstr3b")
+    def file_gstr3b(self, fy, period, sales_total, output_tax, input_tax):
         """
         Full GSTR-3B filing workflow.
         Steps: Navigate → Select period → Prepare → Fill liability & ITC → Preview → Submit
+
+        `output_tax` and `input_tax` are {"igst", "cgst", "sgst"} amounts, filled head by head.
         """
+        gst_collected = sum(output_tax.values())
+        itc_available = sum(input_tax.values())
         self.log(f"📤 **Starting GSTR-3B Filing** for {period} {fy}")
+        self.filing_run_id = None
+        self.pending_return = None
         
         net_tax = max(0, gst_collected - itc_available)
         self.log(f"  💰 Sales: ₹{sales_total:,.2f} | GST Collected: ₹{gst_collected:,.2f}")
@@ -320,31 +657,26 @@ class GSTBot:
         try:
             # Step 1: Navigate to Returns
             self.log("1️⃣ Navigating to Returns dashboard...")
-            self.page.goto("https://services.gst.gov.in/services/auth/returns")
-            self.page.wait_for_load_state("networkidle")
+            self._goto("https://services.gst.gov.in/services/auth/returns")
             time.sleep(2)
             
             # Step 2: Select FY & Period
             self.log(f"2️⃣ Selecting FY: {fy}, Period: {period}")
-            try:
-                self.page.select_option("select[id='finYear']", label=fy)
-                time.sleep(1)
-                self.page.select_option("select[id='quarter']", label=period)
-                time.sleep(1)
-            except:
-                self.log("⚠️ Could not auto-select FY/Period.")
+            self._select("select_fy", "select[id='finYear']", fy)
+            time.sleep(1)
+            self._select("select_period", "select[id='quarter']", period)
+            time.sleep(1)
             
             # Step 3: Click SEARCH
             self.log("3️⃣ Clicking SEARCH...")
-            self._wait_and_click("SEARCH")
+            self._click_action("search")
             time.sleep(3)
             
             # Step 4: Open GSTR-3B
             self.log("4️⃣ Opening GSTR-3B...")
-            gstr3b_clicked = self._wait_and_click("PREPARE ONLINE")
+            gstr3b_clicked = self._click_action("prepare_online")
             if not gstr3b_clicked:
-                self.page.goto("https://return.gst.gov.in/returns/auth/gstr3b")
-                self.page.wait_for_load_state("networkidle")
+                self._goto("https://return.gst.gov.in/returns/auth/gstr3b")
             time.sleep(3)
             
             # Step 5: Fill Section 3.1 - Tax Liability
@@ -352,28 +684,33 @@ class GSTBot:
             self._wait_and_click("3.1")
             time.sleep(2)
             self._safe_fill("input[id*='taxable']", str(sales_total))
-            self._safe_fill("input[id*='igst']", str(0))
-            self._safe_fill("input[id*='cgst']", str(gst_collected / 2))
-            self._safe_fill("input[id*='sgst']", str(gst_collected / 2))
-            self._wait_and_click("CONFIRM")
+            self._safe_fill("input[id*='igst']", f"{output_tax['igst']:.2f}")
+            self._safe_fill("input[id*='cgst']", f"{output_tax['cgst']:.2f}")
+            self._safe_fill("input[id*='sgst']", f"{output_tax['sgst']:.2f}")
+            self._click_action("confirm")
             time.sleep(2)
             
             # Step 6: Fill Section 4 - ITC
             self.log("6️⃣ Filling ITC (Section 4)...")
             self._wait_and_click("4.")
             time.sleep(2)
-            self._safe_fill("input[id*='itc_igst']", str(0))
-            self._safe_fill("input[id*='itc_cgst']", str(itc_available / 2))
-            self._safe_fill("input[id*='itc_sgst']", str(itc_available / 2))
-            self._wait_and_click("CONFIRM")
+            self._safe_fill("input[id*='itc_igst']", f"{input_tax['igst']:.2f}")
+            self._safe_fill("input[id*='itc_cgst']", f"{input_tax['cgst']:.2f}")
+            self._safe_fill("input[id*='itc_sgst']", f"{input_tax['sgst']:.2f}")
+            self._click_action("confirm")
             time.sleep(2)
             
             # Step 7: Preview
             self.log("7️⃣ Generating preview...")
-            self._wait_and_click("PREVIEW")
+            self._click_action("preview")
             time.sleep(3)
             
-            self.take_screenshot()
+            self.pending_return = ("GSTR-3B", fy, period,
+                                   {"sales_taxable": sales_total, "output_tax": output_tax, "input_tax": input_tax,
+                                    "net_payable": net_tax},
+                                   {"3.1": {"taxable": sales_total, **output_tax},
+                                    "4": {f"itc_{head}": amount for head, amount in input_tax.items()}})
+            self.take_screenshot("GSTR-3B preview")
             self.log("📸 Preview generated. Check the browser window.")
             self.ask_user("Ready to SUBMIT GSTR-3B? Type **yes** to proceed or **no** to cancel.")
             
@@ -383,14 +720,15 @@ class GSTBot:
             self.log(f"❌ Error during GSTR-3B filing: {str(e)}")
             return f"Error: {str(e)}"
 
+    @policed_flow("submit_gstr3b")
     def submit_gstr3b(self):
         """Submit GSTR-3B after confirmation."""
         self.log("📤 Submitting GSTR-3B...")
-        self._wait_and_click("SUBMIT")
+        self._click_action("submit")
         time.sleep(3)
         
         self.log("🔐 Selecting EVC...")
-        self._wait_and_click("FILE WITH EVC")
+        self._click_action("file_with_evc")
         time.sleep(2)
         
         self.ask_user("Enter the **OTP** sent to your registered mobile/email:")
@@ -398,23 +736,28 @@ class GSTBot:
 
     # ── Payment / Challan ───────────────────────────────────────────
 
-    def make_payment(self, amount):
-        """Navigate to payment section and create challan."""
+    @policed_flow("make_payment")
+    def make_payment(self, amount, heads=None):
+        """
+        Navigate to payment section and create challan.
+        `heads` is the {"igst", "cgst", "sgst"} cash payable; without it the amount is split into CGST/SGST halves.
+        """
+        heads = heads or {"igst": 0.0, "cgst": amount / 2, "sgst": amount / 2}
         self.log(f"💳 **Initiating Payment** for ₹{amount:,.2f}")
         
         try:
             self.log("1️⃣ Navigating to Create Challan...")
-            self.page.goto("https://services.gst.gov.in/services/auth/challan")
-            self.page.wait_for_load_state("networkidle")
+            self._goto("https://services.gst.gov.in/services/auth/challan")
             time.sleep(2)
             
             self.log("2️⃣ Filling challan details...")
             # The portal auto-fills GSTIN. We need to fill amounts
-            self._safe_fill("input[id*='cgst']", str(amount / 2))
-            self._safe_fill("input[id*='sgst']", str(amount / 2))
+            for head in ("igst", "cgst", "sgst"):
+                if heads.get(head):
+                    self._safe_fill(f"input[id*='{head}']", f"{heads[head]:.2f}")
             
             self.log("3️⃣ Select payment method in the browser.")
-            self.take_screenshot()
+            self.take_screenshot("Challan")
             self.ask_user("Select your payment method (Net Banking / NEFT / Over the Counter) in the browser, then type **done** when ready.")
             
             return "Challan prepared. Please select payment method."
@@ -428,8 +771,7 @@ class GSTBot:
     def navigate_to_return_dashboard(self, financial_year, quarter, period):
         """Navigates to the file return section."""
         try:
-            self.page.goto("https://services.gst.gov.in/services/auth/returns")
-            self.page.wait_for_load_state("networkidle")
+            self._goto("https://services.gst.gov.in/services/auth/returns")
             self.page.select_option("select[id='finYear']", label=financial_year)
             return "Navigated to Return Dashboard. Please select Period and click SEARCH."
         except Exception as e:
@@ -438,6 +780,10 @@ class GSTBot:
     # ── Cleanup ─────────────────────────────────────────────────────
 
     def close(self):
+        self.selectors.flush()
+        self.artifacts.close()
+        if self.router.stats["page_loads"]:
+            self.log(self.router.summary())
         if self.browser:
             self.browser.close()
         if self.playwright:
@@ -0,0 +1,147 @@
+"""
+GSTIN validation and state-code lookup.
+
+A GSTIN is 15 characters: a 2-digit state code, the holder's PAN, an
+entity number, a default 'Z' and a check character computed with a
+Luhn-style mod-36 algorithm. `validate_many` checks a whole column at
+once: it de-duplicates the column, skips values already cached, checks
+the rest with pandas string operations and one NumPy array operation for
+the check digits, and maps the results back. `validate` is the same for
+a single value.
+
+Place of supply follows from the state code: a counterparty registered in
+our own state is intra-state (CGST + SGST), anyone else is inter-state
+(IGST).
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+import database as db
+
+STATE_CODES = {
+    "01": "Jammu and Kashmir", "02": "Himachal Pradesh", "03": "Punjab", "04": "Chandigarh",
+    "05": "Uttarakhand", "06": "Haryana", "07": "Delhi", "08": "Rajasthan", "09": "Uttar Pradesh",
+    "10": "Bihar", "11": "Sikkim", "12": "Arunachal Pradesh", "13": "Nagaland", "14": "Manipur",
+    "15": "Mizoram", "16": "Tripura", "17": "Meghalaya", "18": "Assam", "19": "West Bengal",
+    "20": "Jharkhand", "21": "Odisha", "22": "Chhattisgarh", "23": "Madhya Pradesh", "24": "Gujarat",
+    "25": "Daman and Diu", "26": "Dadra and Nagar Haveli and Daman and Diu", "27": "Maharashtra",
+    "28": "Andhra Pradesh (Old)", "29": "Karnataka", "30": "Goa", "31": "Lakshadweep", "32": "Kerala",
+    "33": "Tamil Nadu", "34": "Puducherry", "35": "Andaman and Nicobar Islands", "36": "Telangana",
+    "37": "Andhra Pradesh", "38": "Ladakh", "97": "Other Territory", "99": "Centre Jurisdiction",
+}
+
+# State code, PAN (5 letters, 4 digits, 1 letter), entity number, 'Z', check character
+PATTERN = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")
+CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# ASCII code → position in CHARSET
+_CHAR_VALUE = np.full(128, -1, dtype=np.int64)
+_CHAR_VALUE[[ord(ch) for ch in CHARSET]] = np.arange(len(CHARSET))
+_FACTORS = np.tile([1, 2], 7)  # weights for the first 14 characters
+
+_CACHE = {}
+_CACHE_LIMIT = 50000
+
+
+def normalize(value):
+    return re.sub(r"\s+", "", str(value or "")).upper()
+
+
+def _check_chars(gstins):
+    """Expected check character for each of a list of 15-character, pattern-valid GSTINs."""
+    codes = np.frombuffer("".join(g[:14] for g in gstins).encode("ascii"), dtype=np.uint8).reshape(-1, 14)
+    products = _CHAR_VALUE[codes] * _FACTORS
+    totals = (products // 36 + products % 36).sum(axis=1)
+    return np.array(list(CHARSET))[(36 - totals % 36) % 36]
+
+
+def _errors(gstins):
+    """Error (or None) for each distinct normalized value, computed column-wise and cached."""
+    values = pd.Series(gstins, dtype=object)
+    errors = np.full(len(values), None, dtype=object)
+    shaped = values.str.match(PATTERN.pattern).to_numpy(dtype=bool)
+    known_state = values.str[:2].isin(STATE_CODES).to_numpy()
+    errors[~shaped] = "Invalid format"
+    errors[(values == "").to_numpy()] = "Missing"
+    errors[shaped & ~known_state] = "Unknown state code"
+    checkable = shaped & known_state
+    if checkable.any():
+        candidates = values[checkable]
+        bad = candidates.str[14].to_numpy() != _check_chars(candidates.tolist())
+        errors[np.flatnonzero(checkable)[bad]] = "Check digit mismatch"
+    results = dict(zip(gstins, errors))
+    if len(_CACHE) + len(results) > _CACHE_LIMIT:
+        _CACHE.clear()
+    _CACHE.update(results)
+    return results
+
+
+def validate(value):
+    """{"gstin", "valid", "error", "state_code", "state", "pan"} for one GSTIN."""
+    g = normalize(value)
+    error = _CACHE[g] if g in _CACHE else _errors([g])[g]
+    valid = error is None
+    return {
+        "gstin": g,
+        "valid": valid,
+        "error": error,
+        "state_code": g[:2] if valid else None,
+        "state": STATE_CODES.get(g[:2]) if valid else None,
+        "pan": g[2:12] if valid else None,
+    }
+
+
+def validate_many(values):
+    """
+    Validate a whole column. Returns a DataFrame aligned with `values` with
+    gstin, valid, error, state_code, state and pan columns.
+    """
+    values = pd.Series(values)
+    normalized = values.fillna("").astype(str).str.replace(r"\s+", "", regex=True).str.upper()
+    lookup, uncached = {}, []
+    for g in pd.unique(normalized):
+        if g in _CACHE:
+            lookup[g] = _CACHE[g]
+        else:
+            uncached.append(g)
+    if uncached:
+        lookup.update(_errors(uncached))
+    errors = normalized.map(lookup)
+    valid = errors.isna()
+    state_code = normalized.str[:2].where(valid)
+    return pd.DataFrame({
+        "gstin": normalized,
+        "valid": valid,
+        "error": errors,
+        "state_code": state_code,
+        "state": state_code.map(STATE_CODES),
+        "pan": normalized.str[2:12].where(valid),
+    })
+
+
+def home_state():
+    """State code of the current entity's registration (None if unset/invalid)."""
+    entity = db.get_entity()
+    result = validate(entity["gstin"] if entity else None)
+    return result["state_code"] if result["valid"] else None
+
+
+def is_inter_state(value, home=None):
+    """True/False from the counterparty GSTIN against our state; None when either is unknown."""
+    home = home or home_state()
+    result = validate(value)
+    if not home or not result["valid"]:
+        return None
+    return result["state_code"] != home
+
+
+def inter_state_many(values, home=None):
+    """Vectorized `is_inter_state`: (inter_state bool array, known bool array)."""
+    home = home or home_state()
+    checked = validate_many(values)
+    known = checked["valid"].to_numpy(dtype=bool) & bool(home)
+    inter = known & (checked["state_code"].to_numpy() != home)
+    return inter, known
@@ -0,0 +1,424 @@
+"""
+Invoice PDF rendering for AI-Accountant
+=======================================
+Renders stored invoices (with their line items) to PDF without any extra
+dependency: the layout is a template of text and rule operations that is
+compiled once per process into a static content stream plus a list of
+fields to fill, and each invoice only formats its own values into it.
+
+Batch mode renders a whole period across a process pool. Every invoice's
+render input (invoice, items, seller profile and template version) is
+hashed, and unchanged invoices are skipped using `manifest.json`. Each
+business gets its own `entity_<id>` folder (with its own manifest) under
+the output directory, since invoice ids repeat across businesses.
+
+Usage:
+    python invoice_pdf.py 2026-03-01 2026-03-31            # Render a period into invoice_pdfs/entity_<id>/
+    python invoice_pdf.py 2026-03-01 2026-03-31 --workers 4 --out /tmp/pdfs
+    python invoice_pdf.py --invoice 42                     # Render one invoice
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import database as db
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(PROJECT_DIR, "invoice_pdfs")
+MANIFEST = "manifest.json"
+
+TEMPLATE_VERSION = 1  # bump when the layout changes, so cached PDFs are re-rendered
+PAGE_SIZE = (595, 842)  # A4 in points
+FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Courier"}
+COURIER_WIDTH = 0.6  # Courier glyph width per point of font size, used to right-align amounts
+INLINE_LIMIT = 8  # batches this small are rendered without starting a pool
+
+# Layout: ("text", x, y, font, size, text with {fields}, align) and ("rule", x1, y1, x2, y2)
+INVOICE_TEMPLATE = {
+    "header": [
+        ("text", 40, 800, "F2", 16, "TAX INVOICE", "left"),
+        ("text", 40, 778, "F2", 11, "{seller_name}", "left"),
+        ("text", 40, 764, "F1", 9, "{seller_address}", "left"),
+        ("text", 40, 750, "F1", 9, "GSTIN: {seller_gstin}", "left"),
+        ("text", 555, 778, "F1", 9, "Invoice No: {invoice_no}", "right"),
+        ("text", 555, 764, "F1", 9, "Date: {date}", "right"),
+        ("text", 555, 750, "F1", 9, "Page {page} of {pages}", "right"),
+        ("rule", 40, 740, 555, 740),
+        ("text", 40, 724, "F2", 10, "Bill To", "left"),
+        ("text", 40, 710, "F1", 10, "{customer_name}", "left"),
+        ("text", 40, 696, "F1", 9, "GSTIN: {customer_gstin}", "left"),
+        ("text", 555, 710, "F1", 9, "Place of Supply: {place_of_supply}", "right"),
+        ("rule", 40, 684, 555, 684),
+        ("text", 40, 670, "F2", 9, "HSN/SAC", "left"),
+        ("text", 95, 670, "F2", 9, "Description", "left"),
+        ("text", 330, 670, "F2", 9, "Qty", "right"),
+        ("text", 400, 670, "F2", 9, "Rate", "right"),
+        ("text", 435, 670, "F2", 9, "GST%", "right"),
+        ("text", 555, 670, "F2", 9, "Taxable Value", "right"),
+        ("rule", 40, 662, 555, 662),
+    ],
+    "row": [
+        ("text", 40, 0, "F1", 9, "{hsn_code}", "left"),
+        ("text", 95, 0, "F1", 9, "{description}", "left"),
+        ("text", 330, 0, "F3", 9, "{quantity} {unit}", "right"),
+        ("text", 400, 0, "F3", 9, "{rate}", "right"),
+        ("text", 435, 0, "F3", 9, "{gst_rate}", "right"),
+        ("text", 555, 0, "F3", 9, "{taxable_value}", "right"),
+    ],
+    "first_row_y": 648,
+    "row_height": 14,
+    "rows_per_page": 30,
+    "totals": [
+        ("rule", 330, 200, 555, 200),
+        ("text", 440, 186, "F1", 9, "Taxable Value", "right"),
+        ("text", 555, 186, "F3", 9, "{total_taxable}", "right"),
+        ("text", 440, 172, "F1", 9, "IGST", "right"),
+        ("text", 555, 172, "F3", 9, "{igst}", "right"),
+        ("text", 440, 158, "F1", 9, "CGST", "right"),
+        ("text", 555, 158, "F3", 9, "{cgst}", "right"),
+        ("text", 440, 144, "F1", 9, "SGST", "right"),
+        ("text", 555, 144, "F3", 9, "{sgst}", "right"),
+        ("rule", 330, 136, 555, 136),
+        ("text", 440, 120, "F2", 11, "Total (Rs.)", "right"),
+        ("text", 555, 120, "F2", 11, "{total_amount}", "right"),
+        ("text", 40, 96, "F1", 9, "Amount in words: {amount_words}", "left"),
+        ("text", 555, 50, "F1", 8, "This is a computer generated invoice.", "right"),
+    ],
+}
+
+
+# ── Formatting ───────────────────────────────────────────────────
+
+def _inr(value):
+    """1234567.5 → '12,34,567.50' (Indian digit grouping)."""
+    value = float(value or 0)
+    sign = "-" if value < 0 else ""
+    whole, paise = f"{abs(value):.2f}".split(".")
+    head, tail = whole[:-3], whole[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    return sign + ",".join(groups + [tail]) + "." + paise
+
+
+_ONES = ("", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", "Ten", "Eleven", "Twelve",
+         "Thirteen", "Fourteen", "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen")
+_TENS = ("", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety")
+
+
+def _words_below_1000(n):
+    words = []
+    if n >= 100:
+        words += [_ONES[n // 100], "Hundred"]
+        n %= 100
+    if n >= 20:
+        words.append(_TENS[n // 10])
+        n %= 10
+    if n:
+        words.append(_ONES[n])
+    return words
+
+
+def amount_in_words(value):
+    """1234567.5 → 'Rupees Twelve Lakh Thirty Four Thousand Five Hundred Sixty Seven and Fifty Paise Only'."""
+    rupees, paise = divmod(round(float(value or 0) * 100), 100)
+    words = []
+    for divisor, name in ((10 ** 7, "Crore"), (10 ** 5, "Lakh"), (1000, "Thousand")):
+        if rupees >= divisor:
+            words += _words_below_1000(rupees // divisor) + [name]
+            rupees %= divisor
+    words += _words_below_1000(rupees)
+    text = "Rupees " + (" ".join(words) or "Zero")
+    if paise:
+        text += " and " + " ".join(_words_below_1000(paise)) + " Paise"
+    return text + " Only"
+
+
+def _pdf_text(value):
+    """Escape for a PDF string literal; characters outside Latin-1 become '?'."""
+    text = str(value).replace("₹", "Rs.").encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# ── Template compilation ─────────────────────────────────────────
+
+FIELD = re.compile(r"\{(\w+)\}")
+
+
+def _compile_ops(ops, y_offset=False):
+    """
+    Split ops into a static content stream (rules, literal text) and the text
+    ops that need values. Returns (static_stream, [(format, font, size, x, y, align)]).
+    """
+    static, dynamic = [], []
+    for op in ops:
+        if op[0] == "rule":
+            _, x1, y1, x2, y2 = op
+            if not y_offset:
+                static.append(f"{x1} {y1} m {x2} {y2} l S")
+            else:
+                dynamic.append(("rule", x1, y1, x2, y2))
+            continue
+        _, x, y, font, size, text, align = op
+        if FIELD.search(text) or y_offset or align != "left":
+            dynamic.append((text, font, size, x, y, align))
+        else:
+            static.append(f"BT /{font} {size} Tf {x} {y} Td ({_pdf_text(text)}) Tj ET")
+    return "\n".join(static), dynamic
+
+
+@functools.lru_cache(maxsize=8)
+def compile_template(version=TEMPLATE_VERSION):
+    """Compiled INVOICE_TEMPLATE; cached so each process compiles it once."""
+    header_static, header_fields = _compile_ops(INVOICE_TEMPLATE["header"])
+    totals_static, totals_fields = _compile_ops(INVOICE_TEMPLATE["totals"])
+    _, row_fields = _compile_ops(INVOICE_TEMPLATE["row"], y_offset=True)
+    return {
+        "header": (header_static, header_fields),
+        "totals": (totals_static, totals_fields),
+        "row": row_fields,
+        "first_row_y": INVOICE_TEMPLATE["first_row_y"],
+        "row_height": INVOICE_TEMPLATE["row_height"],
+        "rows_per_page": INVOICE_TEMPLATE["rows_per_page"],
+    }
+
+
+def _text_op(text, font, size, x, y, align):
+    if align == "right":
+        # Only Courier widths are exact; Helvetica is approximated at half the font size per character
+        width = len(text) * size * (COURIER_WIDTH if font == "F3" else 0.5)
+        x = x - width
+    return f"BT /{font} {size} Tf {x:.1f} {y} Td ({_pdf_text(text)}) Tj ET"
+
+
+def _fill(fields, values, y=None):
+    ops = []
+    for field in fields:
+        if field[0] == "rule":
+            continue
+        text_format, font, size, x, field_y, align = field
+        ops.append(_text_op(text_format.format(**values), font, size, x, field_y if y is None else y, align))
+    return "\n".join(ops)
+
+
+# ── PDF assembly ─────────────────────────────────────────────────
+
+def _pdf_document(page_streams):
+    """Minimal PDF 1.4 file with the standard fonts and one content stream per page."""
+    objects = []  # 1-based object bodies
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages = add(None)
+    font_refs = {name: add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>")
+                 for name, base in FONTS.items()}
+    resources = "<< /Font << " + " ".join(f"/{n} {r} 0 R" for n, r in font_refs.items()) + " >> >>"
+    kids = []
+    for stream in page_streams:
+        data = stream.encode("latin-1")
+        content = add(f"<< /Length {len(data)} >>\nstream\n".encode("latin-1") + data + b"\nendstream")
+        kids.append(add(f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {PAGE_SIZE[0]} {PAGE_SIZE[1]}] "
+                        f"/Resources {resources} /Contents {content} 0 R >>"))
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages} 0 R >>"
+    objects[pages - 1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        body = body if isinstance(body, bytes) else body.encode("latin-1")
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def render_invoice(invoice, items, seller):
+    """PDF bytes for one invoice dict, its item dicts and the seller profile dict."""
+    template = compile_template()
+    if not items:
+        # Invoices saved before line items: one row from the header
+        items = [{"hsn_code": "", "description": "As per invoice", "quantity": 1, "unit": "",
+                  "rate": invoice["taxable_value"], "gst_rate": invoice["gst_rate"],
+                  "taxable_value": invoice["taxable_value"]}]
+    per_page = template["rows_per_page"]
+    chunks = [items[i:i + per_page] for i in range(0, len(items), per_page)]
+
+    values = {
+        "seller_name": seller.get("name") or "",
+        "seller_address": seller.get("address") or "",
+        "seller_gstin": seller.get("gstin") or "-",
+        "invoice_no": invoice["invoice_no"] or invoice["id"],
+        "date": invoice["date"],
+        "customer_name": invoice["customer_name"] or "",
+        "customer_gstin": invoice.get("gstin") or "Unregistered",
+        "place_of_supply": "Inter-State" if (invoice.get("igst") or 0) > 0 else "Intra-State",
+        "total_taxable": _inr(invoice["taxable_value"]),
+        "igst": _inr(invoice["igst"]),
+        "cgst": _inr(invoice["cgst"]),
+        "sgst": _inr(invoice["sgst"]),
+        "total_amount": _inr(invoice["total_amount"]),
+        "amount_words": amount_in_words(invoice["total_amount"]),
+        "pages": len(chunks),
+    }
+    header_static, header_fields = template["header"]
+    totals_static, totals_fields = template["totals"]
+
+    streams = []
+    for page_no, chunk in enumerate(chunks, start=1):
+        values["page"] = page_no
+        parts = [header_static, _fill(header_fields, values)]
+        y = template["first_row_y"]
+        for item in chunk:
+            row = {
+                "hsn_code": item.get("hsn_code") or "",
+                "description": str(item.get("description") or "")[:45],
+                "quantity": f"{float(item.get('quantity') or 0):g}",
+                "unit": item.get("unit") or "",
+                "rate": _inr(item.get("rate")),
+                "gst_rate": f"{float(item.get('gst_rate') or 0):g}%",
+                "taxable_value": _inr(item.get("taxable_value")),
+            }
+            parts.append(_fill(template["row"], row, y=y))
+            y -= template["row_height"]
+        if page_no == len(chunks):
+            parts += [totals_static, _fill(totals_fields, values)]
+        streams.append("\n".join(part for part in parts if part))
+    return _pdf_document(streams)
+
+
+# ── Batch rendering with a content-hash cache ────────────────────
+
+def seller_profile():
+    entity = db.get_entity() or {}
+    return {key: entity.get(key) or "" for key in ("name", "address", "gstin")}
+
+
+def content_hash(invoice, items, seller):
+    payload = json.dumps({"template": TEMPLATE_VERSION, "invoice": invoice, "items": items, "seller": seller},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _file_name(invoice):
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", str(invoice["invoice_no"] or "")).strip("_") or "invoice"
+    return f"{safe}_{invoice['id']}.pdf"
+
+
+def entity_dir(out_dir=OUTPUT_DIR):
+    """The current business's folder under `out_dir`."""
+    return os.path.join(out_dir, f"entity_{db.current_entity()}")
+
+
+def _render_job(job):
+    """Worker: render one invoice and write it. Returns (invoice id, file name)."""
+    invoice, items, seller, path = job
+    with open(path, "wb") as f:
+        f.write(render_invoice(invoice, items, seller))
+    return invoice["id"], os.path.basename(path)
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _invoice_payloads(invoices):
+    """[(invoice dict, item dicts)] for a DataFrame of invoices, with items fetched in one query."""
+    items = db.get_items_for_invoices(invoices["id"].tolist())
+    by_invoice = {}
+    for item in items.to_dict("records"):
+        by_invoice.setdefault(item["invoice_id"], []).append(item)
+    columns = ["id", "date", "invoice_no", "customer_name", "gstin", "taxable_value", "gst_rate",
+               "igst", "cgst", "sgst", "total_amount"]
+    rows = invoices[columns].astype(object).where(invoices[columns].notna(), None).to_dict("records")
+    return [(row, by_invoice.get(row["id"], [])) for row in rows]
+
+
+def render_period(start, end, out_dir=OUTPUT_DIR, workers=None):
+    """
+    Render every invoice dated start..end into the current business's folder under
+    `out_dir`, skipping ones whose content hash is unchanged. Returns {"rendered", "cached", "files"}.
+    """
+    out_dir = entity_dir(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _load_manifest(out_dir)
+    seller = seller_profile()
+
+    jobs, files = [], []
+    for invoice, items in _invoice_payloads(db.get_invoices_between(start, end)):
+        digest = content_hash(invoice, items, seller)
+        name = _file_name(invoice)
+        entry = manifest.get(str(invoice["id"]))
+        files.append(name)
+        if entry and entry["hash"] == digest and os.path.exists(os.path.join(out_dir, entry["file"])):
+            continue
+        manifest[str(invoice["id"])] = {"hash": digest, "file": name}
+        jobs.append((invoice, items, seller, os.path.join(out_dir, name)))
+
+    if len(jobs) <= INLINE_LIMIT or workers == 1:
+        for job in jobs:
+            _render_job(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+            for _ in pool.map(_render_job, jobs, chunksize=chunksize):
+                pass
+    _save_manifest(out_dir, manifest)
+    return {"rendered": len(jobs), "cached": len(files) - len(jobs), "files": [os.path.join(out_dir, f) for f in files]}
+
+
+def render_one(invoice_id):
+    """PDF bytes for a single stored invoice."""
+    invoice, items = _invoice_payloads(db.get_invoices_by_ids([invoice_id]))[0]
+    return render_invoice(invoice, items, seller_profile())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render invoice PDFs.", epilog=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("start", nargs="?", help="First invoice date (YYYY-MM-DD)")
+    parser.add_argument("end", nargs="?", help="Last invoice date (YYYY-MM-DD)")
+    parser.add_argument("--invoice", type=int, help="Render a single invoice id")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="Output directory")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.invoice:
+        out_dir = entity_dir(args.out)
+        os.makedirs(out_dir, exist_ok=True)
+        invoice, _ = _invoice_payloads(db.get_invoices_by_ids([args.invoice]))[0]
+        path = os.path.join(out_dir, _file_name(invoice))
+        with open(path, "wb") as f:
+            f.write(render_one(args.invoice))
+        print(f"🧾 Wrote {path}")
+    elif args.start and args.end:
+        result = render_period(args.start, args.end, args.out, args.workers)
+        print(f"🧾 Rendered {result['rendered']} invoice(s), {result['cached']} unchanged, in {entity_dir(args.out)}")
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -1,11 +1,25 @@
 import streamlit as st
 import database as db
+import entity_selector
+import tax_engine
+import gstin as gstin_lib
+import invoice_pdf
+import einvoice
 import datetime
+import pandas as pd
+import io
+import json
+import os
+import zipfile
 
 st.set_page_config(page_title="Sales Invoices", page_icon="💰")
+entity_selector.sidebar()
 
 st.title("💰 Sales & Invoices")
 
+UNITS = ["NOS", "PCS", "KGS", "LTR", "MTR", "BOX", "OTH"]
+EMPTY_ITEMS = pd.DataFrame([{"hsn_code": "", "description": "", "quantity": 1.0, "unit": "NOS", "rate": 0.0, "gst_rate": 18}])
+
 with st.expander("➕ Add New Invoice", expanded=True):
     with st.form("invoice_form"):
         col1, col2 = st.columns(2)
@@ -16,24 +30,39 @@ with st.expander("➕ Add New Invoice", expanded=True):
             gstin = st.text_input("Customer GSTIN (Optional)")
         
         with col2:
-            taxable_value = st.number_input("Taxable Value (₹)", min_value=0.0, format="%.2f")
-            gst_rate = st.selectbox("GST Rate (%)", [0, 5, 12, 18, 28], index=3)
-            place_of_supply = st.radio("Place of Supply", ["Intra-State (Within State)", "Inter-State (Outside State)"])
+            place_of_supply = st.radio("Place of Supply", ["Auto (from GSTIN)", "Intra-State (Within State)", "Inter-State (Outside State)"])
+            customer_address = st.text_input("Customer Address (Optional)", help="Needed for e-invoicing.")
+            c1, c2 = st.columns(2)
+            customer_city = c1.text_input("City")
+            customer_pin = c2.text_input("PIN Code")
         
-        # Auto-calculate taxes
-        igst = 0.0
-        cgst = 0.0
-        sgst = 0.0
+        # Place of supply from the customer's GSTIN state code vs our own; unknown → intra-state
+        gstin_check = gstin_lib.validate(gstin)
+        inter_state = place_of_supply == "Inter-State (Outside State)"
+        if place_of_supply == "Auto (from GSTIN)":
+            detected = gstin_lib.is_inter_state(gstin)
+            inter_state = bool(detected)
+            if detected is not None:
+                st.caption(f"📍 {gstin_check['state']} → {'Inter-State (IGST)' if inter_state else 'Intra-State (CGST + SGST)'}")
         
-        total_gst = taxable_value * (gst_rate / 100)
+        st.markdown("**Line Items**")
+        items = st.data_editor(
+            EMPTY_ITEMS, num_rows="dynamic", use_container_width=True, hide_index=True, key="invoice_items",
+            column_config={
+                "hsn_code": st.column_config.TextColumn("HSN/SAC"),
+                "description": st.column_config.TextColumn("Description"),
+                "quantity": st.column_config.NumberColumn("Qty", min_value=0.0),
+                "unit": st.column_config.SelectboxColumn("Unit", options=UNITS),
+                "rate": st.column_config.NumberColumn("Rate (₹)", min_value=0.0, format="%.2f"),
+                "gst_rate": st.column_config.SelectboxColumn("GST %", options=list(tax_engine.GST_RATES)),
+            },
+        )
+        items = items[(items["quantity"].fillna(0) > 0) & (items["rate"].fillna(0) > 0)]
         
-        if place_of_supply == "Inter-State (Outside State)":
-            igst = total_gst
-        else:
-            cgst = total_gst / 2
-            sgst = total_gst / 2
-            
-        total_amount = taxable_value + total_gst
+        # Auto-calculate taxes per item; the invoice totals are the sum of its items
+        items = tax_engine.item_taxes(items, inter_state)
+        igst, cgst, sgst = items["igst"].sum(), items["cgst"].sum(), items["sgst"].sum()
+        total_amount = items["total_amount"].sum()
         
         st.markdown(f"**Calculated Tax:** IGST: {igst:.2f} | CGST: {cgst:.2f} | SGST: {sgst:.2f}")
         st.markdown(f"### Total Invoice Amount: ₹ {total_amount:,.2f}")
@@ -42,8 +71,16 @@ with st.expander("➕ Add New Invoice", expanded=True):
         if submitted:
             if not invoice_no or not customer_name:
                 st.error("Invoice Number and Customer Name are required.")
+            elif gstin and not gstin_check["valid"]:
+                st.error(f"Customer GSTIN looks wrong: {gstin_check['error']}.")
+            elif items.empty:
+                st.error("Add at least one line item with a quantity and rate.")
+            elif filed := db.filed_return_for(date, "invoices"):
+                st.error(f"{filed} for this period is already filed; entries dated {date} are locked.")
             else:
-                db.add_invoice(date, invoice_no, customer_name, gstin, taxable_value, gst_rate, igst, cgst, sgst, total_amount)
+                db.add_invoice_with_items(date, invoice_no, customer_name, gstin_check["gstin"],
+                                          items.to_dict("records"), customer_address or None, customer_city or None,
+                                          customer_pin or None)
                 st.success("Invoice Saved Successfully!")
                 st.rerun()
 
@@ -54,3 +91,70 @@ if not df.empty:
     st.dataframe(df)
 else:
     st.info("No invoices found.")
+
+if not df.empty:
+    st.markdown("---")
+    st.subheader("🧾 Invoice PDFs")
+    tab1, tab2 = st.tabs(["Single Invoice", "Whole Period"])
+    with tab1:
+        labels = {row.id: f"{row.invoice_no} · {row.customer_name} · {row.date}" for row in df.itertuples()}
+        invoice_id = st.selectbox("Invoice", list(labels), format_func=labels.get)
+        # Rendered on request only, not on every rerun of the page; ids repeat across businesses
+        pdf_key = (db.current_entity(), invoice_id)
+        if st.button("Prepare PDF"):
+            st.session_state.invoice_pdf = (pdf_key, invoice_pdf.render_one(invoice_id))
+        prepared = st.session_state.get("invoice_pdf")
+        if prepared and prepared[0] == pdf_key:
+            st.download_button("Download PDF", prepared[1], mime="application/pdf",
+                               file_name=f"invoice_{invoice_id}.pdf")
+    with tab2:
+        c1, c2 = st.columns(2)
+        with c1:
+            start = st.date_input("From", datetime.date.today().replace(day=1), key="pdf_from")
+        with c2:
+            end = st.date_input("To", datetime.date.today(), key="pdf_to")
+        if st.button("Render PDFs"):
+            with st.spinner("Rendering invoices..."):
+                result = invoice_pdf.render_period(start, end)
+            st.success(f"✅ Rendered {result['rendered']} invoice(s); {result['cached']} unchanged since last time.")
+            if result["files"]:
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                    for path in result["files"]:
+                        zf.write(path, os.path.basename(path))
+                st.download_button("Download All (ZIP)", archive.getvalue(), mime="application/zip",
+                                   file_name=f"invoices_{start}_{end}.zip")
+
+    st.markdown("---")
+    st.subheader("⚡ E-Invoice (IRN)")
+    st.caption("Builds NIC e-invoice JSON for B2B invoices without an IRN and checks it against the schema.")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        ei_start = st.date_input("From", datetime.date.today().replace(day=1), key="einvoice_from")
+    with c2:
+        ei_end = st.date_input("To", datetime.date.today(), key="einvoice_to")
+    with c3:
+        submitter = st.selectbox("Submit via", list(einvoice.SUBMITTERS),
+                                 index=list(einvoice.SUBMITTERS).index(db.get_setting("einvoice_submitter", "local")))
+    if st.button("Generate JSON"):
+        with st.spinner("Building e-invoices..."):
+            st.session_state.einvoices = einvoice.generate_period(ei_start, ei_end)
+
+    results = st.session_state.get("einvoices")
+    if results is not None:
+        valid = [r for r in results if not r["error"]]
+        col1, col2 = st.columns(2)
+        col1.metric("Ready", len(valid))
+        col2.metric("With Errors", len(results) - len(valid))
+        errors = [{"invoice_no": r["invoice_no"], "error": r["error"]} for r in results if r["error"]]
+        if errors:
+            st.dataframe(pd.DataFrame(errors), hide_index=True, use_container_width=True)
+        if valid:
+            st.download_button("Download JSON", json.dumps([r["payload"] for r in valid], indent=1),
+                               file_name=f"einvoices_{ei_start}_{ei_end}.json", mime="application/json")
+            if st.button(f"Submit {len(valid)} to IRP"):
+                outcome = einvoice.submit_all(valid, einvoice.get_submitter(submitter))
+                st.success(f"✅ {outcome['submitted']} IRN(s) generated.")
+                for invoice_no, reason in outcome["failed"]:
+                    st.error(f"{invoice_no}: {reason}")
+                st.session_state.einvoices = None
@@ -1,8 +1,12 @@
 import streamlit as st
 import database as db
+import entity_selector
+import tax_engine
+import gstin as gstin_lib
 import datetime
 
 st.set_page_config(page_title="Expenses", page_icon="💸")
+entity_selector.sidebar()
 
 st.title("💸 Expenses & Purchases")
 
@@ -12,6 +16,7 @@ with st.expander("➕ Add New Expense", expanded=True):
         with col1:
             date = st.date_input("Expense Date", datetime.date.today())
             vendor_name = st.text_input("Vendor Name")
+            invoice_no = st.text_input("Supplier Invoice No.", help="Used to match this purchase against GSTR-2B.")
             gstin = st.text_input("Vendor GSTIN (Optional)")
             category = st.selectbox("Category", ["Office Supplies", "Raw Material", "Services", "Utilities", "Other"])
         
@@ -19,22 +24,21 @@ with st.expander("➕ Add New Expense", expanded=True):
             description = st.text_input("Description")
             taxable_value = st.number_input("Taxable Value (₹)", min_value=0.0, format="%.2f")
             gst_rate = st.selectbox("GST Rate (%)", [0, 5, 12, 18, 28], index=3)
-            place_of_supply = st.radio("Place of Supply", ["Intra-State (Within State)", "Inter-State (Outside State)"])
+            place_of_supply = st.radio("Place of Supply", ["Auto (from GSTIN)", "Intra-State (Within State)", "Inter-State (Outside State)"])
         
-        # Auto-calculate taxes
-        igst = 0.0
-        cgst = 0.0
-        sgst = 0.0
-        
-        total_gst = taxable_value * (gst_rate / 100)
+        # Place of supply from the vendor's GSTIN state code vs our own; unknown → intra-state
+        gstin_check = gstin_lib.validate(gstin)
+        inter_state = place_of_supply == "Inter-State (Outside State)"
+        if place_of_supply == "Auto (from GSTIN)":
+            detected = gstin_lib.is_inter_state(gstin)
+            inter_state = bool(detected)
+            if detected is not None:
+                st.caption(f"📍 {gstin_check['state']} → {'Inter-State (IGST)' if inter_state else 'Intra-State (CGST + SGST)'}")
         
-        if place_of_supply == "Inter-State (Outside State)":
-            igst = total_gst
-        else:
-            cgst = total_gst / 2
-            sgst = total_gst / 2
-            
-        total_amount = taxable_value + total_gst
+        # Auto-calculate taxes
+        tax = tax_engine.compute_tax(taxable_value, gst_rate, inter_state)
+        igst, cgst, sgst = tax["igst"], tax["cgst"], tax["sgst"]
+        total_amount = tax["total_amount"]
         
         st.markdown(f"**Calculated Tax:** IGST: {igst:.2f} | CGST: {cgst:.2f} | SGST: {sgst:.2f}")
         st.markdown(f"### Total Expense Amount: ₹ {total_amount:,.2f}")
@@ -43,8 +47,13 @@ with st.expander("➕ Add New Expense", expanded=True):
         if submitted:
             if not vendor_name:
                 st.error("Vendor Name is required.")
+            elif gstin and not gstin_check["valid"]:
+                st.error(f"Vendor GSTIN looks wrong: {gstin_check['error']}.")
+            elif filed := db.filed_return_for(date, "expenses"):
+                st.error(f"{filed} for this period is already filed; entries dated {date} are locked.")
             else:
-                db.add_expense(date, vendor_name, gstin, category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description)
+                db.add_expense(date, vendor_name, gstin_check["gstin"], category, taxable_value, gst_rate, igst, cgst, sgst, total_amount, description,
+                               invoice_no=invoice_no or None)
                 st.success("Expense Saved Successfully!")
                 st.rerun()
 
@@ -1,15 +1,20 @@
 import streamlit as st
 import database as db
+import entity_selector
+import tax_engine
+import gstin
+import reconciliation
 import pandas as pd
 
 st.set_page_config(page_title="GST Reports", page_icon="📑")
+entity_selector.sidebar()
 
 st.title("📑 GST Reports & Filing Helper")
 
 invoices = db.get_invoices()
 expenses = db.get_expenses()
 
-tab1, tab2 = st.tabs(["GSTR-1 (Sales)", "GSTR-3B (Summary)"])
+tab1, tab2, tab3, tab4 = st.tabs(["GSTR-1 (Sales)", "GSTR-3B (Summary)", "🔍 Ledger Check", "🧾 GSTR-2B Reconciliation"])
 
 with tab1:
     st.header("GSTR-1 (Outward Supplies)")
@@ -17,7 +22,7 @@ with tab1:
     
     if not invoices.empty:
         # Group by Rate
-        summary = invoices.groupby('gst_rate')[['taxable_value', 'igst', 'cgst', 'sgst', 'total_amount']].sum().reset_index()
+        summary = invoices.groupby('gst_rate', dropna=False)[['taxable_value', 'igst', 'cgst', 'sgst', 'total_amount']].sum().reset_index()
         st.dataframe(summary)
         
         st.download_button(
@@ -28,47 +33,129 @@ with tab1:
         )
     else:
         st.warning("No sales data available.")
+    
+    st.subheader("HSN-wise Summary (Table 12)")
+    months = pd.period_range(end=pd.Timestamp.today(), periods=24, freq="M").astype(str)[::-1].tolist()
+    h1, h2 = st.columns(2)
+    with h1:
+        hsn_from = st.selectbox("From", months, index=0)
+    with h2:
+        hsn_to = st.selectbox("To", months, index=0)
+    hsn = db.get_hsn_summary(min(hsn_from, hsn_to), max(hsn_from, hsn_to))
+    if hsn.empty:
+        st.caption("No itemized invoices in this period.")
+    else:
+        st.dataframe(hsn, hide_index=True)
+        st.download_button("Download HSN Summary (CSV)", hsn.to_csv(index=False),
+                           file_name=f"hsn_summary_{hsn_from}_{hsn_to}.csv", mime="text/csv")
 
 with tab2:
     st.header("GSTR-3B (Monthly Return)")
-    st.info("This is your Input Tax Credit (ITC) vs Liability Check.")
+    st.info("This is your Input Tax Credit (ITC) vs Liability Check. Filed months show the figures as filed.")
+    
+    returns = db.get_return_summary(months[-1], months[0])
+    period_3b = st.selectbox("Return Period", months, index=0, key="gstr3b_period")
+    month = returns.set_index("period").loc[period_3b]
+    if month["status"] == "Filed":
+        st.success("🔒 GSTR-3B filed for this period — figures below are the filed snapshot.")
+    elif month["status"] == "GSTR-1 Filed":
+        st.caption("🔒 GSTR-1 filed: liability is from the filed GSTR-1; ITC is computed from your expenses.")
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Liability (Tax on Sales)")
-        if not invoices.empty:
-            total_liab_igst = invoices['igst'].sum()
-            total_liab_cgst = invoices['cgst'].sum()
-            total_liab_sgst = invoices['sgst'].sum()
-            
-            st.write(f"**IGST:** ₹ {total_liab_igst:,.2f}")
-            st.write(f"**CGST:** ₹ {total_liab_cgst:,.2f}")
-            st.write(f"**SGST:** ₹ {total_liab_sgst:,.2f}")
-            st.markdown(f"**Total Liability:** ₹ {(total_liab_igst + total_liab_cgst + total_liab_sgst):,.2f}")
-        else:
-            st.write("No sales recorded.")
+        st.write(f"**IGST:** ₹ {month['output_igst']:,.2f}")
+        st.write(f"**CGST:** ₹ {month['output_cgst']:,.2f}")
+        st.write(f"**SGST:** ₹ {month['output_sgst']:,.2f}")
+        st.markdown(f"**Total Liability:** ₹ {month['gst_collected']:,.2f}")
 
     with col2:
         st.subheader("Input Tax Credit (Tax on Purchases)")
-        if not expenses.empty:
-            total_itc_igst = expenses['igst'].sum()
-            total_itc_cgst = expenses['cgst'].sum()
-            total_itc_sgst = expenses['sgst'].sum()
-            
-            st.write(f"**IGST:** ₹ {total_itc_igst:,.2f}")
-            st.write(f"**CGST:** ₹ {total_itc_cgst:,.2f}")
-            st.write(f"**SGST:** ₹ {total_itc_sgst:,.2f}")
-            st.markdown(f"**Total ITC Available:** ₹ {(total_itc_igst + total_itc_cgst + total_itc_sgst):,.2f}")
-        else:
-            st.write("No expenses recorded.")
+        st.write(f"**IGST:** ₹ {month['input_igst']:,.2f}")
+        st.write(f"**CGST:** ₹ {month['input_cgst']:,.2f}")
+        st.write(f"**SGST:** ₹ {month['input_sgst']:,.2f}")
+        st.markdown(f"**Total ITC Available:** ₹ {month['itc']:,.2f}")
     
     st.markdown("---")
     
     # Net Payable Calculation
-    net_igst = max(0, (invoices['igst'].sum() if not invoices.empty else 0) - (expenses['igst'].sum() if not expenses.empty else 0))
-    net_cgst = max(0, (invoices['cgst'].sum() if not invoices.empty else 0) - (expenses['cgst'].sum() if not expenses.empty else 0))
-    net_sgst = max(0, (invoices['sgst'].sum() if not invoices.empty else 0) - (expenses['sgst'].sum() if not expenses.empty else 0))
+    net_igst = max(0, month['output_igst'] - month['input_igst'])
+    net_cgst = max(0, month['output_cgst'] - month['input_cgst'])
+    net_sgst = max(0, month['output_sgst'] - month['input_sgst'])
     
     st.subheader(f"💵 Net Tax Payable in Cash: ₹ {(net_igst + net_cgst + net_sgst):,.2f}")
     st.caption("Simplified calculation. Verify with portal before payment.")
+    
+    st.subheader("📅 Return Periods")
+    st.dataframe(returns.iloc[::-1][["period", "status", "sales_taxable", "gst_collected", "itc", "net_payable"]],
+                 hide_index=True)
+
+with tab3:
+    st.header("Ledger Check")
+    st.info("Flags entries whose stored taxes or totals don't match their GST rate and place of supply.")
+    if not gstin.home_state():
+        st.caption("Set your business GSTIN in the sidebar of the home page to also check place of supply "
+                   "from each party's GSTIN.")
+    
+    if st.button("Run Check"):
+        issues = tax_engine.validate_all()
+        for label, key in (("Invoices", "invoices"), ("Expenses", "expenses")):
+            found = issues[key]
+            st.subheader(label)
+            if found.empty:
+                st.success(f"✅ No problems found in {label.lower()}.")
+            else:
+                st.warning(f"⚠️ {len(found)} problem(s) in {found['id'].nunique()} {label.lower()}.")
+                st.dataframe(found, hide_index=True)
+
+with tab4:
+    st.header("GSTR-2B vs Purchase Register")
+    st.info("Download GSTR-2B as JSON from the GST Portal (Returns → GSTR-2B) and upload it here to check your ITC "
+            "against what your suppliers actually filed.")
+    
+    uploaded = st.file_uploader("GSTR-2B JSON", type=["json"])
+    if uploaded is not None and st.button("Import GSTR-2B"):
+        try:
+            period, count = reconciliation.import_gstr2b(uploaded.getvalue(), source_file=uploaded.name)
+            st.success(f"✅ Imported {count:,} supplier invoices for {period}.")
+        except ValueError as e:
+            st.error(f"Could not read this file: {e}")
+    
+    periods = db.get_gstr2b_periods()
+    if periods.empty:
+        st.warning("No GSTR-2B imported yet.")
+    else:
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            period = st.selectbox("Return Period", periods["return_period"].tolist())
+        with c2:
+            tolerance = st.number_input("Amount tolerance (₹)", min_value=0.0, value=reconciliation.AMOUNT_TOLERANCE)
+        with c3:
+            window = st.number_input("Date window (days)", min_value=0, value=reconciliation.DATE_WINDOW)
+        
+        result = reconciliation.reconcile_period(period, tolerance, window)
+        summary = result["summary"]
+        
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("ITC in Books", f"₹ {summary['itc_books']:,.2f}")
+        m2.metric("ITC in GSTR-2B", f"₹ {summary['itc_2b']:,.2f}")
+        m3.metric("ITC Matched", f"₹ {summary['itc_matched']:,.2f}")
+        m4.metric("ITC at Risk", f"₹ {summary['itc_at_risk']:,.2f}", delta_color="inverse")
+        
+        labels = {
+            "matched": "✅ Matched",
+            "mismatched": "⚠️ Amount Mismatch",
+            "missing_in_2b": "❌ Not in GSTR-2B",
+            "missing_in_books": "📥 Not in Books",
+        }
+        bucket_tabs = st.tabs([f"{labels[b]} ({summary[b]:,})" for b in reconciliation.BUCKETS])
+        for bucket_tab, bucket in zip(bucket_tabs, reconciliation.BUCKETS):
+            with bucket_tab:
+                if result[bucket].empty:
+                    st.write("Nothing here.")
+                else:
+                    st.dataframe(result[bucket], hide_index=True)
+                    st.download_button("Download CSV", result[bucket].to_csv(index=False),
+                                       file_name=f"gstr2b_{period}_{bucket}.csv", mime="text/csv",
+                                       key=f"download_{bucket}")
@@ -1,48 +1,47 @@
 import streamlit as st
 import database as db
+import entity_selector
 import pandas as pd
+import query_engine
+import retrieval
 
 st.set_page_config(page_title="AI Accountant", page_icon="🤖")
+entity_selector.sidebar()
 
 st.title("🤖 AI Accountant")
 st.write("Ask me about your business finances!")
 
-query = st.text_input("Ask a question (e.g., 'Total sales', 'How much tax do I owe?', 'List expenses')")
+query = st.text_input("Ask a question (e.g., 'Total sales last month', 'Top 3 customers in Q2', 'That notice about ITC mismatch')")
+
+def show_matches(matches):
+    st.info("Here are the records that look most relevant:")
+    st.dataframe(
+        pd.DataFrame([{"Type": m["kind"].title(), "Date": m["date"], "Record": m["label"], "Score": m["score"]}
+                      for m in matches]),
+        hide_index=True,
+    )
 
 if query:
-    query = query.lower()
-    invoices = db.get_invoices()
-    expenses = db.get_expenses()
+    st.markdown("### Answer:")
     
-    response = ""
+    # "Find that notice..." style questions go to the local retrieval index first
+    matches = retrieval.search(query) if retrieval.looks_like_lookup(query) else []
     
-    if "total sales" in query or "revenue" in query or "income" in query:
-        total = invoices['total_amount'].sum() if not invoices.empty else 0
-        response = f"Your total sales revenue is **₹ {total:,.2f}**."
-        
-    elif "tax" in query or "gst" in query or "owe" in query:
-        total_liability = (invoices['igst'].sum() + invoices['cgst'].sum() + invoices['sgst'].sum()) if not invoices.empty else 0
-        total_itc = (expenses['igst'].sum() + expenses['cgst'].sum() + expenses['sgst'].sum()) if not invoices.empty else 0
-        net = max(0, total_liability - total_itc)
-        response = (f"**GST Liability:** ₹ {total_liability:,.2f}\n\n"
-                    f"**ITC Available:** ₹ {total_itc:,.2f}\n\n"
-                    f"**Net Payable:** ₹ {net:,.2f}")
-        
-    elif "expense" in query or "spending" in query or "cost" in query:
-        total_exp = expenses['total_amount'].sum() if not expenses.empty else 0
-        response = f"Your total expenses are **₹ {total_exp:,.2f}**."
-        if not expenses.empty:
-            top_category = expenses.groupby('category')['total_amount'].sum().idxmax()
-            response += f"\n\nYour highest spending category is **{top_category}**."
-            
-    elif "profit" in query:
-        sales = invoices['taxable_value'].sum() if not invoices.empty else 0
-        costs = expenses['taxable_value'].sum() if not expenses.empty else 0
-        profit = sales - costs
-        response = f"Your estimated gross profit (Taxable Sales - Taxable Expenses) is **₹ {profit:,.2f}**."
-        
+    if matches:
+        show_matches(matches)
     else:
-        response = "I'm a simple AI. I can answer questions about: 'Total Sales', 'Expenses', 'Tax Payable', 'Profit'."
-    
-    st.markdown("### Answer:")
-    st.info(response)
+        # Intent + time range → parameterized aggregate SQL (cached per DB write generation)
+        result = query_engine.answer(query)
+        if result is not None:
+            response, rows = result
+            st.info(response)
+            if rows:
+                st.dataframe(pd.DataFrame(rows, columns=["Name", "Total Amount (₹)", "Entries"]), hide_index=True)
+        else:
+            matches = retrieval.search(query)
+            if matches:
+                show_matches(matches)
+            else:
+                st.info("I'm a simple AI. I can answer questions about: 'Total Sales', 'Expenses', 'Tax Payable', 'Profit' "
+                        "and 'Top customers / vendors / categories', for periods like 'last month', 'Q2', 'this quarter' "
+                        "or 'FY 2025-26', and find invoices, expenses or notices by their details.")
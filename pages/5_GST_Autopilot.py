@@ -1,145 +1,262 @@
 import streamlit as st
-from gst_automation import GSTBot
+from bot_worker import BotWorker
+from portal_network import NetworkPolicy
+from artifact_store import ArtifactStore
+from autopilot_state import ChatLog, AgentStateMachine
 import database as db
+import entity_selector
+import tax_engine
 import pandas as pd
 import time
 import datetime
 
 st.set_page_config(page_title="GST Autopilot", page_icon="✈️")
+entity_selector.sidebar()
 
 st.title("✈️ GST Autopilot Agent")
 st.markdown("The AI Agent automates your GST filing. It will take control of the browser after login.")
 
 # ── Session State ────────────────────────────────────────────────
 
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "gst_bot" not in st.session_state:
-    st.session_state.gst_bot = None
-if "agent_state" not in st.session_state:
-    st.session_state.agent_state = "idle"  # idle, logging_in, active, waiting_confirm, waiting_otp
+if "chat" not in st.session_state:
+    st.session_state.chat = ChatLog()  # recent messages in memory, full history in the DB
+if "agent" not in st.session_state:
+    st.session_state.agent = AgentStateMachine()
+if "gst_worker" not in st.session_state:
+    st.session_state.gst_worker = None
+if "artifacts" not in st.session_state:
+    st.session_state.artifacts = None  # ArtifactStore shared with the running worker
+
+chat = st.session_state.chat
+agent = st.session_state.agent
 
 def bot_log(role, message):
-    st.session_state.chat_history.append({"role": role, "content": message})
+    chat.append(role, message)
+
+def send_command(command, *args, **kwargs):
+    """Queue a bot command on the background worker."""
+    worker = st.session_state.gst_worker
+    if not worker:
+        bot_log("assistant", "Please launch the agent first from the sidebar.")
+        return False
+    worker.submit(command, *args, **kwargs)
+    agent.send(command)
+    return True
+
+def handle_event(event, out):
+    """Apply one worker event to the agent state, queueing chat lines on `out`. Returns True if the state changed."""
+    kind, command, content = event["type"], event["command"], event["content"]
+
+    if kind == "log":
+        out.append(("assistant", content, None))
+    elif kind == "artifact":
+        out.append(("assistant", f"📸 {content['label']}", content["id"]))
+    elif kind == "error":
+        out.append(("assistant", content, None))
+        return agent.transition("failed")
+    elif kind == "question":
+        return agent.on_question(command)
+    elif kind == "result":
+        if command == "login":
+            out.append(("assistant", content, None))
+            return agent.transition("login_page_ready")
+        if command == "wait_for_login":
+            return agent.transition("logged_in") if content else False
+        if command == "get_notifications":
+            out.extend(save_notices(content))
+        elif command == "confirm_otp":
+            out.append(("assistant", content, None))
+        return agent.on_result(command)
+    elif kind == "stopped":
+        st.session_state.gst_worker = None
+        out.append(("assistant", "🛑 Agent stopped.", None))
+        return agent.transition("stopped")
+    return False
+
+def save_notices(notices):
+    """Store scraped notices in the Task Manager; returns the chat lines to show."""
+    if notices and "Error" not in notices[0]:
+        for n in notices:
+            db.add_notification(
+                date=n.get("Date", str(datetime.date.today())),
+                type="Portal Notice",
+                description=f"{n.get('Description')} (ID: {n.get('Notice ID')})",
+                action_required=n.get("Type", "Check Portal")
+            )
+        return [("assistant", f"Found {len(notices)} notices.", None),
+                ("assistant", f"Saved {len(notices)} notices to Task Manager.", None)]
+    return [("assistant", "No notices found.", None)]
+
+def drain_worker_events():
+    """Move queued worker events into the chat log. Returns True if the agent state changed."""
+    worker = st.session_state.gst_worker
+    if not worker:
+        return False
+    changed = False
+    out = []
+    for event in worker.drain_events():
+        changed = handle_event(event, out) or changed
+    chat.extend(out)
+    return changed
+
+# Pick up anything the worker emitted since the last run before drawing the sidebar
+drain_worker_events()
 
 # ── Sidebar Controls ─────────────────────────────────────────────
 
-with st.sidebar:
-    st.header("⚙️ Agent Controls")
-    
-    # Status indicator
-    state = st.session_state.agent_state
+@st.fragment
+def agent_status_panel():
+    """Status indicator; refreshing it only re-runs this fragment unless the state changed."""
+    entity_selector.apply()
+    state = agent.state
     if state == "idle":
         st.info("🔴 Agent: Offline")
     elif state == "logging_in":
         st.warning("🟡 Agent: Waiting for Login")
+    elif state == "working":
+        st.info("🔵 Agent: Working...")
     elif state == "active":
         st.success("🟢 Agent: Active & Ready")
     elif state in ("waiting_confirm", "waiting_otp"):
         st.warning("🟠 Agent: Waiting for Your Input")
-    
+    if st.session_state.gst_worker and st.button("🔄 Refresh status", key="refresh_status"):
+        if drain_worker_events():
+            st.rerun()
+        st.rerun(scope="fragment")
+
+@st.fragment
+def payment_panel():
+    """Cash payable per head from SQL aggregates; only this fragment re-runs on its own interactions."""
+    entity_selector.apply()
+    totals = db.get_gst_totals()
+    heads = tax_engine.set_off(totals["output_tax"], totals["input_tax"])
+    net_payable = sum(heads.values())
+    if net_payable > 0:
+        st.metric("Net Tax Payable", f"₹{net_payable:,.2f}")
+        st.caption(" | ".join(f"{head.upper()}: ₹{amount:,.2f}" for head, amount in heads.items()))
+        if st.button("💳 Make Payment", use_container_width=True):
+            bot_log("user", f"Make payment of ₹{net_payable:,.2f}")
+            send_command("make_payment", net_payable, heads)
+            # Full rerun so the chat starts streaming the worker's progress
+            st.rerun()
+
+with st.sidebar:
+    st.header("⚙️ Agent Controls")
+
+    # Status indicator
+    state = agent.state
+    agent_status_panel()
+
     st.markdown("---")
-    
+
     # Login Section
     username = st.text_input("GST Username", key="gst_username")
     password = st.text_input("GST Password", type="password", key="gst_password")
-    
+    fast_network = st.checkbox("⚡ Fast mode (skip images, fonts & analytics; cache scripts)", value=True,
+                               help="The login CAPTCHA image is always loaded.")
+    keep_screenshots = st.checkbox("💾 Also save screenshots to disk", value=False,
+                                   help="Screenshots are always shown in the chat; this keeps a copy per run in artifacts/.")
+
     col1, col2 = st.columns(2)
     with col1:
         start_btn = st.button("🚀 Launch", use_container_width=True)
     with col2:
         stop_btn = st.button("🛑 Stop", use_container_width=True)
-    
+
     if state == "logging_in":
         if st.button("✅ I've Logged In", use_container_width=True):
-            bot = st.session_state.gst_bot
-            if bot:
+            worker = st.session_state.gst_worker
+            if worker:
                 bot_log("user", "I've completed login (CAPTCHA + OTP)")
-                success = bot.wait_for_login(timeout=10)
-                if success:
-                    st.session_state.agent_state = "active"
-                else:
-                    # Even if URL detection fails, trust the user
-                    bot.logged_in = True
-                    st.session_state.agent_state = "active"
-                    bot_log("assistant", "✅ Understood! I'm now in control. Use the actions below to start filing.")
+                # Even if URL detection fails, trust the user
+                worker.interrupt()
+                agent.transition("logged_in")
+                bot_log("assistant", "✅ Understood! I'm now in control. Use the actions below to start filing.")
                 st.rerun()
-    
+
     # Filing Actions (only when active)
     if state in ("active", "waiting_confirm", "waiting_otp"):
         st.markdown("---")
         st.subheader("📋 Filing Actions")
-        
+
         fy = st.selectbox("Financial Year", ["2024-25", "2025-26"])
-        period = st.selectbox("Period", ["January", "February", "March", "April", "May", "June", 
-                                          "July", "August", "September", "October", "November", "December"])
-        
+        period = st.selectbox("Period", db.MONTH_NAMES)
+        period_start, period_end = db.return_period_bounds(fy, period)
+        for return_type in ("GSTR-1", "GSTR-3B"):
+            filed = db.get_filed_return(return_type, fy, period)
+            if filed:
+                st.caption(f"🔒 {return_type} for {period} {fy} was filed on {filed['filed_at'][:10]}; "
+                           "its figures are frozen and the period is locked.")
+
+        resumable_run = db.get_resumable_filing_run("GSTR-1", fy, period)
+        resume = False
+        if resumable_run:
+            resume = st.checkbox(f"↩️ Resume interrupted run #{resumable_run}", value=True)
+        parallel_tabs = st.slider("Parallel tabs for B2B entry", 1, 4, 1,
+                                  help="Falls back to one tab if the portal rejects concurrent edits.")
+
         if st.button("📤 File GSTR-1", use_container_width=True):
-            bot = st.session_state.gst_bot
-            if bot:
-                bot_log("user", f"File GSTR-1 for {period} {fy}")
-                invoices = db.get_invoices()
-                bot.file_gstr1(fy, period, invoices)
-                st.session_state.agent_state = "waiting_confirm"
-                st.rerun()
-        
+            bot_log("user", f"{'Resume' if resume else 'File'} GSTR-1 for {period} {fy}")
+            invoices = db.get_invoices_between(period_start, period_end)
+            send_command("file_gstr1", fy, period, invoices, resume=resume, parallel_tabs=parallel_tabs)
+            st.rerun()
+
         if st.button("📤 File GSTR-3B", use_container_width=True):
-            bot = st.session_state.gst_bot
-            if bot:
-                bot_log("user", f"File GSTR-3B for {period} {fy}")
-                invoices = db.get_invoices()
-                expenses = db.get_expenses()
-                
-                sales_total = invoices['taxable_value'].sum() if not invoices.empty else 0
-                gst_collected = (invoices['igst'].sum() + invoices['cgst'].sum() + invoices['sgst'].sum()) if not invoices.empty else 0
-                itc_available = (expenses['igst'].sum() + expenses['cgst'].sum() + expenses['sgst'].sum()) if not expenses.empty else 0
-                
-                bot.file_gstr3b(fy, period, sales_total, gst_collected, itc_available)
-                st.session_state.agent_state = "waiting_confirm"
-                st.rerun()
-        
-        net_payable = 0
-        invoices = db.get_invoices()
-        expenses = db.get_expenses()
-        gst_collected = (invoices['igst'].sum() + invoices['cgst'].sum() + invoices['sgst'].sum()) if not invoices.empty else 0
-        itc_available = (expenses['igst'].sum() + expenses['cgst'].sum() + expenses['sgst'].sum()) if not expenses.empty else 0
-        net_payable = max(0, gst_collected - itc_available)
-        
-        if net_payable > 0:
-            st.metric("Net Tax Payable", f"₹{net_payable:,.2f}")
-            if st.button("💳 Make Payment", use_container_width=True):
-                bot = st.session_state.gst_bot
-                if bot:
-                    bot_log("user", f"Make payment of ₹{net_payable:,.2f}")
-                    bot.make_payment(net_payable)
-                    st.session_state.agent_state = "waiting_confirm"
-                    st.rerun()
-        
+            bot_log("user", f"File GSTR-3B for {period} {fy}")
+            totals = db.get_gst_totals(period_start, period_end)
+            send_command("file_gstr3b", fy, period, totals["sales_taxable"],
+                         totals["output_tax"], totals["input_tax"])
+            st.rerun()
+
+        payment_panel()
+
         st.markdown("---")
         if st.button("🔔 Check Notices", use_container_width=True):
-            bot = st.session_state.gst_bot
-            if bot:
-                bot_log("user", "Check for notices")
-                notices = bot.get_notifications()
-                if notices and "Error" not in notices[0]:
-                    bot_log("assistant", f"Found {len(notices)} notices.")
-                    for n in notices:
-                        db.add_notification(
-                            date=n.get("Date", str(datetime.date.today())),
-                            type="Portal Notice",
-                            description=f"{n.get('Description')} (ID: {n.get('Notice ID')})",
-                            action_required=n.get("Type", "Check Portal")
-                        )
-                    bot_log("assistant", f"Saved {len(notices)} notices to Task Manager.")
-                else:
-                    bot_log("assistant", "No notices found.")
-                st.rerun()
+            bot_log("user", "Check for notices")
+            send_command("get_notifications")
+            st.rerun()
 
 # ── Main Chat Interface ─────────────────────────────────────────
 
-for message in st.session_state.chat_history:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+def render_artifact(artifact_id):
+    store = st.session_state.artifacts
+    artifact = store.get(artifact_id) if store else None
+    if artifact:
+        st.image(artifact["data"], use_container_width=True)
+    else:
+        st.caption("(screenshot no longer in memory)")
+
+# While the worker is running, refresh only the chat every second so progress streams in
+_worker = st.session_state.gst_worker
+_live = _worker is not None and _worker.is_busy
+
+@st.fragment(run_every=1.0 if _live else None)
+def chat_stream():
+    entity_selector.apply()
+    if drain_worker_events():
+        # Agent state changed: redraw the sidebar too
+        st.rerun()
+    if st.button("⬆️ Show earlier messages", key="load_older"):
+        if not chat.load_older():
+            st.caption("This is the start of the conversation.")
+    for message in chat.visible():
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if message["artifact_id"] is not None:
+                render_artifact(message["artifact_id"])
+    worker = st.session_state.gst_worker
+    if worker and worker.is_busy:
+        progress = worker.last_progress
+        if progress and progress["total"]:
+            st.progress(progress["done"] / progress["total"],
+                        text=f"{progress['label']}: {progress['done']}/{progress['total']}")
+        else:
+            st.caption(f"⏳ Working on `{worker.current_command or 'next command'}`...")
+    elif _live:
+        # Worker went idle since this fragment was scheduled: stop polling
+        st.rerun()
+
+chat_stream()
 
 # ── Handle Start / Stop ─────────────────────────────────────────
 
@@ -148,63 +265,58 @@ if start_btn:
         st.error("Please enter credentials in the sidebar.")
     else:
         bot_log("user", "Launch Agent")
-        bot = GSTBot(headless=False, message_callback=bot_log)
-        st.session_state.gst_bot = bot
-        msg = bot.login(username, password)
-        bot_log("assistant", msg)
-        st.session_state.agent_state = "logging_in"
+        artifacts = ArtifactStore(persist=keep_screenshots)
+        st.session_state.artifacts = artifacts
+        worker = BotWorker(headless=False, artifact_store=artifacts,
+                           network_policy=NetworkPolicy(enabled=fast_network))
+        worker.start()
+        st.session_state.gst_worker = worker
+        worker.submit("login", username, password)
+        # Watch for the dashboard in the background; "I've Logged In" cuts this short
+        worker.submit("wait_for_login", timeout=300)
+        agent.transition("launch")
         st.rerun()
 
 if stop_btn:
-    if st.session_state.gst_bot:
+    if st.session_state.gst_worker:
         bot_log("user", "Stop Agent")
-        st.session_state.gst_bot.close()
-        st.session_state.gst_bot = None
-        bot_log("assistant", "🛑 Agent stopped.")
-        st.session_state.agent_state = "idle"
+        st.session_state.gst_worker.stop()
+        agent.transition("stopping")
         st.rerun()
 
 # ── User Chat Input ──────────────────────────────────────────────
 
 if prompt := st.chat_input("Type a message or reply to the Agent..."):
-    st.session_state.chat_history.append({"role": "user", "content": prompt})
-    bot = st.session_state.gst_bot
-    
-    if not bot:
+    bot_log("user", prompt)
+    worker = st.session_state.gst_worker
+
+    if not worker:
         bot_log("assistant", "Please launch the agent first from the sidebar.")
         st.rerun()
-    
+
     # Handle agent-waiting states
-    elif st.session_state.agent_state == "waiting_confirm":
+    elif agent.state == "waiting_confirm":
         if prompt.lower() in ("yes", "y", "confirm", "proceed"):
             bot_log("assistant", "✅ Confirmed! Proceeding with submission...")
-            bot.receive_reply("yes")
-            # Determine which form to submit
-            last_msgs = [m["content"] for m in st.session_state.chat_history if m["role"] == "assistant"]
-            if any("GSTR-1" in m for m in last_msgs[-5:]):
-                bot.submit_gstr1()
-                st.session_state.agent_state = "waiting_otp"
-            elif any("GSTR-3B" in m for m in last_msgs[-5:]):
-                bot.submit_gstr3b()
-                st.session_state.agent_state = "waiting_otp"
+            worker.submit("receive_reply", "yes")
+            # Run the action carried by the confirmation state (e.g. submit_gstr1)
+            action = agent.confirm()
+            if action:
+                worker.submit(action)
             else:
                 bot_log("assistant", "Proceeding...")
-                st.session_state.agent_state = "active"
         elif prompt.lower() in ("no", "n", "cancel"):
             bot_log("assistant", "❌ Cancelled. No submission was made.")
-            bot.receive_reply("no")
-            st.session_state.agent_state = "active"
+            worker.submit("receive_reply", "no")
+            agent.transition("cancel")
         else:
             bot_log("assistant", "Please type **yes** to confirm or **no** to cancel.")
         st.rerun()
-    
-    elif st.session_state.agent_state == "waiting_otp":
-        bot_log("assistant", f"🔐 Entering OTP...")
-        result = bot.confirm_otp(prompt.strip())
-        bot_log("assistant", result)
-        st.session_state.agent_state = "active"
+
+    elif agent.state == "waiting_otp":
+        send_command("confirm_otp", prompt.strip())
         st.rerun()
-    
+
     else:
         # General chat
         bot_log("assistant", "👍 Noted. Use the sidebar actions to tell me what to do, or I'll respond to specific commands.")
@@ -1,12 +1,22 @@
 import streamlit as st
 import database as db
+import entity_selector
 import pandas as pd
 import datetime
 
 st.set_page_config(page_title="Task Manager", page_icon="📝")
+entity_selector.sidebar()
 
 st.title("📝 Task & Notification Manager")
 
+def bulk_select(rows, columns, key):
+    """Checkbox table over `rows`; returns the ids of the ticked rows."""
+    select_all = st.checkbox("Select all", key=f"{key}_all")
+    table = rows[['id'] + columns].copy()
+    table.insert(0, "Select", select_all)
+    edited = st.data_editor(table, hide_index=True, disabled=['id'] + columns, key=f"{key}_editor")
+    return edited.loc[edited["Select"], "id"].tolist()
+
 tab1, tab2, tab3 = st.tabs(["⚡ My To-Do List", "🔔 Portal Notifications", "🧾 Challan Tracker"])
 
 # --- TAB 1: TO-DO ---
@@ -56,9 +66,16 @@ with tab1:
     st.dataframe(pd.DataFrame(tasks))
     
     # Pending DB Notifications
-    pending_notices = db.get_notifications(pending_only=True)
-    if not pending_notices.empty:
-        st.warning(f"You have {len(pending_notices)} pending items in 'Notifications' or 'Challan Tracker'.")
+    @st.fragment
+    def pending_summary():
+        entity_selector.apply()
+        pending_count = db.count_pending_notifications()
+        if pending_count:
+            st.warning(f"You have {pending_count} pending items in 'Notifications' or 'Challan Tracker'.")
+        if st.button("🔄 Refresh", key="refresh_pending"):
+            st.rerun(scope="fragment")
+
+    pending_summary()
 
 # --- TAB 2: NOTIFICATIONS ---
 with tab2:
@@ -75,9 +92,41 @@ with tab2:
                 st.success("Reminder Added!")
                 st.rerun()
 
-    # View Notifications
-    notices = db.get_notifications()
-    if not notices.empty:
+    # View Notifications (a fragment: acknowledging re-runs and re-queries only this list)
+    @st.fragment
+    def notifications_list():
+        entity_selector.apply()
+        notices = db.get_notifications()
+        if notices.empty:
+            st.info("No notifications found.")
+            return
+
+        pending = notices[(notices['status'] == 'Pending') & (notices['type'] != 'Challan')]
+        if not pending.empty:
+            with st.expander(f"⚡ Bulk actions ({len(pending)} pending)"):
+                chosen = bulk_select(pending, ['date', 'type', 'description'], key="bulk_ack")
+                if st.button(f"Acknowledge {len(chosen)} selected", disabled=not chosen, key="bulk_ack_btn"):
+                    updated = db.update_notification_status_many(chosen, "Acknowledged")
+                    st.toast(f"Acknowledged {updated} notices.")
+                    st.rerun(scope="fragment")
+
+                st.markdown("**Or by filter**")
+                f1, f2 = st.columns(2)
+                with f1:
+                    cutoff = st.date_input("Pending notices dated before", datetime.date.today(), key="bulk_ack_cutoff")
+                with f2:
+                    types = ["All types"] + sorted(t for t in pending['type'].dropna().unique())
+                    bulk_type = st.selectbox("Type", types, key="bulk_ack_type")
+                if st.button("Acknowledge all matching", key="bulk_ack_filter_btn"):
+                    updated = db.update_notifications_where(
+                        "Acknowledged",
+                        type=None if bulk_type == "All types" else bulk_type,
+                        exclude_type="Challan",
+                        before_date=cutoff,
+                    )
+                    st.toast(f"Acknowledged {updated} notices.")
+                    st.rerun(scope="fragment")
+
         for index, row in notices.iterrows():
             col1, col2, col3, col4 = st.columns([2, 4, 2, 2])
             
@@ -98,9 +147,9 @@ with tab2:
                 if row['status'] == 'Pending':
                     if st.button("Acknowledge", key=f"ack_{row['id']}"):
                         db.update_notification_status(row['id'], "Acknowledged")
-                        st.rerun()
-    else:
-        st.info("No notifications found.")
+                        st.rerun(scope="fragment")
+
+    notifications_list()
 
 # --- TAB 3: CHALLAN TRACKER ---
 with tab3:
@@ -118,11 +167,30 @@ with tab3:
                 st.success("Challan Saved!")
                 st.rerun()
     
-    # Filter for Challans only
-    all_notifs = db.get_notifications()
-    challans = all_notifs[all_notifs['type'] == 'Challan']
-    
-    if not challans.empty:
+    # Challans only, filtered in SQL (a fragment: marking paid re-runs only this list)
+    @st.fragment
+    def challan_list():
+        entity_selector.apply()
+        challans = db.get_notifications(type="Challan")
+        if challans.empty:
+            st.info("No Challans recorded.")
+            return
+
+        unpaid = challans[challans['status'] == 'Pending']
+        if not unpaid.empty:
+            with st.expander(f"⚡ Bulk actions ({len(unpaid)} unpaid)"):
+                chosen = bulk_select(unpaid, ['date', 'description'], key="bulk_pay")
+                if st.button(f"Mark {len(chosen)} selected as Paid", disabled=not chosen, key="bulk_pay_btn"):
+                    updated = db.update_notification_status_many(chosen, "Paid")
+                    st.toast(f"Marked {updated} challans as paid.")
+                    st.rerun(scope="fragment")
+
+                cutoff = st.date_input("Unpaid challans created before", datetime.date.today(), key="bulk_pay_cutoff")
+                if st.button("Mark all matching as Paid", key="bulk_pay_filter_btn"):
+                    updated = db.update_notifications_where("Paid", type="Challan", before_date=cutoff)
+                    st.toast(f"Marked {updated} challans as paid.")
+                    st.rerun(scope="fragment")
+
         for index, row in challans.iterrows():
             col1, col2, col3, col4 = st.columns([2, 4, 2, 2])
              
@@ -143,6 +211,6 @@ with tab3:
                 if row['status'] == 'Pending':
                     if st.button("Mark Paid", key=f"pay_{row['id']}"):
                         db.update_notification_status(row['id'], "Paid")
-                        st.rerun()
-    else:
-        st.info("No Challans recorded.")
+                        st.rerun(scope="fragment")
+
+    challan_list()
@@ -0,0 +1,96 @@
+import streamlit as st
+import database as db
+import entity_selector
+import datetime
+
+st.set_page_config(page_title="Receivables", page_icon="📥", layout="wide")
+entity_selector.sidebar()
+
+st.title("📥 Receivables")
+st.write("Record customer payments and see who owes you what.")
+
+aging = db.get_aging()
+
+# Metrics
+total_outstanding = aging["outstanding"].sum() if not aging.empty else 0
+overdue_90 = aging["90+"].sum() if not aging.empty else 0
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric("Total Outstanding", f"₹ {total_outstanding:,.2f}")
+with col2:
+    st.metric("Customers with Dues", f"{len(aging)}")
+with col3:
+    st.metric("Over 90 Days", f"₹ {overdue_90:,.2f}", delta_color="inverse")
+
+tab1, tab2, tab3 = st.tabs(["⏳ Aging Report", "💵 Record Payment", "📜 Payment History"])
+
+with tab1:
+    st.header("Aging Report")
+    st.caption("Outstanding balance per customer by days since the invoice date.")
+    if aging.empty:
+        st.success("✅ No outstanding invoices.")
+    else:
+        st.dataframe(aging, hide_index=True, use_container_width=True)
+        st.download_button("Download Aging (CSV)", aging.to_csv(index=False),
+                           file_name=f"aging_{datetime.date.today()}.csv", mime="text/csv")
+
+        customer = st.selectbox("Open invoices of", aging["customer_name"].tolist())
+        st.dataframe(db.get_open_invoices(customer), hide_index=True, use_container_width=True)
+
+with tab2:
+    st.header("Record Payment")
+    customers = aging["customer_name"].tolist()
+    if not customers:
+        st.info("No customer has an outstanding balance.")
+    else:
+        customer = st.selectbox("Customer", customers, key="payment_customer")
+        open_invoices = db.get_open_invoices(customer)
+
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            date = st.date_input("Payment Date", datetime.date.today())
+        with c2:
+            amount = st.number_input("Amount Received (₹)", min_value=0.0, format="%.2f")
+        with c3:
+            mode = st.selectbox("Mode", ["Bank Transfer", "UPI", "Cheque", "Cash"])
+        reference = st.text_input("Reference (UTR / Cheque No.)")
+
+        auto = st.checkbox("Settle oldest invoices first", value=True)
+        allocations = None
+        if not auto:
+            editor = open_invoices[["id", "date", "invoice_no", "balance"]].assign(allocate=0.0)
+            edited = st.data_editor(
+                editor, hide_index=True, use_container_width=True, disabled=["id", "date", "invoice_no", "balance"],
+                column_config={"allocate": st.column_config.NumberColumn("Allocate (₹)", min_value=0.0, format="%.2f")},
+                key=f"allocate_{customer}",
+            )
+            allocations = dict(zip(edited["id"], edited["allocate"]))
+            st.caption(f"Allocated: ₹ {sum(allocations.values()):,.2f} of ₹ {amount:,.2f}")
+
+        if st.button("Save Payment"):
+            if amount <= 0:
+                st.error("Enter the amount received.")
+            else:
+                try:
+                    db.record_payment(date, customer, amount, mode, reference or None, allocations)
+                    st.success("Payment Recorded Successfully!")
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+
+with tab3:
+    st.header("Payment History")
+    payments = db.get_payments(limit=200)
+    if payments.empty:
+        st.info("No payments recorded yet.")
+    else:
+        st.dataframe(payments.drop(columns=["created_at"]), hide_index=True, use_container_width=True)
+        with st.expander("🗑️ Delete a payment"):
+            labels = {row.id: f"#{row.id} · {row.customer_name} · ₹{row.amount:,.2f} · {row.date}"
+                      for row in payments.itertuples()}
+            payment_id = st.selectbox("Payment", list(labels), format_func=labels.get)
+            if st.button("Delete Payment"):
+                db.delete_payment(payment_id)
+                st.success("Payment deleted; invoice balances restored.")
+                st.rerun()
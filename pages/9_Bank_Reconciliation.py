@@ -0,0 +1,88 @@
+import streamlit as st
+import database as db
+import entity_selector
+import bank_import
+import json
+
+st.set_page_config(page_title="Bank Reconciliation", page_icon="🏦", layout="wide")
+entity_selector.sidebar()
+
+st.title("🏦 Bank Reconciliation")
+st.write("Import bank statements and match them to your invoices and expenses automatically.")
+
+with st.expander("📤 Import Statement", expanded=True):
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        uploaded = st.file_uploader("Bank statement (CSV or OFX)", type=["csv", "ofx", "qfx"])
+    with c2:
+        account = st.text_input("Account name", value="Bank")
+    if uploaded is not None and st.button("Import & Match"):
+        with st.spinner("Reading statement..."):
+            read, added = bank_import.import_statement(uploaded, uploaded.name, account)
+            result = bank_import.match_pending()
+        st.success(f"✅ Read {read:,} lines ({added:,} new, {read - added:,} already imported). "
+                   f"Matched {result['matched']:,}, {result['review']:,} need review.")
+
+counts = db.count_bank_transactions()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Matched", f"{counts.get('Matched', 0):,}")
+col2.metric("Needs Review", f"{counts.get('Review', 0):,}")
+col3.metric("Unmatched", f"{counts.get('Unmatched', 0):,}")
+col4.metric("Ignored", f"{counts.get('Ignored', 0):,}")
+
+if counts.get("Unmatched") and st.button("🔄 Re-run Matching"):
+    result = bank_import.match_pending()
+    st.toast(f"Matched {result['matched']:,}, {result['review']:,} to review.")
+    st.rerun()
+
+tab1, tab2, tab3 = st.tabs(["🔍 Review Queue", "❓ Unmatched", "✅ Matched"])
+
+@st.fragment
+def review_queue():
+    entity_selector.apply()
+    queue = db.get_bank_transactions(status="Review", limit=25)
+    if queue.empty:
+        st.success("✅ Nothing to review.")
+        return
+    st.caption(f"Showing {len(queue)} of {counts.get('Review', 0):,} lines with more than one possible match.")
+    for txn in queue.itertuples():
+        direction = "⬇️ Received" if txn.direction == "credit" else "⬆️ Paid"
+        with st.container(border=True):
+            st.markdown(f"**{txn.date}** · {direction} **₹{txn.amount:,.2f}** · {txn.description}")
+            candidates = json.loads(txn.candidates or "[]")
+            labels = {i: f"{c['type'].title()} {c['ref'] or '#' + str(c['id'])} · {c['party']} · {c['date']} "
+                         f"(score {c['score']:.2f})" for i, c in enumerate(candidates)}
+            choice = st.radio("Match to", list(labels), format_func=labels.get, key=f"review_{txn.id}",
+                              label_visibility="collapsed")
+            b1, b2, _ = st.columns([1, 1, 4])
+            if b1.button("✅ Confirm", key=f"confirm_{txn.id}"):
+                picked = candidates[choice]
+                try:
+                    db.confirm_bank_match(txn.id, picked["type"], picked["id"])
+                except ValueError as e:
+                    st.toast(f"⚠️ {e}")
+                st.rerun(scope="fragment")
+            if b2.button("🚫 Ignore", key=f"ignore_{txn.id}"):
+                db.set_bank_transaction_status(txn.id, "Ignored")
+                st.rerun(scope="fragment")
+
+with tab1:
+    review_queue()
+
+with tab2:
+    unmatched = db.get_bank_transactions(status="Unmatched", limit=500)
+    if unmatched.empty:
+        st.info("No unmatched lines.")
+    else:
+        st.caption("No invoice or expense has this amount within the date window. Record the missing entry, "
+                   "then re-run matching.")
+        st.dataframe(unmatched[["id", "account", "date", "direction", "amount", "description", "reference"]],
+                     hide_index=True, use_container_width=True)
+
+with tab3:
+    matched = db.get_bank_transactions(status="Matched", limit=500)
+    if matched.empty:
+        st.info("No matched lines yet.")
+    else:
+        st.dataframe(matched[["id", "account", "date", "direction", "amount", "description", "match_type",
+                              "match_id", "match_score"]], hide_index=True, use_container_width=True)
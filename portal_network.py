@@ -0,0 +1,227 @@
+"""
+Request routing for GSTBot's browser context.
+
+Blocks resource types and third-party hosts the automation never needs
+(images, fonts, analytics) and serves repeat static assets (scripts,
+stylesheets) from a local disk cache. Cached entries follow HTTP freshness:
+they are reused for their Cache-Control max-age (or Expires), then
+revalidated with If-None-Match / If-Modified-Since, so a portal deploy that
+reuses script URLs is picked up. Keeps counters so the effect on bytes
+transferred and page-ready time can be compared with routing off.
+"""
+
+import hashlib
+import json
+import os
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_DIR, ".portal_cache")
+
+
+class NetworkPolicy:
+    """What the router blocks and caches. Pass `enabled=False` to measure the baseline."""
+
+    def __init__(self,
+                 enabled=True,
+                 blocked_resource_types=("image", "media", "font"),
+                 first_party_hosts=("gst.gov.in",),
+                 block_third_party=True,
+                 always_allow=("captcha",),
+                 cacheable_resource_types=("script", "stylesheet"),
+                 cache_dir=DEFAULT_CACHE_DIR,
+                 max_cache_entry_bytes=5 * 1024 * 1024,
+                 default_max_age=300):
+        self.enabled = enabled
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.first_party_hosts = tuple(first_party_hosts)
+        self.block_third_party = block_third_party
+        # URL substrings that are never blocked (the login CAPTCHA is an image)
+        self.always_allow = tuple(always_allow)
+        self.cacheable_resource_types = set(cacheable_resource_types)
+        self.cache_dir = cache_dir
+        self.max_cache_entry_bytes = max_cache_entry_bytes
+        # Seconds to reuse a response that states no freshness of its own before revalidating
+        self.default_max_age = default_max_age
+
+    def is_first_party(self, url):
+        host = urlparse(url).hostname or ""
+        return any(host == h or host.endswith("." + h) for h in self.first_party_hosts)
+
+    def should_block(self, url, resource_type):
+        if any(token in url.lower() for token in self.always_allow):
+            return False
+        if resource_type in self.blocked_resource_types:
+            return True
+        return self.block_third_party and not self.is_first_party(url)
+
+    def is_cacheable(self, url, method, resource_type):
+        return (method == "GET" and resource_type in self.cacheable_resource_types
+                and self.is_first_party(url))
+
+
+def _header(headers, name):
+    return next((v for k, v in headers.items() if k.lower() == name), None)
+
+
+def freshness(headers, default):
+    """Seconds a response may be served from cache without revalidation; None if it must not be stored."""
+    directives = [d.strip().lower() for d in (_header(headers, "cache-control") or "").split(",") if d.strip()]
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for directive in directives:
+        if directive.startswith("max-age="):
+            try:
+                return max(0, int(directive.split("=", 1)[1].strip('"')))
+            except ValueError:
+                return 0
+    expires = _header(headers, "expires")
+    if expires:
+        try:
+            return max(0, int(parsedate_to_datetime(expires).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return 0  # invalid Expires means already expired
+    return default
+
+
+class PortalRouter:
+    """Routes every request of a Playwright context through a NetworkPolicy."""
+
+    def __init__(self, policy=None):
+        self.policy = policy or NetworkPolicy()
+        self.stats = {
+            "requests": 0,
+            "blocked": 0,
+            "cache_hits": 0,
+            "revalidated": 0,  # stale entries confirmed unchanged by a 304
+            "cache_stores": 0,
+            "bytes_fetched": 0,
+            "bytes_saved": 0,
+            "page_loads": [],  # seconds from goto() to networkidle
+        }
+        if self.policy.enabled:
+            os.makedirs(self.policy.cache_dir, exist_ok=True)
+
+    def attach(self, context):
+        if self.policy.enabled:
+            context.route("**/*", self._handle)
+
+    # ── Disk cache ──────────────────────────────────────────────────
+
+    def _cache_paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.policy.cache_dir, key)
+        return base + ".body", base + ".json"
+
+    def _cache_get(self, url):
+        body_path, meta_path = self._cache_paths(url)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _cache_put(self, url, status, headers, body):
+        max_age = freshness(headers, self.policy.default_max_age)
+        if max_age is None or len(body) > self.policy.max_cache_entry_bytes:
+            return
+        body_path, meta_path = self._cache_paths(url)
+        keep = {k: v for k, v in headers.items() if k.lower() in ("content-type", "etag", "last-modified")}
+        tmp = body_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, body_path)
+        self._write_meta(meta_path, {"url": url, "status": status, "headers": keep,
+                                     "fetched_at": time.time(), "max_age": max_age})
+        self.stats["cache_stores"] += 1
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def _is_fresh(meta):
+        # Entries from before freshness was recorded count as stale
+        return time.time() - meta.get("fetched_at", 0) < meta.get("max_age", 0)
+
+    # ── Route handler ───────────────────────────────────────────────
+
+    def _serve_cached(self, route, meta, body):
+        self.stats["cache_hits"] += 1
+        self.stats["bytes_saved"] += len(body)
+        route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+
+    def _handle(self, route, request):
+        self.stats["requests"] += 1
+        url, rtype = request.url, request.resource_type
+
+        if self.policy.should_block(url, rtype):
+            self.stats["blocked"] += 1
+            route.abort()
+            return
+
+        if not self.policy.is_cacheable(url, request.method, rtype):
+            route.continue_()
+            return
+
+        meta, cached = self._cache_get(url)
+        if cached is not None and self._is_fresh(meta):
+            self._serve_cached(route, meta, cached)
+            return
+
+        # Stale (or missing): fetch, conditionally when the entry has validators
+        headers = dict(request.headers)
+        if cached is not None:
+            etag, modified = _header(meta["headers"], "etag"), _header(meta["headers"], "last-modified")
+            if etag:
+                headers["if-none-match"] = etag
+            if modified:
+                headers["if-modified-since"] = modified
+        try:
+            response = route.fetch(headers=headers)
+            if cached is not None and response.status == 304:
+                max_age = freshness(response.headers, self.policy.default_max_age)
+                self._write_meta(self._cache_paths(url)[1], {**meta, "fetched_at": time.time(),
+                                                             "max_age": max_age or 0})
+                self.stats["revalidated"] += 1
+                self._serve_cached(route, meta, cached)
+                return
+            body = response.body()
+        except Exception:
+            route.continue_()
+            return
+        self.stats["bytes_fetched"] += len(body)
+        if response.status == 200:
+            self._cache_put(url, response.status, response.headers, body)
+        route.fulfill(response=response, body=body)
+
+    # ── Reporting ───────────────────────────────────────────────────
+
+    def record_page_load(self, seconds):
+        self.stats["page_loads"].append(seconds)
+
+    def summary(self):
+        loads = self.stats["page_loads"]
+        avg_ms = (sum(loads) / len(loads) * 1000) if loads else 0
+        mode = "routing on" if self.policy.enabled else "routing off (baseline)"
+        return (f"🌐 Network ({mode}): {self.stats['requests']} requests, "
+                f"{self.stats['blocked']} blocked, {self.stats['cache_hits']} served from cache "
+                f"({self.stats['revalidated']} revalidated), "
+                f"{self.stats['bytes_saved'] / 1024:,.0f} KB saved | "
+                f"avg page-ready {avg_ms:,.0f} ms over {len(loads)} loads")
+
+
+def timed_goto(page, url, router=None, wait_until="networkidle"):
+    """Navigate and wait for the page to settle, recording page-ready time on the router."""
+    started = time.perf_counter()
+    page.goto(url)
+    page.wait_for_load_state(wait_until)
+    if router:
+        router.record_page_load(time.perf_counter() - started)
@@ -0,0 +1,328 @@
+"""
+Intent-to-SQL query engine for the AI Assistant.
+
+Turns questions like "total sales last month", "top 3 customers in Q2" or
+"how much tax do I owe for FY 2025-26" into a plan (intent, top-N, date
+range) and then into parameterized aggregate SQL that filters on the
+indexed `date` columns instead of loading whole tables into pandas.
+
+Parsed plans are memoised per question; query results are cached and
+reused until the ledger's write generation (bumped by triggers on every
+insert/update/delete) changes. Ranges reaching into archived financial
+years read the attached archives alongside the live tables.
+"""
+
+import calendar
+import datetime
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import database as db
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+                "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+
+# ── Time expressions ────────────────────────────────────────────────
+
+def fy_start_year(day):
+    """Indian financial years run April–March; FY 2025-26 starts in 2025."""
+    return day.year if day.month >= 4 else day.year - 1
+
+
+def fy_range(start_year):
+    return datetime.date(start_year, 4, 1), datetime.date(start_year + 1, 4, 1)
+
+
+def month_range(year, month):
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    return start, end
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def fy_quarter_range(start_year, quarter):
+    """Q1 = Apr–Jun, Q2 = Jul–Sep, Q3 = Oct–Dec, Q4 = Jan–Mar."""
+    start = add_months(datetime.date(start_year, 4, 1), 3 * (quarter - 1))
+    return start, add_months(start, 3)
+
+
+def _parse_fy(text):
+    """Start year of an explicit FY ('fy 2025-26', 'fy25-26', 'fy 2025', '2025-26'), or None."""
+    m = re.search(r"\bfy\s*'?(\d{2}|\d{4})(?:\s*[-/]\s*(\d{2}|\d{4}))?\b", text)
+    if not m:
+        m = re.search(r"\b(\d{4})\s*[-/]\s*(\d{2})\b(?![-/]\d)", text)
+    if not m:
+        return None
+    year = int(m.group(1))
+    return year + 2000 if year < 100 else year
+
+
+def parse_time_range(text, today=None):
+    """
+    Returns (start, end, label) with `end` exclusive, or (None, None, "all time").
+    """
+    today = today or datetime.date.today()
+    text = text.lower()
+    fy = _parse_fy(text)
+
+    m = re.search(r"\bq([1-4])\b", text) or re.search(r"\b(first|second|third|fourth) quarter\b", text)
+    if m:
+        q = m.group(1)
+        quarter = int(q) if q.isdigit() else ["first", "second", "third", "fourth"].index(q) + 1
+        year = fy if fy is not None else fy_start_year(today)
+        start, end = fy_quarter_range(year, quarter)
+        return start, end, f"Q{quarter} FY {year}-{(year + 1) % 100:02d}"
+
+    if fy is not None:
+        start, end = fy_range(fy)
+        return start, end, f"FY {fy}-{(fy + 1) % 100:02d}"
+
+    if "today" in text:
+        return today, today + datetime.timedelta(days=1), "today"
+    if "yesterday" in text:
+        return today - datetime.timedelta(days=1), today, "yesterday"
+
+    m = re.search(r"\b(?:last|past|previous)\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\s+(day|week|month)s?\b", text)
+    if m:
+        n = int(m.group(1)) if m.group(1).isdigit() else NUMBER_WORDS[m.group(1)]
+        unit = m.group(2)
+        end = today + datetime.timedelta(days=1)
+        if unit == "month":
+            start = add_months(today.replace(day=1), -(n - 1))
+        else:
+            start = end - datetime.timedelta(days=n * (7 if unit == "week" else 1))
+        return start, end, f"last {n} {unit}s"
+
+    if re.search(r"\b(this|current) week\b", text):
+        start = today - datetime.timedelta(days=today.weekday())
+        return start, start + datetime.timedelta(days=7), "this week"
+    if re.search(r"\b(last|previous) week\b", text):
+        start = today - datetime.timedelta(days=today.weekday() + 7)
+        return start, start + datetime.timedelta(days=7), "last week"
+
+    if re.search(r"\b(this|current) month\b", text):
+        start, end = month_range(today.year, today.month)
+        return start, end, "this month"
+    if re.search(r"\b(last|previous) month\b", text):
+        prev = add_months(today.replace(day=1), -1)
+        start, end = month_range(prev.year, prev.month)
+        return start, end, f"last month ({start:%b %Y})"
+
+    current_q = (today.month - 4) % 12 // 3 + 1
+    if re.search(r"\b(this|current) quarter\b", text):
+        start, end = fy_quarter_range(fy_start_year(today), current_q)
+        return start, end, "this quarter"
+    if re.search(r"\b(last|previous) quarter\b", text):
+        start, _ = fy_quarter_range(fy_start_year(today), current_q)
+        start = add_months(start, -3)
+        return start, add_months(start, 3), "last quarter"
+
+    if re.search(r"\b(this|current) (financial |fiscal )?year\b|\bthis fy\b|\bytd\b", text):
+        start, end = fy_range(fy_start_year(today))
+        return start, end, "this financial year"
+    if re.search(r"\b(last|previous) (financial |fiscal )?year\b|\blast fy\b", text):
+        start, end = fy_range(fy_start_year(today) - 1)
+        return start, end, "last financial year"
+
+    m = re.search(r"\b(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?", text)
+    if m and not (m.group(1) == "may" and not m.group(2) and re.search(r"\bmay\s+(i|we|you)\b", text)):
+        month = MONTHS[m.group(1)]
+        if m.group(2):
+            year = int(m.group(2))
+        else:
+            # Most recent such month that has started
+            year = today.year if month <= today.month else today.year - 1
+        start, end = month_range(year, month)
+        return start, end, f"{start:%B %Y}"
+
+    return None, None, "all time"
+
+
+# ── Intents ─────────────────────────────────────────────────────────
+
+def _top_n(text):
+    m = re.search(r"\btop\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\b", text)
+    if m:
+        return int(m.group(1)) if m.group(1).isdigit() else NUMBER_WORDS[m.group(1)]
+    return None
+
+
+def parse_intent(text):
+    """Returns (intent, n) or (None, None) when no known question is recognised."""
+    text = text.lower()
+    ranking = re.search(r"\b(top|best|biggest|largest|highest|most|main|major)\b", text)
+    n = _top_n(text)
+
+    if ranking or n:
+        if re.search(r"\b(customer|client|buyer)", text):
+            plural = re.search(r"\b(customers|clients|buyers)\b", text)
+            return "top_customers", n or (5 if plural else 1)
+        if re.search(r"\b(vendor|supplier|seller)", text):
+            plural = re.search(r"\b(vendors|suppliers|sellers)\b", text)
+            return "top_vendors", n or (5 if plural else 1)
+        if "categor" in text:
+            return "top_categories", n or (5 if "categories" in text else 1)
+
+    if re.search(r"\btax\b|\bgst\b|\bowe\b|\bitc\b|liabilit|payable", text):
+        return "tax", None
+    if "profit" in text or "margin" in text:
+        return "profit", None
+    if re.search(r"expense|spend|spent|cost|purchase", text):
+        return "expenses", None
+    if re.search(r"sales|sold|revenue|income|turnover|earn", text):
+        return "sales", None
+    if re.search(r"\binvoices?\b", text) and re.search(r"how many|count|number of", text):
+        return "invoice_count", None
+    return None, None
+
+
+@lru_cache(maxsize=512)
+def _parse_cached(text, today_iso):
+    intent, n = parse_intent(text)
+    if intent is None:
+        return None
+    start, end, label = parse_time_range(text, datetime.date.fromisoformat(today_iso))
+    return {"intent": intent, "n": n, "start": start, "end": end, "label": label}
+
+
+def parse(query, today=None):
+    """Plan for a question: {"intent", "n", "start", "end", "label"} or None."""
+    text = " ".join(query.lower().split())
+    return _parse_cached(text, (today or datetime.date.today()).isoformat())
+
+
+# ── SQL compilation ─────────────────────────────────────────────────
+
+def _where(plan):
+    clauses, params = ["entity_id = ?"], [db.current_entity()]
+    if plan["start"]:
+        clauses.append("date >= ?")
+        params.append(plan["start"].isoformat())
+    if plan["end"]:
+        clauses.append("date < ?")
+        params.append(plan["end"].isoformat())
+    return " WHERE " + " AND ".join(clauses), params
+
+
+def compile_plan(plan):
+    """Named parameterized statements for a plan: [(name, sql, params), ...]."""
+    where, params = _where(plan)
+    intent = plan["intent"]
+    if intent == "sales":
+        return [("sales", f"SELECT COALESCE(SUM(total_amount), 0), COUNT(*) FROM invoices{where}", params)]
+    if intent == "invoice_count":
+        return [("count", f"SELECT COUNT(*), COALESCE(SUM(total_amount), 0) FROM invoices{where}", params)]
+    if intent == "expenses":
+        return [
+            ("expenses", f"SELECT COALESCE(SUM(total_amount), 0), COUNT(*) FROM expenses{where}", params),
+            ("top_category", f"SELECT category, SUM(total_amount) AS total FROM expenses{where} "
+                             f"GROUP BY category ORDER BY total DESC LIMIT 1", params),
+        ]
+    if intent == "tax":
+        tax = "COALESCE(SUM(igst), 0) + COALESCE(SUM(cgst), 0) + COALESCE(SUM(sgst), 0)"
+        return [
+            ("liability", f"SELECT {tax} FROM invoices{where}", params),
+            ("itc", f"SELECT {tax} FROM expenses{where}", params),
+        ]
+    if intent == "profit":
+        return [
+            ("sales", f"SELECT COALESCE(SUM(taxable_value), 0) FROM invoices{where}", params),
+            ("costs", f"SELECT COALESCE(SUM(taxable_value), 0) FROM expenses{where}", params),
+        ]
+    group = {
+        "top_customers": ("customer_name", "invoices"),
+        "top_vendors": ("vendor_name", "expenses"),
+        "top_categories": ("category", "expenses"),
+    }[intent]
+    column, table = group
+    return [("top", f"SELECT {column}, SUM(total_amount) AS total, COUNT(*) AS entries FROM {table}{where} "
+                    f"GROUP BY {column} ORDER BY total DESC LIMIT ?", params + [plan["n"]])]
+
+
+# ── Execution with generation-keyed result cache ─────────────────────
+
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_SIZE = 256
+# Streamlit runs each session's script in its own thread; the query itself runs outside the lock
+_RESULT_LOCK = threading.Lock()
+
+
+def _fetch(sql, params, start=None, end=None):
+    generation = db.get_write_generation()
+    key = (sql, tuple(params))
+    with _RESULT_LOCK:
+        hit = _RESULT_CACHE.get(key)
+        if hit and hit[0] == generation:
+            _RESULT_CACHE.move_to_end(key)
+            return hit[1]
+    conn, source = db.ledger_connection(start, end)
+    sql = re.sub(r"\bFROM (invoices|expenses)\b", lambda m: f"FROM {source[m.group(1)]}", sql)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    with _RESULT_LOCK:
+        _RESULT_CACHE[key] = (generation, rows)
+        _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+    return rows
+
+
+def execute(plan):
+    return {name: _fetch(sql, params, plan["start"], plan["end"]) for name, sql, params in compile_plan(plan)}
+
+
+def answer(query, today=None):
+    """
+    Answer a question. Returns (markdown, rows) where rows is a list of
+    (name, total, entries) tuples for top-N questions, or None if the
+    question is not understood.
+    """
+    plan = parse(query, today)
+    if plan is None:
+        return None
+    results = execute(plan)
+    period = plan["label"]
+    intent = plan["intent"]
+
+    if intent == "sales":
+        total, count = results["sales"][0]
+        return f"Your total sales revenue for **{period}** is **₹ {total:,.2f}** across {count} invoices.", None
+    if intent == "invoice_count":
+        count, total = results["count"][0]
+        return f"You issued **{count} invoices** for **{period}**, worth ₹ {total:,.2f}.", None
+    if intent == "expenses":
+        total, count = results["expenses"][0]
+        response = f"Your total expenses for **{period}** are **₹ {total:,.2f}** across {count} entries."
+        if results["top_category"]:
+            response += f"\n\nYour highest spending category is **{results['top_category'][0][0]}**."
+        return response, None
+    if intent == "tax":
+        liability, itc = results["liability"][0][0], results["itc"][0][0]
+        net = max(0, liability - itc)
+        return (f"**Period:** {period}\n\n"
+                f"**GST Liability:** ₹ {liability:,.2f}\n\n"
+                f"**ITC Available:** ₹ {itc:,.2f}\n\n"
+                f"**Net Payable:** ₹ {net:,.2f}"), None
+    if intent == "profit":
+        profit = results["sales"][0][0] - results["costs"][0][0]
+        return (f"Your estimated gross profit (Taxable Sales - Taxable Expenses) for **{period}** "
+                f"is **₹ {profit:,.2f}**."), None
+
+    rows = results["top"]
+    noun = {"top_customers": "customer", "top_vendors": "vendor", "top_categories": "category"}[intent]
+    if not rows:
+        return f"No {noun} data for **{period}**.", None
+    if plan["n"] == 1:
+        name, total, entries = rows[0]
+        return f"Your top {noun} for **{period}** is **{name}** with **₹ {total:,.2f}** ({entries} entries).", None
+    return f"Top {len(rows)} by amount for **{period}**:", rows
@@ -0,0 +1,221 @@
+"""
+GSTR-2B import and ITC reconciliation against the expenses ledger.
+
+GSTR-2B is the auto-drafted statement of what suppliers actually filed.
+`parse_gstr2b` reads the JSON the portal lets you download, and
+`reconcile` matches it against the books in two passes:
+
+  1. a hash join on normalized (supplier GSTIN, invoice number), and
+  2. for whatever is left, a join on GSTIN and neighbouring tax-amount
+     buckets (so only near-equal amounts are ever paired up), kept when the
+     tax amount is within tolerance and the dates are within a few days.
+
+Everything is done with pandas merges, so a month with 100k purchase
+lines reconciles in a couple of seconds. Results come back in four buckets:
+matched, mismatched (same invoice, different amounts), missing in 2B
+(ITC at risk) and missing in books (not recorded yet).
+"""
+
+import calendar
+import json
+from datetime import datetime
+
+import pandas as pd
+
+import database as db
+
+AMOUNT_TOLERANCE = 1.0  # ₹
+DATE_WINDOW = 3  # days, for the fallback match
+
+BUCKETS = ("matched", "mismatched", "missing_in_2b", "missing_in_books")
+TAX_COLUMNS = ("igst", "cgst", "sgst")
+
+
+# ── Import ───────────────────────────────────────────────────────
+
+def _iso_date(value):
+    """'15-03-2026' (2B format) → '2026-03-15'; ISO input passes through."""
+    value = str(value or "").strip()
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _period(rtnprd):
+    """'032026' → '2026-03'."""
+    rtnprd = str(rtnprd or "").strip()
+    if len(rtnprd) == 6 and rtnprd.isdigit():
+        return f"{rtnprd[2:]}-{rtnprd[:2]}"
+    return None
+
+
+def parse_gstr2b(data):
+    """
+    (return_period, lines) from a GSTR-2B JSON document (dict, str or bytes).
+    Only B2B invoices are read; credit/debit notes and amendments are skipped.
+    """
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    body = data.get("data", data)
+    period = _period(body.get("rtnprd"))
+    docdata = body.get("docdata", {})
+
+    lines = []
+    for supplier in docdata.get("b2b", []):
+        gstin = supplier.get("ctin")
+        name = supplier.get("trdnm")
+        for inv in supplier.get("inv", []):
+            items = inv.get("items") or []
+            amounts = {}
+            for key in ("txval", *TAX_COLUMNS, "cess"):
+                # Invoice-level totals when present, otherwise the sum of the rate-wise items
+                amounts[key] = float(inv[key]) if key in inv else sum(float(i.get(key, 0) or 0) for i in items)
+            lines.append({
+                "supplier_gstin": gstin,
+                "supplier_name": name,
+                "invoice_no": inv.get("inum"),
+                "invoice_date": _iso_date(inv.get("dt")),
+                "taxable_value": amounts["txval"],
+                "igst": amounts["igst"],
+                "cgst": amounts["cgst"],
+                "sgst": amounts["sgst"],
+                "cess": amounts["cess"],
+                "invoice_value": float(inv.get("val", 0) or 0),
+                "itc_available": inv.get("itcavl", "Y"),
+            })
+    return period, lines
+
+
+def import_gstr2b(data, source_file=None, return_period=None):
+    """Parse and store a 2B file, replacing earlier imports of the same period. Returns (period, count)."""
+    period, lines = parse_gstr2b(data)
+    period = return_period or period
+    if not period:
+        raise ValueError("GSTR-2B file has no return period (rtnprd); choose the period manually.")
+    return period, db.replace_gstr2b_lines(period, lines, source_file)
+
+
+# ── Matching ─────────────────────────────────────────────────────
+
+def normalize_gstin(values):
+    return values.fillna("").astype(str).str.upper().str.replace(r"\s+", "", regex=True)
+
+
+def normalize_invoice_no(values):
+    """'inv/0042/25-26' and 'INV-42-25-26' both become 'INV422526'."""
+    return (values.fillna("").astype(str).str.upper()
+            .str.replace(r"[^A-Z0-9]", "", regex=True)
+            # Leading zeros of each digit run ("0042" → "42")
+            .str.replace(r"(?<![0-9])0+(?=[0-9])", "", regex=True))
+
+
+def _prepare(df, gstin_col, name_col, invoice_col, date_col):
+    out = pd.DataFrame({
+        "row_id": df["id"].to_numpy(),
+        "gstin": df[gstin_col].to_numpy(),
+        "name": df[name_col].to_numpy(),
+        "invoice_no": df[invoice_col].to_numpy(),
+        "date": df[date_col].to_numpy(),
+        "taxable": df["taxable_value"].fillna(0).to_numpy(dtype=float),
+        "tax": df[list(TAX_COLUMNS)].fillna(0).sum(axis=1).to_numpy(dtype=float),
+    })
+    out["_gstin"] = normalize_gstin(out["gstin"])
+    out["_inv"] = normalize_invoice_no(out["invoice_no"])
+    # Duplicate keys pair up one-to-one in order instead of multiplying
+    out["_occ"] = out.groupby(["_gstin", "_inv"]).cumcount()
+    out["_day"] = pd.to_datetime(out["date"], errors="coerce")
+    return out
+
+
+def _pairs(merged):
+    """Shape a books⋈2B merge into the result columns."""
+    return pd.DataFrame({
+        "expense_id": merged["row_id_b"].to_numpy(),
+        "gstr2b_id": merged["row_id_p"].to_numpy(),
+        "supplier_gstin": merged["gstin_p"].to_numpy(),
+        "supplier": merged["name_p"].to_numpy(),
+        "invoice_no_books": merged["invoice_no_b"].to_numpy(),
+        "invoice_no_2b": merged["invoice_no_p"].to_numpy(),
+        "date_books": merged["date_b"].to_numpy(),
+        "date_2b": merged["date_p"].to_numpy(),
+        "tax_books": merged["tax_b"].to_numpy(),
+        "tax_2b": merged["tax_p"].to_numpy(),
+        "taxable_diff": (merged["taxable_b"] - merged["taxable_p"]).round(2).to_numpy(),
+        "tax_diff": (merged["tax_b"] - merged["tax_p"]).round(2).to_numpy(),
+    })
+
+
+def reconcile(books, portal, tolerance=AMOUNT_TOLERANCE, date_window=DATE_WINDOW):
+    """
+    Match expense rows (`books`) against 2B lines (`portal`).
+    Returns {"matched", "mismatched", "missing_in_2b", "missing_in_books", "summary"}.
+    """
+    b = _prepare(books, "gstin", "vendor_name", "invoice_no", "date").add_suffix("_b")
+    p = _prepare(portal, "supplier_gstin", "supplier_name", "invoice_no", "invoice_date").add_suffix("_p")
+
+    # Pass 1: hash join on (GSTIN, invoice number, occurrence)
+    keyed_b = b[(b["_gstin_b"] != "") & (b["_inv_b"] != "")]
+    exact = keyed_b.merge(p, left_on=["_gstin_b", "_inv_b", "_occ_b"], right_on=["_gstin_p", "_inv_p", "_occ_p"])
+    exact = _pairs(exact)
+    within = (exact["taxable_diff"].abs() <= tolerance) & (exact["tax_diff"].abs() <= tolerance)
+    exact["match_type"] = "GSTIN + invoice no."
+    matched, mismatched = exact[within], exact[~within]
+
+    # Pass 2: leftovers from the same supplier with the same tax, a few days apart
+    left_b = b[~b["row_id_b"].isin(exact["expense_id"]) & (b["_gstin_b"] != "")]
+    left_p = p[~p["row_id_p"].isin(exact["gstr2b_id"])]
+    # Block on tax buckets one tolerance wide: amounts within tolerance are at most one bucket
+    # apart, so each books row is offered to its own and both neighbouring buckets only
+    width = max(tolerance, 0.01)
+    left_p = left_p.assign(_bucket=(left_p["tax_p"] // width).astype("int64"))
+    bucket_b = (left_b["tax_b"] // width).astype("int64")
+    near_b = pd.concat([left_b.assign(_bucket=bucket_b + shift) for shift in (-1, 0, 1)], ignore_index=True)
+    fuzzy = near_b.merge(left_p, left_on=["_gstin_b", "_bucket"], right_on=["_gstin_p", "_bucket"])
+    if not fuzzy.empty:
+        day_gap = (fuzzy["_day_b"] - fuzzy["_day_p"]).dt.days.abs()
+        tax_gap = (fuzzy["tax_b"] - fuzzy["tax_p"]).abs()
+        fuzzy = fuzzy[(tax_gap <= tolerance) & (day_gap <= date_window)]
+        # Closest candidates first (ties by row ids, so the pairing never depends on merge order);
+        # each row on either side is used once
+        fuzzy = fuzzy.assign(_gap=(tax_gap + day_gap * 0.01).loc[fuzzy.index])
+        fuzzy = fuzzy.sort_values(["_gap", "row_id_b", "row_id_p"], kind="stable")
+        fuzzy = fuzzy.drop_duplicates("row_id_b").drop_duplicates("row_id_p")
+    fuzzy = _pairs(fuzzy)
+    fuzzy["match_type"] = "GSTIN + amount + date"
+    matched = pd.concat([matched, fuzzy], ignore_index=True)
+
+    paired_b = set(exact["expense_id"]) | set(fuzzy["expense_id"])
+    paired_p = set(exact["gstr2b_id"]) | set(fuzzy["gstr2b_id"])
+    result_cols = ["row_id", "gstin", "name", "invoice_no", "date", "taxable", "tax"]
+    missing_in_2b = b[~b["row_id_b"].isin(paired_b)][[c + "_b" for c in result_cols]]
+    missing_in_2b.columns = ["expense_id", "gstin", "vendor", "invoice_no", "date", "taxable_value", "tax"]
+    missing_in_books = p[~p["row_id_p"].isin(paired_p)][[c + "_p" for c in result_cols]]
+    missing_in_books.columns = ["gstr2b_id", "gstin", "supplier", "invoice_no", "date", "taxable_value", "tax"]
+
+    result = {
+        "matched": matched.reset_index(drop=True),
+        "mismatched": mismatched.reset_index(drop=True),
+        "missing_in_2b": missing_in_2b.reset_index(drop=True),
+        "missing_in_books": missing_in_books.reset_index(drop=True),
+    }
+    result["summary"] = {
+        "itc_books": float(b["tax_b"].sum()),
+        "itc_2b": float(p["tax_p"].sum()),
+        "itc_matched": float(matched["tax_books"].sum()),
+        # Claimed in books but not (or not fully) reported by the supplier
+        "itc_at_risk": float(missing_in_2b["tax"].sum() + mismatched["tax_diff"].clip(lower=0).sum()),
+        **{bucket: len(result[bucket]) for bucket in BUCKETS},
+    }
+    return result
+
+
+def reconcile_period(return_period, tolerance=AMOUNT_TOLERANCE, date_window=DATE_WINDOW):
+    """Reconcile a stored 2B period ('YYYY-MM') against that month's expenses."""
+    year, month = map(int, return_period.split("-"))
+    start = f"{year:04d}-{month:02d}-01"
+    end = f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+    return reconcile(db.get_expenses_between(start, end), db.get_gstr2b_lines(return_period),
+                     tolerance, date_window)
@@ -0,0 +1,195 @@
+"""
+Offline retrieval over invoices, expenses and notifications.
+
+A small in-process BM25 index answers free-text lookups such as "that
+notice about ITC mismatch" or "the courier vendor from March" without any
+network dependency. The index is built once per process and then brought
+up to date incrementally: on each search it only reads rows whose id is
+above the last indexed id, and it rebuilds from scratch only when rows
+have been deleted or their searched columns edited in place (detected
+through the ledger's edit count and per-table row counts). Labels, which
+show amounts that change with payments, are read fresh for the results.
+"""
+
+import calendar
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+import database as db
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "from", "by", "with", "about",
+    "that", "this", "these", "those", "is", "was", "are", "were", "be", "my", "our", "me", "i", "we",
+    "it", "its", "show", "find", "search", "look", "up", "which", "where", "what", "who", "when",
+    "did", "do", "does", "any", "some", "all", "please", "get", "give", "list",
+}
+MONTH_NAMES = {i: (calendar.month_name[i].lower(), calendar.month_abbr[i].lower()) for i in range(1, 13)}
+
+# Words that mark a question as "find me a record" rather than an aggregate. Generic question
+# words ("which", "that", "where") are left out: "which customer paid the most" is an aggregate
+LOOKUP_CUES = re.compile(r"\b(notice|notices|notification|find|search|show me|look up|lookup|record|entry)\b")
+
+# kind -> (table, text columns, label builder)
+SOURCES = {
+    "invoice": ("invoices", ["invoice_no", "customer_name", "gstin", "status"],
+                lambda r: f"Invoice {r['invoice_no']} · {r['customer_name']} · ₹{r['total_amount'] or 0:,.2f}"),
+    "expense": ("expenses", ["vendor_name", "gstin", "category", "description"],
+                lambda r: f"Expense · {r['vendor_name']} · {r['category']} · ₹{r['total_amount'] or 0:,.2f}"),
+    "notification": ("notifications", ["type", "description", "action_required", "status"],
+                     lambda r: f"{r['type']} · {r['description']}"),
+}
+
+# Role words indexed with every record of a kind ("the courier vendor", "that notice")
+KIND_TERMS = {
+    "invoice": ["invoice", "customer", "sale"],
+    "expense": ["expense", "vendor", "supplier", "purchase"],
+    "notification": ["notice", "notification"],
+}
+
+K1 = 1.5
+B = 0.75
+
+
+def _stem(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in re.findall(r"[a-z0-9]+", str(text).lower()) if t not in STOPWORDS]
+
+
+def _date_tokens(date):
+    """'2026-03-14' → ['2026', 'march', 'mar'] so month and year words match."""
+    m = re.match(r"(\d{4})-(\d{2})", str(date or ""))
+    if not m:
+        return []
+    month = int(m.group(2))
+    if not 1 <= month <= 12:
+        return [m.group(1)]
+    return [m.group(1), *MONTH_NAMES[month]]
+
+
+class RetrievalIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)  # term -> {doc_key: term frequency}
+        self.doc_len = {}
+        self.docs = {}  # doc_key -> {"kind", "id", "date", "entity_id"}
+        self.total_len = 0
+        self.high_water = {kind: 0 for kind in SOURCES}
+        self.row_counts = {kind: 0 for kind in SOURCES}
+        self.generation = None
+        self.edits = None
+
+    def _add(self, kind, row, columns):
+        key = (kind, row["id"])
+        tokens = list(KIND_TERMS[kind])
+        for col in columns:
+            tokens.extend(tokenize(row[col]))
+        tokens.extend(_date_tokens(row["date"]))
+        for term, tf in Counter(tokens).items():
+            self.postings[term][key] = tf
+        self.doc_len[key] = len(tokens)
+        self.total_len += len(tokens)
+        self.docs[key] = {"kind": kind, "id": row["id"], "date": row["date"], "entity_id": row["entity_id"]}
+
+    def _table_state(self, conn, table):
+        return conn.execute(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {table}").fetchone()
+
+    def refresh(self):
+        """Index rows added since the last refresh; rebuild if rows were edited or deleted."""
+        generation = db.get_write_generation()
+        with self._lock:
+            if generation == self.generation:
+                return
+            edits = db.get_edit_count()
+            conn = db.get_connection()
+            try:
+                states = {kind: self._table_state(conn, table) for kind, (table, _, _) in SOURCES.items()}
+                # Every row past the high-water mark is new and nothing below it went away
+                appended_only = all(
+                    count - self.row_counts[kind] == max_id - self.high_water[kind]
+                    for kind, (count, max_id) in states.items()
+                )
+                if edits != self.edits or not appended_only:
+                    self._reset()
+                conn.row_factory = _dict_row
+                for kind, (table, columns, _) in SOURCES.items():
+                    rows = conn.execute(f"SELECT * FROM {table} WHERE id > ? ORDER BY id",
+                                        (self.high_water[kind],)).fetchall()
+                    for row in rows:
+                        self._add(kind, row, columns)
+                    self.high_water[kind] = states[kind][1]
+                    self.row_counts[kind] = states[kind][0]
+                self.generation = generation
+                self.edits = edits
+            finally:
+                conn.close()
+
+    def search(self, query, k=5, kinds=None):
+        """Top-k BM25 matches of the current entity as dicts with kind, id, date, label and score."""
+        self.refresh()
+        entity_id = db.current_entity()
+        terms = tokenize(query)
+        if not terms or not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_len = self.total_len / n_docs
+        scores = defaultdict(float)
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key, tf in posting.items():
+                if (kinds and key[0] not in kinds) or self.docs[key]["entity_id"] != entity_id:
+                    continue
+                norm = tf + K1 * (1 - B + B * self.doc_len[key] / avg_len)
+                scores[key] += idf * tf * (K1 + 1) / norm
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        labels = self._labels([key for key, _ in best])
+        return [dict(self.docs[key], label=labels[key], score=round(score, 3)) for key, score in best if key in labels]
+
+    @staticmethod
+    def _labels(keys):
+        """Current labels of the given doc keys; rows deleted since the last refresh are left out."""
+        conn = db.get_connection()
+        conn.row_factory = _dict_row
+        labels = {}
+        try:
+            for kind, (table, _, label) in SOURCES.items():
+                ids = [id for k, id in keys if k == kind]
+                if ids:
+                    rows = conn.execute(f"SELECT * FROM {table} WHERE id IN ({','.join('?' * len(ids))})", ids)
+                    labels.update(((kind, row["id"]), label(row)) for row in rows)
+        finally:
+            conn.close()
+        return labels
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def looks_like_lookup(query):
+    """True for questions that ask for specific records rather than totals."""
+    return bool(LOOKUP_CUES.search(query.lower()))
+
+
+# One index per database file: entities moved to their own shard reuse row ids
+_INDEXES = {}
+
+
+def search(query, k=5, kinds=None):
+    path = db.db_path()
+    index = _INDEXES.get(path) or _INDEXES.setdefault(path, RetrievalIndex())
+    return index.search(query, k=k, kinds=kinds)
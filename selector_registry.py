@@ -0,0 +1,177 @@
+"""
+Learned selector resolution for GST portal actions.
+
+Each logical action (e.g. "prepare_online", "otp_input") has a ranked list of
+candidate locators. The registry remembers which candidate worked on which
+portal page and tries it first on later runs; candidates that miss are
+demoted. The ranking is persisted to a small JSON file so it survives
+restarts.
+
+Instead of walking fallbacks one full timeout at a time, `resolve` gives the
+learned winner a short probe and then waits for *any* candidate at once with
+Playwright's `locator.or_()`, so a stale first choice costs seconds, not the
+sum of every fallback's timeout.
+"""
+
+import json
+import os
+import time
+from urllib.parse import urlparse
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REGISTRY_PATH = os.path.join(PROJECT_DIR, ".selector_registry.json")
+
+# Candidate locators per action, best guess first: ("text", visible text) or ("css", selector)
+ACTIONS = {
+    "search": [("text", "SEARCH"), ("css", "button[type='submit']")],
+    "prepare_online": [("text", "PREPARE ONLINE"), ("text", "Prepare Online")],
+    "b2b_section": [("text", "B2B Invoices"), ("text", "4A, 4B, 4C, 6B, 6C - B2B")],
+    "b2c_section": [("text", "B2C"), ("text", "7 - B2C Others")],
+    "add_details": [("text", "ADD DETAILS"), ("text", "Add Details")],
+    "save": [("text", "SAVE"), ("text", "Save"), ("css", "button[type='submit']")],
+    "preview": [("text", "PREVIEW"), ("text", "Preview")],
+    "submit": [("text", "SUBMIT"), ("text", "Submit")],
+    "file_with_evc": [("text", "FILE WITH EVC"), ("text", "File with EVC")],
+    "verify": [("text", "VERIFY"), ("text", "Verify")],
+    "confirm": [("text", "CONFIRM"), ("text", "Confirm")],
+    "otp_input": [("css", "input[type='text'][placeholder*='OTP']"), ("css", "input[id*='otp']")],
+    "b2b_gstin": [("css", "input[placeholder*='GSTIN']"), ("css", "input[id*='ctin']")],
+    "b2b_invoice_no": [("css", "input[placeholder*='Invoice']"), ("css", "input[id*='inum']")],
+    "b2b_value": [("css", "input[placeholder*='Value']"), ("css", "input[id*='val']")],
+    "b2c_taxable": [("css", "input[placeholder*='Taxable']"), ("css", "input[id*='txval']")],
+}
+
+
+def page_key(url):
+    """Portal page a selector was learned on (host + path, no query)."""
+    parsed = urlparse(url or "")
+    return f"{parsed.hostname or ''}{parsed.path.rstrip('/')}"
+
+
+def candidate_id(candidate):
+    kind, value = candidate
+    return f"{kind}:{value}"
+
+
+class SelectorRegistry:
+    def __init__(self, path=DEFAULT_REGISTRY_PATH, actions=None, save_interval=5.0):
+        # path=None keeps the ranking in memory only
+        self.path = path
+        self.actions = actions or ACTIONS
+        self.save_interval = save_interval
+        self._dirty = False
+        self._last_save = 0.0
+        # {page_key: {action: {candidate_id: {"wins": n, "fails": n, "last_win": ts}}}}
+        self.scores = self._load()
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        self._dirty = False
+        self._last_save = time.time()
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.scores, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def _touch(self):
+        """Mark the ranking changed; write it out at most every `save_interval` seconds."""
+        self._dirty = True
+        if time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    def _entry(self, page, action, candidate):
+        stats = self.scores.setdefault(page, {}).setdefault(action, {})
+        return stats.setdefault(candidate_id(candidate), {"wins": 0, "fails": 0, "last_win": 0})
+
+    def ranked(self, action, page):
+        """Candidates for `action`, best first for this page; ties keep the default order."""
+        defaults = self.actions[action]
+        stats = self.scores.get(page, {}).get(action, {})
+
+        def score(item):
+            position, candidate = item
+            s = stats.get(candidate_id(candidate))
+            if not s:
+                return (0, 0, -position)
+            return (s["wins"] - 2 * s["fails"], s["last_win"], -position)
+
+        return [c for _, c in sorted(enumerate(defaults), key=score, reverse=True)]
+
+    def learned_winner(self, action, page):
+        stats = self.scores.get(page, {}).get(action, {})
+        best = self.ranked(action, page)[0]
+        s = stats.get(candidate_id(best))
+        return best if s and s["wins"] > s["fails"] else None
+
+    def record_success(self, action, page, candidate):
+        entry = self._entry(page, action, candidate)
+        entry["wins"] += 1
+        entry["last_win"] = time.time()
+        self._touch()
+
+    def record_failure(self, action, page, candidate):
+        self._entry(page, action, candidate)["fails"] += 1
+        self._touch()
+
+    # ── Resolution against a live page ──────────────────────────────
+
+    @staticmethod
+    def locator(page, candidate):
+        kind, value = candidate
+        if kind == "text":
+            return page.get_by_text(value, exact=False).first
+        return page.locator(value).first
+
+    def resolve(self, page, action, timeout=10000, probe_timeout=2000):
+        """Return (candidate, locator) for the first candidate visible on `page`, or (None, None)."""
+        key = page_key(page.url)
+        ranked = self.ranked(action, key)
+
+        # 1. The learned winner gets a short probe of its own
+        winner = self.learned_winner(action, key)
+        if winner:
+            loc = self.locator(page, winner)
+            try:
+                loc.wait_for(timeout=probe_timeout)
+                self.record_success(action, key, winner)
+                return winner, loc
+            except Exception:
+                self.record_failure(action, key, winner)
+                timeout = max(timeout - probe_timeout, probe_timeout)
+
+        # 2. Race every candidate in a single wait
+        locators = [self.locator(page, c) for c in ranked]
+        combined = locators[0]
+        for loc in locators[1:]:
+            combined = combined.or_(loc)
+        try:
+            combined.first.wait_for(timeout=timeout)
+        except Exception:
+            for c in ranked:
+                self.record_failure(action, key, c)
+            return None, None
+
+        # 3. Attribute the hit to the highest-ranked candidate that is actually there
+        for candidate, loc in zip(ranked, locators):
+            try:
+                if loc.is_visible():
+                    self.record_success(action, key, candidate)
+                    return candidate, loc
+            except Exception:
+                continue
+            self.record_failure(action, key, candidate)
+        return None, None
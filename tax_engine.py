@@ -0,0 +1,186 @@
+"""
+GST computation and ledger validation.
+
+One place for the IGST/CGST/SGST/cess split, used by the invoice and
+expense forms and by the ledger checks. `compute_taxes` works on whole
+columns at once (NumPy), `compute_tax` is the single-row wrapper, and
+`validate_ledger` scans a ledger DataFrame in one vectorized pass and
+returns the rows whose stored taxes or totals disagree with their rate
+and place of supply.
+
+Each tax head is rounded to the paisa half-up on its own, the way it is
+printed on an invoice, so intra-state CGST and SGST are always equal.
+"""
+
+import numpy as np
+import pandas as pd
+
+import database as db
+import gstin
+
+GST_RATES = (0, 0.25, 3, 5, 12, 18, 28)
+TAX_HEADS = ("igst", "cgst", "sgst", "cess")
+TOLERANCE = 0.01  # ₹, difference allowed between stored and expected amounts
+
+
+def round_paise(values):
+    """Round half-up to 2 decimals (np.round would round half to even)."""
+    values = np.asarray(values, dtype=float)
+    # The epsilon absorbs binary noise such as 2.675 being stored as 2.67499...
+    return np.sign(values) * np.floor(np.abs(values) * 100 + 0.5 + 1e-7) / 100
+
+
+def compute_taxes(taxable_value, gst_rate, inter_state, cess_rate=0.0):
+    """
+    Vectorized split for equal-length arrays (or scalars, broadcast).
+    Returns a dict of arrays: igst, cgst, sgst, cess, total_tax, total_amount.
+    """
+    taxable = np.asarray(taxable_value, dtype=float)
+    rate = np.asarray(gst_rate, dtype=float)
+    inter = np.asarray(inter_state, dtype=bool)
+    half = round_paise(taxable * rate / 200)
+    igst = np.where(inter, round_paise(taxable * rate / 100), 0.0)
+    cgst = np.where(inter, 0.0, half)
+    sgst = cgst
+    cess = round_paise(taxable * np.asarray(cess_rate, dtype=float) / 100)
+    total_tax = igst + cgst + sgst + cess
+    return {
+        "igst": igst,
+        "cgst": cgst,
+        "sgst": sgst,
+        "cess": cess,
+        "total_tax": total_tax,
+        "total_amount": round_paise(taxable + total_tax),
+    }
+
+
+def compute_tax(taxable_value, gst_rate, inter_state, cess_rate=0.0):
+    """Single-row version of `compute_taxes`, returning plain floats."""
+    result = compute_taxes(taxable_value, gst_rate, inter_state, cess_rate)
+    return {key: float(value) for key, value in result.items()}
+
+
+def item_taxes(items, inter_state):
+    """
+    Line items (DataFrame with quantity, rate, gst_rate) with taxable_value,
+    igst, cgst, sgst and total_amount filled in, each item rounded on its own.
+    """
+    items = items.copy()
+    items["taxable_value"] = round_paise(items["quantity"].fillna(0).to_numpy(dtype=float) *
+                                         items["rate"].fillna(0).to_numpy(dtype=float))
+    taxes = compute_taxes(items["taxable_value"].to_numpy(), items["gst_rate"].fillna(0).to_numpy(dtype=float),
+                          inter_state)
+    for column in ("igst", "cgst", "sgst", "total_amount"):
+        items[column] = taxes[column]
+    return items
+
+
+def tax_frame(df, inter_state=None, cess_rate=0.0):
+    """
+    Expected taxes for every row of a ledger DataFrame (`taxable_value`, `gst_rate`).
+    `inter_state` defaults to `infer_inter_state(df)`.
+    """
+    if inter_state is None:
+        inter_state = infer_inter_state(df)
+    result = compute_taxes(df["taxable_value"].fillna(0).to_numpy(), df["gst_rate"].fillna(0).to_numpy(),
+                           inter_state, cess_rate)
+    return pd.DataFrame(result, index=df.index)
+
+
+def infer_inter_state(df, home_state=None):
+    """
+    Place of supply per row: the counterparty GSTIN's state against our own
+    (`home_state`, default from the business GSTIN) when both are known,
+    otherwise whatever the stored split says (any IGST means inter-state).
+    """
+    stored = df["igst"].fillna(0).to_numpy() > 0
+    if "gstin" not in df:
+        return stored
+    inter, known = gstin.inter_state_many(df["gstin"], home_state)
+    return np.where(known, inter, stored)
+
+
+def validate_ledger(df, home_state=None, tolerance=TOLERANCE):
+    """
+    One pass over a ledger DataFrame (invoices or expenses).
+    Returns a DataFrame with id, date, issue, stored and expected — one row per problem.
+    """
+    columns = ["id", "date", "issue", "stored", "expected"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    stored = {head: df[head].fillna(0).to_numpy(dtype=float) for head in ("igst", "cgst", "sgst")}
+    stored["cess"] = df["cess"].fillna(0).to_numpy(dtype=float) if "cess" in df else np.zeros(len(df))
+    gst = stored["igst"] + stored["cgst"] + stored["sgst"]
+    stored_tax = gst + stored["cess"]
+    stored_total = df["total_amount"].fillna(0).to_numpy(dtype=float)
+    taxable = df["taxable_value"].fillna(0).to_numpy(dtype=float)
+    rate = df["gst_rate"].to_numpy(dtype=float)
+    # Mixed-rate itemized invoices carry no header rate; their items hold the rates
+    has_rate = ~np.isnan(rate)
+    rate = np.nan_to_num(rate)
+    # Itemized invoices round each item separately, so allow a paisa per item
+    items = df["item_count"].fillna(0).to_numpy(dtype=float) if "item_count" in df else np.zeros(len(df))
+    rate_tolerance = tolerance * np.maximum(items, 1)
+
+    inter = infer_inter_state(df, home_state)
+    expected = compute_taxes(taxable, rate, inter)
+    split_inter = stored["igst"] > 0
+    if "gstin" in df:
+        entered = df["gstin"].fillna("").astype(str).str.strip().to_numpy() != ""
+        bad_gstin = entered & ~gstin.validate_many(df["gstin"])["valid"].to_numpy(dtype=bool)
+    else:
+        bad_gstin = np.zeros(len(df), dtype=bool)
+
+    checks = [
+        (bad_gstin, "Invalid GSTIN", np.full(len(df), np.nan), np.full(len(df), np.nan)),
+        (has_rate & ~np.isin(rate, GST_RATES), "Unknown GST rate", rate, np.full(len(df), np.nan)),
+        (split_inter & ((stored["cgst"] > 0) | (stored["sgst"] > 0)), "Both IGST and CGST/SGST charged",
+         stored_tax, expected["total_tax"]),
+        (np.abs(stored["cgst"] - stored["sgst"]) > tolerance, "CGST and SGST differ",
+         stored["cgst"], stored["sgst"]),
+        (split_inter != inter, "Tax split doesn't match place of supply",
+         stored["igst"], expected["igst"]),
+        (has_rate & (np.abs(gst - expected["total_tax"]) > rate_tolerance), "Tax doesn't match rate × taxable value",
+         gst, expected["total_tax"]),
+        (np.abs(stored_total - (taxable + stored_tax)) > tolerance, "Total ≠ taxable value + taxes",
+         stored_total, round_paise(taxable + stored_tax)),
+    ]
+
+    ids = df["id"].to_numpy() if "id" in df else df.index.to_numpy()
+    dates = df["date"].to_numpy() if "date" in df else np.full(len(df), None)
+    frames = [
+        pd.DataFrame({"id": ids[mask], "date": dates[mask], "issue": issue,
+                      "stored": stored_values[mask], "expected": expected_values[mask]})
+        for mask, issue, stored_values, expected_values in checks if mask.any()
+    ]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True).sort_values(["date", "id"], ignore_index=True)
+
+
+def set_off(output_tax, input_tax):
+    """
+    Cash payable per head after using ITC (Rule 88A): IGST credit against IGST;
+    CGST and SGST credit against their own heads; leftover IGST credit against the
+    CGST/SGST still due; then CGST and SGST credit against IGST. CGST and SGST never
+    offset each other. Returns {"igst", "cgst", "sgst"} amounts still payable in cash.
+    """
+    due = {head: float(output_tax.get(head, 0) or 0) for head in ("igst", "cgst", "sgst")}
+    credit = {head: float(input_tax.get(head, 0) or 0) for head in ("igst", "cgst", "sgst")}
+    # Own heads first, so IGST credit only covers the CGST/SGST that their own credit cannot
+    for source, target in (("igst", "igst"), ("cgst", "cgst"), ("sgst", "sgst"),
+                           ("igst", "cgst"), ("igst", "sgst"), ("cgst", "igst"), ("sgst", "igst")):
+        used = min(credit[source], due[target])
+        credit[source] -= used
+        due[target] -= used
+    return {head: float(round_paise(amount)) for head, amount in due.items()}
+
+
+def validate_all(home_state=None):
+    """{"invoices": issues, "expenses": issues} for the full ledger."""
+    return {
+        "invoices": validate_ledger(db.get_invoices(), home_state),
+        "expenses": validate_ledger(db.get_expenses(), home_state),
+    }
+
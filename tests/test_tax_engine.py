@@ -0,0 +1,16 @@
+import tax_engine
+
+
+def test_set_off_spends_leftover_igst_credit_on_remaining_sgst():
+    payable = tax_engine.set_off({"igst": 0, "cgst": 100, "sgst": 100}, {"igst": 100, "cgst": 100, "sgst": 0})
+    assert payable == {"igst": 0.0, "cgst": 0.0, "sgst": 0.0}
+
+
+def test_set_off_never_offsets_cgst_and_sgst():
+    payable = tax_engine.set_off({"igst": 0, "cgst": 0, "sgst": 50}, {"igst": 0, "cgst": 80, "sgst": 0})
+    assert payable == {"igst": 0.0, "cgst": 0.0, "sgst": 50.0}
+
+
+def test_set_off_uses_cgst_and_sgst_credit_against_igst():
+    payable = tax_engine.set_off({"igst": 100, "cgst": 0, "sgst": 0}, {"igst": 20, "cgst": 30, "sgst": 30})
+    assert payable == {"igst": 20.0, "cgst": 0.0, "sgst": 0.0}